@@ -0,0 +1,115 @@
+# adaptive.py
+# Адаптивное расписание проверок: у каждой ссылки свой интервал и своё время следующей проверки.
+# - цена недавно менялась — интервал сокращается (до REFRESH_MIN_INTERVAL);
+# - цена долго стоит на месте — интервал растёт (до REFRESH_MAX_INTERVAL);
+# - очередь «кто следующий» — двоичная куча по времени next_check_at.
+import heapq
+import random
+import threading
+from datetime import datetime, timedelta
+
+# во сколько раз меняем интервал при изменении цены / при стабильной цене
+SHRINK_FACTOR = 0.5
+GROW_FACTOR = 1.5
+
+
+def compute_interval(recent_prices, current_interval, min_interval, max_interval):
+    """
+    Новый интервал проверки (в секундах) по последним ценам ссылки.
+    recent_prices — цены из PriceHistory, от новых к старым (включая только что полученную).
+    - последняя проверка показала новую цену — делим интервал пополам;
+    - за всё окно цена ни разу не менялась — увеличиваем в GROW_FACTOR раз;
+    - иначе (менялась, но не сейчас) — оставляем как есть.
+    """
+    prices = [p for p in recent_prices if p is not None]
+    interval = current_interval or min_interval
+
+    if len(prices) >= 2 and prices[0] != prices[1]:
+        interval = interval * SHRINK_FACTOR
+    elif len(prices) >= 2 and all(p == prices[0] for p in prices):
+        interval = interval * GROW_FACTOR
+
+    return int(min(max_interval, max(min_interval, interval)))
+
+
+def jittered(now, seconds, spread=0.1):
+    """now + seconds ± spread, чтобы ссылки с одинаковым интервалом не сбивались в одну волну"""
+    return now + timedelta(seconds=seconds * random.uniform(1 - spread, 1 + spread))
+
+
+class DueQueue:
+    """
+    Приоритетная очередь ссылок по времени следующей проверки.
+    Повторный push той же ссылки просто переносит её срок: старая запись
+    в куче остаётся и пропускается при извлечении (ленивое удаление).
+    Потокобезопасна.
+    """
+
+    def __init__(self):
+        self._heap = []  # [(due, link_id)]
+        self._due = {}   # link_id -> актуальный due
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._due)
+
+    def push(self, link_id, due):
+        with self._lock:
+            self._due[link_id] = due
+            heapq.heappush(self._heap, (due, link_id))
+
+    def discard(self, link_id):
+        with self._lock:
+            self._due.pop(link_id, None)
+
+    def pop_due(self, now=None, limit=None):
+        """Извлекаем до limit ссылок, у которых срок наступил (самые просроченные первыми)"""
+        now = now or datetime.utcnow()
+        out = []
+        with self._lock:
+            while self._heap and (limit is None or len(out) < limit):
+                due, link_id = self._heap[0]
+                if due > now:
+                    break
+                heapq.heappop(self._heap)
+                if self._due.get(link_id) != due:
+                    continue  # устаревшая запись
+                del self._due[link_id]
+                out.append(link_id)
+        return out
+
+    def next_due(self):
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def sync(self, rows, base_interval, skip=()):
+        """
+        Сверяем очередь с базой: rows — (link_id, next_check_at, last_checked, check_interval).
+        Новые ссылки добавляются, удалённые — выбрасываются.
+        Ссылке без next_check_at срок назначается случайно в пределах её интервала
+        от последней проверки — чтобы после обновления не проверять всё разом.
+        skip — ссылки, которые сейчас в работе (их срок придёт с результатом).
+        """
+        now = datetime.utcnow()
+        seen = set()
+        for link_id, next_check_at, last_checked, interval in rows:
+            seen.add(link_id)
+            if link_id in skip:
+                continue
+            with self._lock:
+                if link_id in self._due:
+                    continue
+            if next_check_at is None:
+                if last_checked is None:
+                    next_check_at = now
+                else:
+                    span = interval or base_interval
+                    next_check_at = max(now, last_checked) + timedelta(seconds=random.uniform(0, span))
+            self.push(link_id, next_check_at)
+
+        with self._lock:
+            for link_id in list(self._due):
+                if link_id not in seen:
+                    del self._due[link_id]
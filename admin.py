@@ -1,6 +1,6 @@
 # admin.py
 # Простая админ-панель для управления тарифами (CRUD в минимальном виде).
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from models import db, Plan
 from flask_login import login_required, current_user
 
@@ -44,3 +44,69 @@ def plans():
 
     plans = Plan.query.all()
     return render_template("admin_plans.html", plans=plans)
+
+@admin_bp.route("/http-stats")
+@admin_required
+def http_stats():
+    # статистика пула соединений скрейпера: переиспользование и сэкономленные рукопожатия
+    from http_pool import get_pool
+    return jsonify(get_pool().stats())
+
+@admin_bp.route("/alerts")
+@admin_required
+def alerts_stats():
+    # правила в памяти процесса и счётчики отправки уведомлений
+    from alerts import get_alert_index, get_dispatcher
+    dispatcher = get_dispatcher()
+    return jsonify({"index": get_alert_index().stats(), "sent": dispatcher.sent, "failed": dispatcher.failed})
+
+@admin_bp.route("/ratelimits")
+@admin_required
+def ratelimits():
+    # текущие токены, паузы и счётчики отказов по доменам
+    from ratelimit import get_limiter
+    return jsonify(get_limiter().snapshot())
+
+@admin_bp.route("/extraction-rules")
+@admin_required
+def extraction_rules():
+    # выученные правила извлечения цены по доменам и доля попаданий
+    from rules import get_rule_cache
+    return jsonify(get_rule_cache().stats())
+
+@admin_bp.route("/page-cache")
+@admin_required
+def page_cache_stats():
+    # кэш фрагментов страниц: записи, вытеснения, попадания и промахи
+    from cache import get_page_cache
+    return jsonify(get_page_cache().stats())
+
+@admin_bp.route("/browser")
+@admin_required
+def browser_stats():
+    # пул headless-браузеров: открытые экземпляры, отрисованные страницы, сбои
+    from flask import current_app
+    from browser import get_browser_pool
+    pool = get_browser_pool(current_app.config)
+    return jsonify(pool.stats() if pool is not None else {"enabled": False})
+
+@admin_bp.route("/tracked-pages")
+@admin_required
+def tracked_pages_stats():
+    # дедупликация загрузок: сколько ссылок приходится на страницу и самые «популярные» страницы
+    from sqlalchemy import func, select
+    from models import ProductLink, TrackedPage
+    from metrics import SWEEP_DEDUP_RATIO, SWEEP_LINKS, SWEEP_PAGES
+    links = db.session.scalar(select(func.count(ProductLink.id)))
+    pages = db.session.scalar(select(func.count(TrackedPage.id)))
+    subscribers = func.count(ProductLink.id).label("links")
+    top = db.session.execute(
+        select(TrackedPage.url, subscribers).join(ProductLink, ProductLink.page_id == TrackedPage.id)
+        .group_by(TrackedPage.id, TrackedPage.url).having(subscribers > 1)
+        .order_by(subscribers.desc()).limit(20)
+    ).all()
+    sweeps = {kind: {"links": SWEEP_LINKS.value(kind=kind), "pages": SWEEP_PAGES.value(kind=kind),
+                     "last_dedup_ratio": SWEEP_DEDUP_RATIO.value(kind=kind)}
+              for kind in ("full", "dispatch", "worker")}
+    return jsonify({"links": links, "pages": pages, "dedup_ratio": round(links / pages, 2) if pages else None,
+                    "shared": [{"url": r.url, "links": r.links} for r in top], "sweeps": sweeps})
@@ -0,0 +1,393 @@
+# alerts.py
+# Уведомления о снижении цены.
+# - AlertIndex — правила в памяти по link_id: новая цена проверяется только против
+#   правил своей ссылки, без запроса к базе на каждую запись;
+# - проверка идёт в пути записи (persistence.PriceWriter) — только для ссылок,
+#   у которых цена действительно изменилась;
+# - AlertDispatcher — фоновый поток: копит уведомления и отправляет их пачками,
+#   одно письмо или один webhook-запрос на получателя за пачку;
+# - webhook-адреса проверяются (check_webhook_url): запрос из нашей сети не должен
+#   уходить на loopback, внутренние адреса и сервис метаданных облака.
+import logging
+import atexit
+import ipaddress
+import queue
+import smtplib
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from email.message import EmailMessage
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy import func, select, union_all
+
+from config import Config
+from models import db, AlertRule, User, Product, ProductLink, PriceHistory, PriceBucket
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("target", "drop_pct", "low")
+
+# правило, развёрнутое на конкретную ссылку
+IndexedRule = namedtuple("IndexedRule", "rule_id kind threshold email webhook_url product_id product_name")
+
+# сработавшее правило
+Alert = namedtuple("Alert", "rule_id link_id url product_id product_name kind threshold old_price new_price email webhook_url at")
+
+
+def rule_fires(kind, threshold, old_price, new_price, link_min=None):
+    """
+    Срабатывает ли правило на переход цены old_price -> new_price.
+    - target: цена впервые опустилась до порога (раньше была выше или неизвестна);
+    - drop_pct: падение за одну проверку не меньше threshold процентов;
+    - low: ниже минимума за всю историю ссылки (link_min; без истории не срабатывает).
+    """
+    if new_price is None:
+        return False
+    if kind == "target":
+        return threshold is not None and new_price <= threshold and (old_price is None or old_price > threshold)
+    if kind == "drop_pct":
+        return (threshold is not None and old_price is not None and old_price > 0
+                and new_price <= old_price * (1 - threshold / 100.0))
+    if kind == "low":
+        return link_min is not None and new_price < link_min
+    return False
+
+
+class AlertIndex:
+    """
+    Активные правила в памяти: {link_id: [IndexedRule]} и исторический минимум
+    цены для ссылок с правилами «low». Перечитывается из базы раз в ttl секунд
+    (правила могут меняться в другом процессе) или сразу после invalidate().
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._rules = {}
+        self._link_min = {}
+        self._urls = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def refresh(self):
+        """
+        Перечитываем индекс, если он устарел. PriceWriter зовёт это до записи истории пачки:
+        иначе минимум ссылки, перечитанный в той же транзакции, уже включал бы новую цену
+        и правило «low» на новом минимуме не сработало бы.
+        """
+        if self._stale():
+            self.load()
+
+    def load(self):
+        """Читаем активные правила (нужен app context): один-два запроса на весь индекс"""
+        rows = db.session.execute(
+            select(AlertRule.id, AlertRule.kind, AlertRule.threshold, AlertRule.webhook_url,
+                   AlertRule.link_id, ProductLink.id.label("target_link"), ProductLink.url,
+                   Product.id.label("product_id"), Product.name, User.email)
+            .join(Product, Product.id == AlertRule.product_id)
+            .join(User, User.id == AlertRule.user_id)
+            .join(ProductLink, ProductLink.product_id == Product.id)
+            .where(AlertRule.active.is_(True))
+            .where((AlertRule.link_id.is_(None)) | (AlertRule.link_id == ProductLink.id))
+        ).all()
+
+        rules, urls, low_links = {}, {}, set()
+        for r in rows:
+            rules.setdefault(r.target_link, []).append(
+                IndexedRule(r.id, r.kind, r.threshold, r.email, r.webhook_url, r.product_id, r.name))
+            urls[r.target_link] = r.url
+            if r.kind == "low":
+                low_links.add(r.target_link)
+
+        link_min = {}
+        if low_links:
+            history = PriceHistory.__table__
+            buckets = PriceBucket.__table__
+            points = union_all(
+                select(history.c.link_id, history.c.price.label("price")).where(history.c.link_id.in_(low_links)),
+                select(buckets.c.link_id, buckets.c.min_price.label("price")).where(buckets.c.link_id.in_(low_links)),
+            ).subquery()
+            link_min = dict(db.session.execute(
+                select(points.c.link_id, func.min(points.c.price)).group_by(points.c.link_id)
+            ).all())
+
+        with self._lock:
+            self._rules, self._urls, self._link_min = rules, urls, link_min
+            self._loaded_at = time.monotonic()
+
+    def evaluate(self, changes, now=None):
+        """
+        changes — [(link_id, old_price, new_price)] для ссылок с изменившейся ценой.
+        Возвращаем [Alert]; сам индекс не меняется (см. observe).
+        """
+        self.refresh()
+        now = now or datetime.utcnow()
+        fired = []
+        with self._lock:
+            for link_id, old_price, new_price in changes:
+                for rule in self._rules.get(link_id, ()):
+                    if rule_fires(rule.kind, rule.threshold, old_price, new_price, self._link_min.get(link_id)):
+                        fired.append(Alert(rule.rule_id, link_id, self._urls.get(link_id), rule.product_id,
+                                           rule.product_name, rule.kind, rule.threshold, old_price, new_price,
+                                           rule.email, rule.webhook_url, now))
+        return fired
+
+    def observe(self, changes):
+        """Цены записаны в базу: обновляем исторические минимумы ссылок с правилами «low»"""
+        with self._lock:
+            for link_id, _, new_price in changes:
+                if new_price is None or link_id not in self._rules:
+                    continue
+                current = self._link_min.get(link_id)
+                if current is None or new_price < current:
+                    self._link_min[link_id] = new_price
+
+    def stats(self):
+        with self._lock:
+            return {"links": len(self._rules), "rules": sum(len(v) for v in self._rules.values())}
+
+
+def describe(alert):
+    """Текст уведомления для человека"""
+    if alert.kind == "target":
+        reason = f"цена достигла цели {alert.threshold:g}"
+    elif alert.kind == "drop_pct":
+        reason = f"цена упала более чем на {alert.threshold:g}%"
+    else:
+        reason = "самая низкая цена за всю историю"
+    old = f"{alert.old_price:g}" if alert.old_price is not None else "—"
+    return f"{alert.product_name}: {old} → {alert.new_price:g} ({reason})\n{alert.url}"
+
+
+class EmailSink:
+    """Отправка писем через SMTP: одно письмо на получателя со всеми его уведомлениями"""
+
+    def __init__(self, host, port=25, user="", password="", use_tls=False, sender="pricewatcher@localhost", timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, recipient, alerts):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = recipient
+        msg["Subject"] = (f"PriceWatcher: {alerts[0].product_name} — цена снизилась" if len(alerts) == 1
+                          else f"PriceWatcher: цены снизились ({len(alerts)})")
+        msg.set_content("\n\n".join(describe(a) for a in alerts))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(msg)
+
+
+def _public_address(addr):
+    ip = ipaddress.ip_address(addr.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def resolve_webhook(url, allow_private=False):
+    """
+    Резолвим хост webhook-адреса: (адрес для подключения, None) или (None, причина отказа).
+    Все адреса хоста должны быть публичными (не loopback, не частные и не link-local сети);
+    allow_private=True — внутренние адреса тоже допустимы.
+    """
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return None, "некорректный адрес"
+    if parts.scheme not in ("http", "https") or not host:
+        return None, "нужен http(s)-адрес"
+    try:
+        infos = socket.getaddrinfo(host, port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        return None, "хост не найден"
+    if not allow_private and not all(_public_address(info[4][0]) for info in infos):
+        return None, "внутренний адрес"
+    return infos[0][4][0], None
+
+
+def check_webhook_url(url, allow_private=False):
+    """Можно ли слать webhook на url: None — можно, иначе строка с причиной (см. resolve_webhook)"""
+    return resolve_webhook(url, allow_private)[1]
+
+
+def pinned_request(url, address):
+    """
+    URL с проверенным IP вместо имени хоста, заголовок Host и расширения httpx (SNI):
+    соединение идёт ровно на этот адрес, без повторного резолва DNS, а сертификат
+    по-прежнему проверяется по имени хоста.
+    """
+    parts = urlsplit(url)
+    ip = f"[{address}]" if ":" in address else address
+    port = f":{parts.port}" if parts.port else ""
+    userinfo = parts.netloc.rpartition("@")[0]
+    netloc = (userinfo + "@" if userinfo else "") + ip + port
+    host = parts.hostname if ":" not in parts.hostname else f"[{parts.hostname}]"
+    extensions = {"sni_hostname": parts.hostname} if parts.scheme == "https" else {}
+    return urlunsplit(parts._replace(netloc=netloc)), {"Host": host + port}, extensions
+
+
+class WebhookSink:
+    """
+    POST JSON {"alerts": [...]} на URL получателя.
+    Адрес проверяется перед каждой отправкой (DNS мог измениться после сохранения правила),
+    и запрос идёт на проверенный IP (pinned_request) — повторный резолв не подменит его
+    внутренним адресом. Редиректы не выполняются — иначе публичный адрес мог бы увести
+    запрос во внутреннюю сеть.
+    """
+
+    def __init__(self, timeout=10, allow_private=False):
+        self.timeout = timeout
+        self.allow_private = allow_private
+
+    def send(self, url, alerts):
+        payload = {"alerts": [{
+            "rule_id": a.rule_id, "link_id": a.link_id, "url": a.url,
+            "product_id": a.product_id, "product": a.product_name,
+            "kind": a.kind, "threshold": a.threshold,
+            "old_price": a.old_price, "new_price": a.new_price,
+            "at": a.at.isoformat(),
+        } for a in alerts]}
+        address, problem = resolve_webhook(url, self.allow_private)
+        if problem:
+            raise ValueError(f"webhook отклонён: {problem}")
+        import httpx  # только при отправке: веб-процессу клиент не нужен
+
+        target, headers, extensions = pinned_request(url, address)
+        with httpx.Client(timeout=self.timeout, follow_redirects=False) as client:
+            request = client.build_request("POST", target, json=payload, headers=headers, extensions=extensions)
+            client.send(request).raise_for_status()
+
+
+class AlertDispatcher:
+    """
+    Асинхронная отправка уведомлений пачками.
+    submit() только кладёт уведомления в очередь — запись цен их не ждёт.
+    Фоновый поток копит до batch_size уведомлений или flush_seconds секунд,
+    группирует по получателю и отправляет по одному сообщению на получателя.
+    Сбой отправки одному получателю не мешает остальным.
+    """
+
+    def __init__(self, email_sink=None, webhook_sink=None, batch_size=50, flush_seconds=5.0):
+        self.email_sink = email_sink
+        self.webhook_sink = webhook_sink
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = flush_seconds
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, alerts):
+        if not alerts:
+            return
+        for alert in alerts:
+            self._queue.put(alert)
+        self._ensure_thread()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            # пачка: первое уведомление + всё, что придёт за flush_seconds (при остановке — без ожидания)
+            deadline = time.monotonic() + (0 if self._stop.is_set() else self.flush_seconds)
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch):
+        groups = {}
+        for alert in batch:
+            if alert.webhook_url:
+                groups.setdefault(("webhook", alert.webhook_url), []).append(alert)
+            else:
+                groups.setdefault(("email", alert.email), []).append(alert)
+
+        for (channel, target), alerts in groups.items():
+            sink = self.webhook_sink if channel == "webhook" else self.email_sink
+            if sink is None:
+                logger.info("(%s не настроен) %s: %s", channel, target, "; ".join(describe(a).split("\n")[0] for a in alerts))
+                continue
+            try:
+                sink.send(target, alerts)
+                self.sent += len(alerts)
+                logger.info("отправлено %d уведомл. (%s) → %s", len(alerts), channel, target)
+            except Exception as e:
+                self.failed += len(alerts)
+                logger.exception("не удалось отправить (%s) → %s: %s", channel, target, e)
+
+    def close(self, timeout=10):
+        """Досылаем очередь и останавливаем поток (вызывается при выходе процесса)"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+
+_index = None
+_dispatcher = None
+_alerts_lock = threading.Lock()
+
+
+def get_alert_index():
+    """Индекс правил процесса (загружается при первой проверке)"""
+    global _index
+    with _alerts_lock:
+        if _index is None:
+            _index = AlertIndex(ttl=Config.ALERT_INDEX_TTL)
+        return _index
+
+
+def get_dispatcher():
+    """Диспетчер уведомлений процесса; поток стартует с первым уведомлением"""
+    global _dispatcher
+    with _alerts_lock:
+        if _dispatcher is None:
+            email_sink = None
+            if Config.ALERT_SMTP_HOST:
+                email_sink = EmailSink(Config.ALERT_SMTP_HOST, Config.ALERT_SMTP_PORT, Config.ALERT_SMTP_USER,
+                                       Config.ALERT_SMTP_PASSWORD, Config.ALERT_SMTP_TLS, Config.ALERT_MAIL_FROM)
+            _dispatcher = AlertDispatcher(
+                email_sink=email_sink,
+                webhook_sink=WebhookSink(timeout=Config.ALERT_WEBHOOK_TIMEOUT,
+                                         allow_private=Config.ALERT_WEBHOOK_ALLOW_PRIVATE),
+                batch_size=Config.ALERT_BATCH_SIZE,
+                flush_seconds=Config.ALERT_FLUSH_SECONDS,
+            )
+            atexit.register(_dispatcher.close)
+        return _dispatcher
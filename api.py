@@ -0,0 +1,76 @@
+# api.py
+# Чтение истории цен для графиков и аналитики: колонки время/цена (см. series.py)
+# в JSON или бинарном виде, gzip по Accept-Encoding, плюс сводки по ссылкам.
+#
+#   GET /api/links/<id>/history?days=30&format=json|bin&dtype=float64|float32&summary=1&windows=7,30,90
+#   GET /api/products/<id>/history?...    — все ссылки продукта
+#   GET /api/products/<id>/summary?windows=7,30,90   — окна «минимум за N дней» по всей истории
+from flask import Blueprint, Response, abort, jsonify, request
+from flask_login import login_required, current_user
+
+from models import Product, ProductLink
+from series import DTYPES, load_series, summarize, encode_json, encode_binary, compress, since_days
+
+api_bp = Blueprint("api", __name__, url_prefix="/api")
+
+
+def _check_owner(product):
+    if product.user_id != current_user.id and not current_user.is_admin:
+        abort(403)
+
+
+def _windows():
+    try:
+        return tuple(int(d) for d in request.args.get("windows", "7,30,90").split(",") if d)
+    except ValueError:
+        abort(400)
+
+
+def _history_response(link_ids):
+    fmt = request.args.get("format", "json")
+    dtype = request.args.get("dtype", "float64")
+    if fmt not in ("json", "bin") or dtype not in DTYPES:
+        abort(400)
+    series = load_series(link_ids, since=since_days(request.args.get("days", 0, type=int)), dtype=dtype)
+
+    if fmt == "bin":
+        body, mimetype = encode_binary(series, dtype), "application/octet-stream"
+    else:
+        summaries = None
+        if request.args.get("summary"):
+            windows = _windows()
+            summaries = [summarize(s, windows) for s in series.values()]
+        body, mimetype = encode_json(series, summaries), "application/json"
+
+    resp = Response(body, mimetype=mimetype)
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp.set_data(compress(body))
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+
+@api_bp.route("/links/<int:link_id>/history")
+@login_required
+def link_history(link_id):
+    link = ProductLink.query.get_or_404(link_id)
+    _check_owner(link.product)
+    return _history_response([link.id])
+
+
+@api_bp.route("/products/<int:product_id>/history")
+@login_required
+def product_history(product_id):
+    product = Product.query.get_or_404(product_id)
+    _check_owner(product)
+    return _history_response([ln.id for ln in product.links])
+
+
+@api_bp.route("/products/<int:product_id>/summary")
+@login_required
+def product_summary(product_id):
+    product = Product.query.get_or_404(product_id)
+    _check_owner(product)
+    windows = _windows()
+    series = load_series([ln.id for ln in product.links])
+    return jsonify({"product_id": product.id, "links": [summarize(s, windows) for s in series.values()]})
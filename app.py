@@ -1,20 +1,40 @@
 # app.py
 # Основной файл — создаёт Flask приложение, регистрирует blueprints, запускает планировщик.
+import hmac
+import logging
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import click
+from flask import Flask, Response, abort, make_response, render_template, request, redirect, url_for, flash, jsonify
+from markupsafe import Markup
 from config import Config
-from models import db, User, Product, ProductLink, PriceHistory, Plan
+from models import db, Product, ProductLink, AlertRule, attach_pages, init_db
 from auth import auth_bp, login_manager
 from admin import admin_bp
+from api import api_bp
 from flask_login import login_required, current_user
-from scraper import fetch_price
-from scheduler import start_scheduler
-import stripe
+from tasks import submit_links, batch_status
+from queries import product_cards, latest_history
+from alerts import KINDS as ALERT_KINDS, check_webhook_url, get_alert_index
+from cache import get_page_cache, dashboard_key, product_key
+from logs import setup_logging
+import metrics
 from datetime import datetime
 
+logger = logging.getLogger("app")
+
+
+def conditional_page(html):
+    """HTML-ответ с ETag: повторный запрос с If-None-Match получает 304 без тела"""
+    resp = make_response(html)
+    resp.add_etag()
+    # браузер хранит страницу, но каждый раз сверяет ETag с сервером
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
 def create_app():
     app = Flask(__name__, static_folder="static", template_folder="templates")
     app.config.from_object(Config)
+    setup_logging(app.config["LOG_LEVEL"], app.config["LOG_RATE_BURST"], app.config["LOG_RATE_WINDOW"])
 
     # инициализируем расширения
     db.init_app(app)
@@ -23,31 +43,42 @@ def create_app():
     # регистрируем blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
 
-    # инициализация базы при первом старте
-    with app.app_context():
-        db.create_all()
-        # создать базовый бесплатный план если отсутствует
-        free = Plan.query.filter_by(price_cents=0).first()
-        if not free:
-            free = Plan(name="Free", price_cents=0, max_products=1, max_links_per_product=5)
-            db.session.add(free)
-            db.session.commit()
+    # схема базы и бесплатный тариф готовятся один раз командой `flask --app app init-db`,
+    # а не при каждом старте процесса
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Создать таблицы, досоздать колонки и индексы, завести бесплатный тариф"""
+        init_db()
+        click.echo("база готова")
 
+    with app.app_context():
         # === ЗДЕСЬ запускаем планировщик внутри app context ===
-        # Это гарантирует, что планировщик стартует вне зависимости от способа запуска приложения
-        try:
-            start_scheduler(app, interval_seconds=int(os.environ.get("PRICE_UPDATE_INTERVAL", 600)))
-        except Exception as _e:
-            # Не фатал — но логируем для диагностики
-            print(f"[app] не удалось запустить планировщик: {_e}")
+        # Это гарантирует, что планировщик стартует вне зависимости от способа запуска приложения.
+        # SCHEDULER_MODE=queue — веб только ставит задания, проверяют отдельные воркеры (worker.py);
+        # SCHEDULER_MODE=off — планировщика в веб-процессе нет вовсе (очередь наполняет worker.py --enqueue)
+        mode = app.config["SCHEDULER_MODE"]
+        if mode != "off":
+            try:
+                # планировщик (APScheduler) грузим только если он нужен; движок скачивания
+                # и парсеры он подтянет сам при первом обходе
+                from scheduler import start_scheduler
+                start_scheduler(app, interval_seconds=int(os.environ.get("PRICE_UPDATE_INTERVAL", 600)), mode=mode)
+            except Exception as _e:
+                # Не фатал — но логируем для диагностики
+                logger.exception("не удалось запустить планировщик: %s", _e)
 
     # главная страница — дашборд пользователя
     @app.route("/")
     @login_required
     def index():
-        products = Product.query.filter_by(user_id=current_user.id).all()
-        return render_template("index.html", products=products)
+        # продукты вместе с минимальной ценой и числом ссылок — одним запросом;
+        # готовый фрагмент живёт в кэше до изменения цен
+        user_id = current_user.id
+        fragment = get_page_cache().get_or_render(
+            dashboard_key(user_id), lambda: render_template("_dashboard.html", cards=product_cards(user_id)))
+        return conditional_page(render_template("index.html", fragment=Markup(fragment)))
 
     # добавить продукт (до N ссылок)
     @app.route("/add_product", methods=["GET", "POST"])
@@ -64,23 +95,21 @@ def create_app():
                 flash("Превышено максимальное количество ссылок для продукта по вашему плану.", "danger")
                 return redirect(url_for("add_product"))
 
-            product = Product(name=name, user_id=current_user.id, created_at=datetime.utcnow())
+            # продукт и ссылки сохраняем одной транзакцией, цены проверяются в фоне
+            product = Product(name=name, user_id=current_user.id, created_at=datetime.utcnow(),
+                              link_count=len(links))
             db.session.add(product)
-            db.session.commit()
-
             for url in links:
-                price, err = fetch_price(url)
-                link = ProductLink(product_id=product.id, url=url, last_price=price if price is not None else None, last_checked=datetime.utcnow())
-                db.session.add(link)
-                db.session.commit()
+                product.links.append(ProductLink(url=url))
+            # одинаковые страницы (с точностью до utm-меток) у разных пользователей скачиваются один раз
+            attach_pages(product.links)
+            db.session.commit()
+            get_page_cache().invalidate(user_ids=[current_user.id])
 
-                if price is not None:
-                    hist = PriceHistory(link=link, price=price)
-                    db.session.add(hist)
-                    db.session.commit()
+            job_id = submit_links(app, [ln.id for ln in product.links]) if product.links else None
 
             flash("Продукт добавлен. Система начнёт отслеживать цены (первые значения появятся после проверки).", "success")
-            return redirect(url_for("index"))
+            return redirect(url_for("product_detail", product_id=product.id, job=job_id))
         # GET
         return render_template("add_product.html", max_links=current_user.allowed_links_per_product())
 
@@ -92,7 +121,15 @@ def create_app():
         if prod.user_id != current_user.id and not current_user.is_admin:
             flash("Нет доступа к этому продукту.", "danger")
             return redirect(url_for("index"))
-        return render_template("product_detail.html", product=prod)
+        fragment = get_page_cache().get_or_render(product_key(prod.id), lambda: render_product(prod))
+        return conditional_page(render_template("product_detail.html", product=prod, fragment=Markup(fragment)))
+
+    def render_product(prod):
+        # ссылки — одним запросом, последние HISTORY_ON_PAGE записей истории по всем ссылкам — ещё одним
+        links = ProductLink.query.filter_by(product_id=prod.id).order_by(ProductLink.id).all()
+        history = latest_history([ln.id for ln in links], app.config.get("HISTORY_ON_PAGE", 10))
+        alerts = AlertRule.query.filter_by(product_id=prod.id).order_by(AlertRule.id).all()
+        return render_template("_product.html", product=prod, links=links, history=history, alerts=alerts)
 
     # ручное обновление цен для продукта (вызывается пользователем)
     @app.route("/product/<int:product_id>/update", methods=["POST"])
@@ -103,19 +140,81 @@ def create_app():
             flash("Нет доступа.", "danger")
             return redirect(url_for("index"))
 
-        for link in prod.links:
-            try:
-                price, err = fetch_price(link.url)
-                link.last_checked = datetime.utcnow()
-                if price is not None:
-                    link.last_price = price
-                    db.session.add(PriceHistory(link=link, price=price))
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                print(f"[product_update] Ошибка при обновлении {link.url}: {e}")
-
-        flash("Обновление завершено.", "success")
+        wants_json = request.accept_mimetypes.best == "application/json"
+        if not prod.links:
+            # проверять нечего: пачки не будет, и опрашивать её статус бессмысленно
+            if wants_json:
+                return jsonify({"job_id": None, "message": "У продукта нет ссылок для проверки."})
+            flash("У продукта нет ссылок для проверки.", "warning")
+            return redirect(url_for("product_detail", product_id=product_id))
+
+        # ссылки проверяются в фоне параллельно; страница опрашивает /jobs/<job_id>
+        job_id = submit_links(app, [ln.id for ln in prod.links])
+        if wants_json:
+            return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+
+        flash("Обновление запущено.", "info")
+        return redirect(url_for("product_detail", product_id=product_id, job=job_id))
+
+    # статус фоновой проверки (опрашивается из static/main.js)
+    @app.route("/jobs/<job_id>")
+    @login_required
+    def job_status(job_id):
+        status = batch_status(app.config, job_id)
+        if status is None:
+            return jsonify({"error": "not found"}), 404
+        product_ids = {item["product_id"] for item in status["links"] if item["product_id"] is not None}
+        if not current_user.is_admin and product_ids and Product.query.filter(
+                Product.id.in_(product_ids), Product.user_id != current_user.id).count():
+            return jsonify({"error": "forbidden"}), 403
+        return jsonify(status)
+
+    # уведомления о снижении цены: добавить / удалить правило
+    @app.route("/product/<int:product_id>/alerts", methods=["POST"])
+    @login_required
+    def alert_add(product_id):
+        prod = Product.query.get_or_404(product_id)
+        if prod.user_id != current_user.id and not current_user.is_admin:
+            flash("Нет доступа.", "danger")
+            return redirect(url_for("index"))
+
+        kind = request.form.get("kind")
+        threshold = request.form.get("threshold", type=float)
+        link_id = request.form.get("link_id", type=int)
+        webhook_url = (request.form.get("webhook_url") or "").strip() or None
+        webhook_problem = webhook_url and check_webhook_url(webhook_url, app.config["ALERT_WEBHOOK_ALLOW_PRIVATE"])
+        if kind not in ALERT_KINDS:
+            flash("Неизвестный тип уведомления.", "danger")
+        elif kind == "target" and (threshold is None or threshold <= 0):
+            flash("Укажите целевую цену.", "danger")
+        elif kind == "drop_pct" and (threshold is None or not 0 < threshold < 100):
+            flash("Укажите процент снижения от 0 до 100.", "danger")
+        elif link_id and link_id not in {ln.id for ln in prod.links}:
+            flash("Ссылка не относится к продукту.", "danger")
+        elif webhook_problem:
+            flash(f"Webhook не принят: {webhook_problem}.", "danger")
+        else:
+            db.session.add(AlertRule(user_id=prod.user_id, product_id=prod.id, link_id=link_id or None, kind=kind,
+                                     threshold=threshold if kind != "low" else None, webhook_url=webhook_url))
+            db.session.commit()
+            get_alert_index().invalidate()
+            get_page_cache().invalidate(product_ids=[prod.id])
+            flash("Уведомление добавлено.", "success")
+        return redirect(url_for("product_detail", product_id=product_id))
+
+    @app.route("/alerts/<int:alert_id>/delete", methods=["POST"])
+    @login_required
+    def alert_delete(alert_id):
+        rule = AlertRule.query.get_or_404(alert_id)
+        if rule.user_id != current_user.id and not current_user.is_admin:
+            flash("Нет доступа.", "danger")
+            return redirect(url_for("index"))
+        product_id = rule.product_id
+        db.session.delete(rule)
+        db.session.commit()
+        get_alert_index().invalidate()
+        get_page_cache().invalidate(product_ids=[product_id])
+        flash("Уведомление удалено.", "success")
         return redirect(url_for("product_detail", product_id=product_id))
 
     # редактирование/удаление продукта (упрощённый пример)
@@ -130,6 +229,7 @@ def create_app():
         if request.method == "POST":
             prod.name = request.form.get("name", prod.name)
             db.session.commit()
+            get_page_cache().invalidate(product_ids=[prod.id], user_ids=[prod.user_id])
             flash("Изменения сохранены.", "success")
             return redirect(url_for("product_detail", product_id=product_id))
         return render_template("edit_product.html", product=prod)
@@ -142,14 +242,28 @@ def create_app():
             flash("Нет доступа.", "danger")
             return redirect(url_for("index"))
         # удаление продукта и связанных ссылок/истории подразумевается через cascade в моделях
+        owner_id = prod.user_id
         db.session.delete(prod)
         db.session.commit()
+        get_page_cache().invalidate(product_ids=[product_id], user_ids=[owner_id])
         flash("Продукт удалён.", "success")
         return redirect(url_for("index"))
 
+    # метрики этого процесса в формате Prometheus; при заданном METRICS_TOKEN —
+    # только с заголовком Authorization: Bearer <token>
+    @app.route("/metrics")
+    def metrics_endpoint():
+        token = app.config["METRICS_TOKEN"]
+        if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(401)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route("/create-checkout-session", methods=["POST"])
     def create_checkout_session():
-        # Пример заглушки для Stripe Checkout (нужно настроить ключи и webhooks)
+        # Пример заглушки для Stripe Checkout (нужно настроить ключи и webhooks);
+        # SDK Stripe грузим только здесь — остальным запросам он не нужен
+        import stripe
+        stripe.api_key = app.config["STRIPE_SECRET_KEY"]
         try:
             # логика создания сессии Stripe...
             return redirect(url_for("index"))
@@ -0,0 +1,79 @@
+# benchmarks/bench_extract.py
+# Сравнение скорости извлечения цены: старый путь (BeautifulSoup + extract_price_from_html)
+# против многоуровневого scraper.extract_price.
+#
+#   python benchmarks/bench_extract.py                 # синтетический корпус
+#   python benchmarks/bench_extract.py saved_pages/    # свои сохранённые страницы (*.html)
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from scraper import extract_price, extract_price_from_html  # noqa: E402
+from benchmarks.pages import make_corpus  # noqa: E402
+
+
+def legacy(html):
+    return extract_price_from_html(BeautifulSoup(html, "html.parser"))
+
+
+def tiered(html):
+    return extract_price(html)[0]
+
+
+def load_corpus(path):
+    corpus = []
+    for name in sorted(glob.glob(os.path.join(path, "*.html"))):
+        with open(name, "rb") as f:
+            html = f.read().decode("utf-8", errors="replace")
+        corpus.append((os.path.basename(name), html, None))
+    return corpus
+
+
+def run(fn, corpus, repeat):
+    results = []
+    # логи экстрактора не должны влиять на замер
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = [fn(html) for _, html, _ in corpus]
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("corpus", nargs="?", help="каталог с сохранёнными *.html (по умолчанию — синтетика)")
+    ap.add_argument("--pages", type=int, default=50, help="размер синтетического корпуса")
+    ap.add_argument("--size-kb", type=int, default=100, help="размер синтетической страницы")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.pages, args.size_kb)
+    if not corpus:
+        sys.exit("пустой корпус")
+    total_mb = sum(len(html) for _, html, _ in corpus) * args.repeat / 1e6
+
+    old, t_old = run(legacy, corpus, args.repeat)
+    new, t_new = run(tiered, corpus, args.repeat)
+
+    pages = len(corpus) * args.repeat
+    print(f"страниц: {len(corpus)} x {args.repeat}, {total_mb:.1f} МБ HTML")
+    print(f"BeautifulSoup:  {pages / t_old:8.1f} стр/с  ({t_old:.2f} с)")
+    print(f"tiered:         {pages / t_new:8.1f} стр/с  ({t_new:.2f} с)  x{t_old / t_new:.1f}")
+
+    mismatches = [(name, a, b) for (name, _, _), a, b in zip(corpus, old, new) if a != b]
+    wrong = [(name, b, exp) for (name, _, exp), b in zip(corpus, new) if exp is not None and b != exp]
+    print(f"расхождений со старым путём: {len(mismatches)}, неверных цен: {len(wrong)}")
+    for name, a, b in mismatches[:10]:
+        print(f"  {name}: BeautifulSoup={a} tiered={b}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/bench_history.py
+# Время запросов к большой истории цен с индексами и без них:
+# «последние N записей» для страницы продукта и окна цен планировщика
+# (граница по индексу против старого row_number() по всей истории ссылок),
+# дашборд на денормализованных агрегатах против старого JOIN + GROUP BY.
+# Без индекса (link_id, checked_at) граница ищется полным сканом на каждую ссылку —
+# поэтому прогон без индексов делается --repeat-noindex раз.
+#
+#   python benchmarks/bench_history.py                       # 2000 ссылок x 1000 записей = 2 млн строк
+#   python benchmarks/bench_history.py --links 500 --per-link 200
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from models import db, User, Product, ProductLink, PriceHistory, refresh_product_aggregates  # noqa: E402
+from queries import product_cards, latest_history, recent_prices  # noqa: E402
+
+LINKS_PER_PRODUCT = 5
+BENCH_INDEXES = ("ix_price_history_link_checked", "ix_price_history_checked_at",
+                 "ix_product_links_product_id", "ix_products_user_id")
+
+
+def seed(links, per_link, users):
+    """Синтетические продукты (по LINKS_PER_PRODUCT ссылок) и per_link записей истории на ссылку"""
+    for u in range(users):
+        db.session.add(User(email=f"user{u}@test", password_hash="x"))
+    db.session.commit()
+
+    products = max(1, links // LINKS_PER_PRODUCT)
+    db.session.execute(Product.__table__.insert(), [
+        {"name": f"product {p}", "user_id": p % users + 1} for p in range(products)
+    ])
+    db.session.execute(ProductLink.__table__.insert(), [
+        {"product_id": i % products + 1, "url": f"http://shop{i % 50}.test/item/{i}", "last_price": 100.0 + i % 17}
+        for i in range(links)
+    ])
+    db.session.commit()
+
+    now = datetime.utcnow()
+    history = PriceHistory.__table__
+    rows = []
+    # вставляем вперемешку по времени, как пишет настоящий планировщик
+    for h in range(per_link):
+        checked_at = now - timedelta(minutes=10 * (per_link - h))
+        for link_id in range(1, links + 1):
+            rows.append({"link_id": link_id, "price": 100.0 + (link_id + h) % 13, "checked_at": checked_at})
+        if len(rows) >= 50_000:
+            db.session.execute(history.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(history.insert(), rows)
+    refresh_product_aggregates()
+    db.session.commit()
+
+
+def old_recent_window(link_ids, limit):
+    """Окно планировщика до ограничения чтения: row_number() по всей истории ссылок"""
+    rn = func.row_number().over(
+        partition_by=PriceHistory.link_id,
+        order_by=(PriceHistory.checked_at.desc(), PriceHistory.id.desc()),
+    ).label("rn")
+    sub = select(PriceHistory.link_id, PriceHistory.price, rn).where(PriceHistory.link_id.in_(link_ids)).subquery()
+    return db.session.execute(select(sub.c.link_id, sub.c.price).where(sub.c.rn <= limit)).all()
+
+
+def old_product_cards(user_id):
+    """Дашборд до денормализации: агрегаты по ссылкам на каждый запрос"""
+    return db.session.execute(
+        select(Product, func.min(ProductLink.last_price), func.count(ProductLink.id))
+        .outerjoin(ProductLink, ProductLink.product_id == Product.id)
+        .where(Product.user_id == user_id)
+        .group_by(Product.id)
+        .order_by(Product.id)
+    ).all()
+
+
+def timed(fn, repeat):
+    """Среднее время вызова, мс"""
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+        db.session.rollback()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run_suite(links, repeat):
+    page_links = list(range(1, LINKS_PER_PRODUCT + 1))
+    window_links = list(range(1, min(links, 200) + 1))
+    return {
+        "страница продукта (5 ссылок x 10)": timed(lambda: latest_history(page_links, 10), repeat),
+        "окно планировщика (200 ссылок x 10)": timed(lambda: recent_prices(window_links, 10), repeat),
+        "окно планировщика (row_number)": timed(lambda: old_recent_window(window_links, 10), repeat),
+        "дашборд (агрегаты в products)": timed(lambda: product_cards(1), repeat),
+        "дашборд (JOIN + GROUP BY)": timed(lambda: old_product_cards(1), repeat),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Индексы истории цен: время запросов")
+    ap.add_argument("--links", type=int, default=2000)
+    ap.add_argument("--per-link", type=int, default=1000)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--repeat-noindex", type=int, default=1)
+    args = ap.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "history.sqlite")
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.links, args.per_link, args.users)
+        total = args.links * args.per_link
+        print(f"история: {total} строк ({args.links} ссылок), заполнение {time.perf_counter() - started:.1f} с")
+
+        with_indexes = run_suite(args.links, args.repeat)
+        for index in PriceHistory.__table__.indexes | ProductLink.__table__.indexes | Product.__table__.indexes:
+            if index.name in BENCH_INDEXES:
+                index.drop(bind=db.engine)
+        without_indexes = run_suite(args.links, args.repeat_noindex)
+
+    print(f"{'запрос':<40}{'с индексами':>14}{'без индексов':>14}")
+    for name, ms in with_indexes.items():
+        print(f"{name:<40}{ms:>11.2f} мс{without_indexes[name]:>11.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# benchmarks/bench_import.py
+# Время импорта точек входа и что они тянут за собой — страховка от регрессий холодного старта
+# (gunicorn-воркеры, CLI, автоскейлинг воркеров). Каждая цель импортируется в свежем интерпретаторе
+# --repeat раз, печатается медиана; запрещённые модули (скрейпинг в вебе, Flask/Stripe в скрейпере)
+# — ошибка. Результат сохраняется в benchmarks/results/imports-*.json.
+#
+#   python benchmarks/bench_import.py
+#   python benchmarks/bench_import.py --baseline results/imports-A.json   # медленнее на 30% — FAIL
+#   python benchmarks/bench_import.py --importtime web                    # самые дорогие модули цели
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+
+# стек скачивания и разбора страниц — веб-процессу не нужен
+SCRAPING = ("engine", "scraper", "browser", "http_pool", "bs4", "parsel", "lxml", "selenium", "httpx")
+WEB = ("app", "auth", "admin", "api", "stripe")
+
+TARGETS = {
+    # веб без планировщика (SCHEDULER_MODE=off): gunicorn-воркер при SCHEDULER_MODE=queue/off
+    "web": {"code": "import app; app.create_app()", "env": {"SCHEDULER_MODE": "off"},
+            "forbidden": SCRAPING + ("stripe", "numpy", "apscheduler")},
+    # веб со встроенным планировщиком: APScheduler нужен, движок — только при первом обходе
+    "web-embedded": {"code": "import app; app.create_app(); import scheduler; scheduler.scheduler.shutdown(wait=False)",
+                     "env": {"SCHEDULER_MODE": "embedded"}, "forbidden": SCRAPING + ("stripe", "numpy")},
+    # воркер очереди: база и конфиг, без веба и Stripe
+    "worker": {"code": "import worker; worker.create_worker_app()", "env": {},
+               "forbidden": WEB + ("numpy",)},
+    # сам движок скачивания: без Flask и базы
+    "scraper": {"code": "import engine", "env": {},
+                "forbidden": WEB + ("flask", "flask_sqlalchemy", "flask_login", "sqlalchemy", "apscheduler")},
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{code}
+print(json.dumps({{"ms": (time.perf_counter() - started) * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _env(extra):
+    env = dict(os.environ)
+    env.update(extra)
+    env.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_import.sqlite"))
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def run_target(name, repeat):
+    target = TARGETS[name]
+    imports, totals, modules = [], [], set()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", PROBE.format(code=target["code"])], cwd=ROOT,
+                             env=_env(target["env"]), capture_output=True, text=True, check=True)
+        totals.append((time.perf_counter() - started) * 1000)
+        probe = json.loads(out.stdout.strip().splitlines()[-1])
+        imports.append(probe["ms"])
+        modules = set(probe["modules"])
+    loaded = sorted(m for m in target["forbidden"] if m in modules)
+    return {"import_ms": round(statistics.median(imports), 1), "process_ms": round(statistics.median(totals), 1),
+            "modules": len(modules), "forbidden_loaded": loaded}
+
+
+def importtime(name, top):
+    """Самые дорогие модули цели по -X importtime (суммарное время с зависимостями)"""
+    target = TARGETS[name]
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", target["code"]], cwd=ROOT,
+                         env=_env(target["env"]), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), int(self_us), module.strip()))
+    print(f"{name}: самые дорогие модули (с зависимостями)")
+    for cumulative, self_us, module in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} мс  (сам {self_us / 1000:6.1f} мс)  {module}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Время импорта точек входа")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--baseline", help="JSON прошлого прогона: медленнее на --tolerance — ошибка")
+    ap.add_argument("--tolerance", type=float, default=0.3)
+    ap.add_argument("--importtime", metavar="TARGET", choices=sorted(TARGETS))
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    if args.importtime:
+        importtime(args.importtime, args.top)
+        return
+
+    baseline = {}
+    if args.baseline:
+        path = args.baseline if os.path.exists(args.baseline) else os.path.join(ROOT, "benchmarks", args.baseline)
+        with open(path) as f:
+            baseline = json.load(f)["targets"]
+
+    failed = []
+    results = {}
+    for name in TARGETS:
+        r = results[name] = run_target(name, args.repeat)
+        line = f"{name:13} импорт {r['import_ms']:7.1f} мс, процесс {r['process_ms']:7.1f} мс, модулей {r['modules']}"
+        if name in baseline:
+            before = baseline[name]["import_ms"]
+            line += f" (было {before} мс, {(r['import_ms'] - before) / before:+.0%})"
+            if r["import_ms"] > before * (1 + args.tolerance):
+                failed.append(f"{name}: импорт медленнее базового на {(r['import_ms'] / before - 1):.0%}")
+        print(line)
+        if r["forbidden_loaded"]:
+            failed.append(f"{name}: загружены {', '.join(r['forbidden_loaded'])}")
+
+    os.makedirs(RESULTS, exist_ok=True)
+    path = os.path.join(RESULTS, time.strftime("imports-%Y%m%d-%H%M%S.json"))
+    with open(path, "w") as f:
+        json.dump({"python": sys.version.split()[0], "targets": results}, f, ensure_ascii=False, indent=2)
+    print(f"результат: {path}")
+
+    if failed:
+        sys.exit("FAIL: " + "; ".join(failed))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# benchmarks/bench_sweep.py
+# Пропускная способность скрейпера: настоящий полный обход планировщика (scheduler.update_all_prices)
+# по тысячам ссылок на локальный магазин (benchmarks/fakeshop.py) с заданной задержкой,
+# размером страниц и смесью вариантов разметки. На проход: ссылок в секунду, p50/p99 времени
+# ссылки (загрузка + разбор), CPU и пиковая память скрейпера, итоги проверок и точность цен.
+# Результат сохраняется в JSON (benchmarks/results/), два прогона сравниваются через --compare.
+#
+#   python benchmarks/bench_sweep.py                                   # 2000 ссылок, 2 прохода
+#   python benchmarks/bench_sweep.py --links 5000 --latency 0.2 --label slow-shops
+#   python benchmarks/bench_sweep.py --variants jsonld,text --size-kb 300 --parse-workers 4
+#   python benchmarks/bench_sweep.py --compare results/a.json results/b.json
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakeshop import FakeShop, price_for  # noqa: E402
+from benchmarks.pages import VARIANTS  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# метрики прохода для --compare: (ключ, подпись, больше — лучше)
+COMPARE = (
+    ("links_per_sec", "ссылок/с", True),
+    ("latency_p50_ms", "p50 ссылки, мс", False),
+    ("latency_p99_ms", "p99 ссылки, мс", False),
+    ("parse_p50_ms", "p50 разбора, мс", False),
+    ("cpu_seconds", "CPU, с", False),
+    ("cpu_ms_per_link", "CPU на ссылку, мс", False),
+    ("peak_rss_mb", "пик памяти, МБ", False),
+    ("wrong_prices", "неверных цен", False),
+)
+
+
+def percentile(values, q):
+    """q-квантиль (0..1) по ближайшему рангу; None для пустого списка"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q * (len(values) - 1))))]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _proc_stats(pid):
+    """(CPU user+sys в секундах, пик RSS в МБ) процесса по /proc — для процессов разбора (только Linux)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            hwm = next((int(line.split()[1]) for line in f if line.startswith("VmHWM:")), 0)
+        return cpu, hwm / 1024
+    except (OSError, ValueError, IndexError):
+        return 0.0, 0.0
+
+
+class SweepProbe:
+    """
+    Время каждой ссылки внутри настоящего обхода: оборачиваем загрузку и разбор
+    в движке (engine.download_page / engine.apply_parsed_price) без изменения их поведения.
+    """
+
+    def __init__(self, engine_module):
+        self.engine_module = engine_module
+        self.download = {}
+        self.parse = {}
+        self._urls = {}  # id(FetchResult) -> url: результат разбора приходит без URL
+        self._orig = (engine_module.download_page, engine_module.apply_parsed_price)
+
+    def install(self):
+        download_page, apply_parsed_price = self._orig
+
+        def timed_download(url, *args, **kwargs):
+            started = time.perf_counter()
+            result = download_page(url, *args, **kwargs)
+            self.download[url] = time.perf_counter() - started
+            self._urls[id(result)] = url
+            return result
+
+        def timed_apply(result, parsed):
+            url = self._urls.get(id(result))
+            if url is not None and len(parsed) > 3:
+                self.parse[url] = parsed[3]
+            return apply_parsed_price(result, parsed)
+
+        self.engine_module.download_page = timed_download
+        self.engine_module.apply_parsed_price = timed_apply
+
+    def reset(self):
+        self.download.clear()
+        self.parse.clear()
+        self._urls.clear()
+
+
+def cpu_now(engine):
+    """CPU скрейпера: сам процесс + процессы разбора (они живут между проходами, считаем по /proc)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu, children_peak = usage.ru_utime + usage.ru_stime, 0.0
+    pool = engine._parse_pool
+    for pid in list(getattr(pool, "_processes", None) or {}):
+        child_cpu, child_peak = _proc_stats(pid)
+        cpu += child_cpu
+        children_peak = max(children_peak, child_peak)
+    return cpu, usage.ru_maxrss / 1024, children_peak  # ru_maxrss в Linux — в КБ
+
+
+def seed_links(db, shop, links, variants, size_kb):
+    from models import User, Product, ProductLink, refresh_product_aggregates
+
+    user = User(email="bench@test")
+    user.set_password("x")
+    db.session.add(user)
+    db.session.commit()
+    products = max(1, links // 5)
+    db.session.execute(Product.__table__.insert(), [
+        {"name": f"product {p}", "user_id": user.id} for p in range(products)
+    ])
+    db.session.execute(ProductLink.__table__.insert(), [
+        {"product_id": i % products + 1, "url": shop.url(i, variants[i % len(variants)], size_kb)}
+        for i in range(links)
+    ])
+    refresh_product_aggregates()
+    db.session.commit()
+
+
+def run_sweep(app, shop, probe, engine, change_rate):
+    import scheduler
+    from metrics import FETCH_RESULTS
+    from models import ProductLink
+
+    statuses = ("ok", "not_modified", "unchanged", "error")
+    before = {s: FETCH_RESULTS.value(status=s) for s in statuses}
+    probe.reset()
+    cpu0, _, _ = cpu_now(engine)
+    started = time.perf_counter()
+    scheduler.update_all_prices()
+    elapsed = time.perf_counter() - started
+    cpu1, peak_rss, parse_peak = cpu_now(engine)
+
+    # точность: цена в базе против той, что отдавал магазин на этом проходе
+    wrong = 0
+    with app.app_context():
+        rows = ProductLink.query.with_entities(ProductLink.url, ProductLink.last_price).all()
+    for url, price in rows:
+        expected, _ = price_for(int(url.rsplit("/", 1)[1]), shop.round, change_rate)
+        if price is None or abs(price - expected) > 0.005:
+            wrong += 1
+
+    latency = [d + probe.parse.get(url, 0.0) for url, d in probe.download.items()]
+    parse = list(probe.parse.values())
+    links = len(rows)
+    return {
+        "round": shop.round,
+        "links": links,
+        "seconds": round(elapsed, 3),
+        "links_per_sec": round(links / elapsed, 1) if elapsed else None,
+        "latency_p50_ms": _ms(percentile(latency, 0.5)),
+        "latency_p99_ms": _ms(percentile(latency, 0.99)),
+        "download_p50_ms": _ms(percentile(list(probe.download.values()), 0.5)),
+        "download_p99_ms": _ms(percentile(list(probe.download.values()), 0.99)),
+        "parse_p50_ms": _ms(percentile(parse, 0.5)),
+        "parse_p99_ms": _ms(percentile(parse, 0.99)),
+        "parsed": len(parse),
+        "cpu_seconds": round(cpu1 - cpu0, 3),
+        "cpu_ms_per_link": round((cpu1 - cpu0) / links * 1000, 3) if links else None,
+        "peak_rss_mb": round(peak_rss, 1),
+        "parse_worker_peak_rss_mb": round(parse_peak, 1),
+        "results": {s: FETCH_RESULTS.value(status=s) - before[s] for s in statuses},
+        "wrong_prices": wrong,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_sweep(sweep):
+    r = sweep["results"]
+    print(f"проход {sweep['round']}: {sweep['links']} ссылок за {sweep['seconds']:.2f} с — "
+          f"{sweep['links_per_sec']} ссылок/с; p50 {sweep['latency_p50_ms']} мс, p99 {sweep['latency_p99_ms']} мс "
+          f"(разбор p50 {sweep['parse_p50_ms']} мс); CPU {sweep['cpu_seconds']} с "
+          f"({sweep['cpu_ms_per_link']} мс/ссылку); пик памяти {sweep['peak_rss_mb']} МБ"
+          + (f" + разбор {sweep['parse_worker_peak_rss_mb']} МБ" if sweep["parse_worker_peak_rss_mb"] else ""))
+    print(f"  итоги: ok {r['ok']}, 304 {r['not_modified']}, то же тело {r['unchanged']}, ошибок {r['error']}; "
+          f"неверных цен: {sweep['wrong_prices']}")
+
+
+def compare(path_a, path_b):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    print(f"A: {path_a} ({a['meta'].get('label') or '-'}, {a['meta'].get('git') or '?'})")
+    print(f"B: {path_b} ({b['meta'].get('label') or '-'}, {b['meta'].get('git') or '?'})")
+    for i, (sa, sb) in enumerate(zip(a["sweeps"], b["sweeps"]), 1):
+        print(f"\nпроход {i}")
+        print(f"  {'метрика':<22}{'A':>12}{'B':>12}{'изменение':>12}")
+        for key, title, higher_better in COMPARE:
+            va, vb = sa.get(key), sb.get(key)
+            delta = ""
+            if va and vb is not None:
+                pct = (vb - va) / va * 100
+                better = pct > 0 if higher_better else pct < 0
+                delta = f"{pct:+.1f}%{' ✓' if better and abs(pct) >= 1 else ''}"
+            print(f"  {title:<22}{str(va):>12}{str(vb):>12}{delta:>12}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк полного обхода на локальном магазине")
+    ap.add_argument("--links", type=int, default=2000)
+    ap.add_argument("--domains", type=int, default=20, help="разных магазинов (адресов 127.0.0.N), до 250")
+    ap.add_argument("--variants", default=",".join(VARIANTS), help="варианты разметки через запятую")
+    ap.add_argument("--size-kb", type=int, default=100, help="размер страницы товара")
+    ap.add_argument("--latency", type=float, default=0.05, help="задержка ответа магазина, с")
+    ap.add_argument("--jitter", type=float, default=0.5, help="разброс задержки, доля от latency")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    ap.add_argument("--change-rate", type=float, default=0.1, help="доля товаров, меняющих цену за проход")
+    ap.add_argument("--no-etag", action="store_true", help="магазин без ETag/304")
+    ap.add_argument("--sweeps", type=int, default=2, help="проходов (первый — холодный, дальше — с валидаторами)")
+    ap.add_argument("--concurrency", type=int, default=None, help="FETCH_CONCURRENCY (по умолчанию из Config)")
+    ap.add_argument("--per-host", type=int, default=None, help="FETCH_PER_HOST")
+    ap.add_argument("--parse-workers", type=int, default=None, help="PARSE_WORKERS")
+    ap.add_argument("--domain-rate", type=float, default=1000.0,
+                    help="DOMAIN_RATE: по умолчанию без ограничения — меряем скрейпер, а не вежливость")
+    ap.add_argument("--label", default="", help="метка прогона (в имени файла результата)")
+    ap.add_argument("--out", default=RESULTS_DIR, help="каталог для JSON с результатами")
+    ap.add_argument("--compare", nargs=2, metavar=("A", "B"), help="сравнить два сохранённых прогона")
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = set(variants) - set(VARIANTS)
+    if unknown or not variants:
+        ap.error(f"варианты: {', '.join(VARIANTS)}")
+
+    # настройки скрейпера — через env до импорта приложения (Config читает их при импорте)
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "sweep.sqlite")
+    os.environ["SCHEDULER_MODE"] = "off"
+    os.environ["ALERTS_ENABLED"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["DOMAIN_RATE"] = str(args.domain_rate)
+    os.environ["DOMAIN_BURST"] = str(max(2.0, args.domain_rate))
+    for name, value in (("FETCH_CONCURRENCY", args.concurrency), ("FETCH_PER_HOST", args.per_host),
+                        ("PARSE_WORKERS", args.parse_workers)):
+        if value is not None:
+            os.environ[name] = str(value)
+
+    import engine
+    import scheduler
+    from app import create_app
+    from models import db, init_db
+
+    shop = FakeShop(domains=args.domains, latency=args.latency, jitter=args.jitter,
+                    change_rate=args.change_rate, etag=not args.no_etag, error_rate=args.error_rate)
+    with shop:
+        app = create_app()
+        scheduler.scheduler.app = app
+        with app.app_context():
+            init_db()
+            seed_links(db, shop, args.links, variants, args.size_kb)
+        print(f"магазин: {args.domains} доменов, задержка {args.latency * 1000:.0f} мс ±{args.jitter:.0%}, "
+              f"страницы {args.size_kb} КБ ({', '.join(variants)}); ссылок: {args.links}; "
+              f"FETCH_CONCURRENCY={app.config['FETCH_CONCURRENCY']} FETCH_PER_HOST={app.config['FETCH_PER_HOST']} "
+              f"PARSE_WORKERS={app.config['PARSE_WORKERS']}")
+
+        eng = engine.get_engine(app.config)
+        probe = SweepProbe(engine)
+        probe.install()
+        sweeps = []
+        for n in range(1, args.sweeps + 1):
+            shop.round = n
+            sweeps.append(run_sweep(app, shop, probe, eng, args.change_rate))
+            print_sweep(sweeps[-1])
+
+    result = {
+        "meta": {
+            "label": args.label,
+            "git": git_revision(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+            "config": {k: app.config[k] for k in ("FETCH_CONCURRENCY", "FETCH_PER_HOST", "PARSE_WORKERS",
+                                                  "FETCH_TIMEOUT", "PERSIST_BATCH_SIZE")},
+        },
+        "sweeps": sweeps,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    name = datetime.utcnow().strftime("%Y%m%d-%H%M%S") + (f"-{args.label}" if args.label else "") + ".json"
+    path = os.path.join(args.out, name)
+    with open(path, "w") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"результат: {path}")
+
+
+if __name__ == "__main__":
+    main()
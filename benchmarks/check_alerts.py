@@ -0,0 +1,224 @@
+# benchmarks/check_alerts.py
+# Проверка уведомлений о снижении цены от записи до доставки:
+# правила трёх типов, цены пишутся через PriceWriter, уведомления уходят пачками
+# на локальные заглушки SMTP и webhook. Плюс время проверки цены по индексу правил
+# и отказ слать webhook на внутренние адреса (заглушка на loopback разрешена явно).
+#
+#   python benchmarks/check_alerts.py
+import email
+import email.policy
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "alerts.sqlite"))
+os.environ["SCHEDULER_MODE"] = "off"
+
+MAILS = []
+HOOKS = []
+HOOK_HOSTS = []
+
+
+class SMTPStub(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает письма и складывает их в MAILS"""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 stub")
+        rcpt = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            cmd = line[:4].upper()
+            if not line or cmd == "QUIT":
+                self.reply("221 bye")
+                return
+            if cmd == "EHLO" or cmd == "HELO":
+                self.reply("250 stub")
+            elif cmd == "RCPT":
+                rcpt.append(line.split(":", 1)[1].strip("<> "))
+                self.reply("250 ok")
+            elif cmd == "DATA":
+                self.reply("354 go")
+                body = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in (".\r\n", ".\n"):
+                        break
+                    body.append(data)
+                MAILS.append((rcpt, "".join(body)))
+                rcpt = []
+                self.reply("250 queued")
+            else:
+                self.reply("250 ok")
+
+
+class HookStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        HOOKS.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        HOOK_HOSTS.append(self.headers["Host"])
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+smtp_port = serve(socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPStub))
+hook_port = serve(HTTPServer(("127.0.0.1", 0), HookStub))
+os.environ["ALERT_SMTP_HOST"] = "127.0.0.1"
+os.environ["ALERT_SMTP_PORT"] = str(smtp_port)
+os.environ["ALERT_FLUSH_SECONDS"] = "0.5"
+os.environ["ALERT_WEBHOOK_ALLOW_PRIVATE"] = "1"
+
+from app import create_app  # noqa: E402
+from models import db, User, Product, ProductLink, AlertRule, init_db  # noqa: E402
+from persistence import PriceWriter  # noqa: E402
+from alerts import (AlertIndex, IndexedRule, WebhookSink, check_webhook_url, get_alert_index,  # noqa: E402
+                    get_dispatcher, pinned_request)
+
+
+def pinned(hook_port):
+    """Отправка идёт на проверенный IP, а Host остаётся именем из адреса"""
+    sent = len(HOOKS)
+    WebhookSink(timeout=2, allow_private=True).send(f"http://localhost:{hook_port}/hook", [])
+    target = pinned_request(f"http://localhost:{hook_port}/hook", "127.0.0.1")[0]
+    return len(HOOKS) == sent + 1 and HOOK_HOSTS[-1] == f"localhost:{hook_port}" and "//127.0.0.1:" in target
+
+
+def refused(sink, url):
+    sent = len(HOOKS)
+    try:
+        sink.send(url, [])
+    except ValueError:
+        return len(HOOKS) == sent
+    return False
+
+
+def write(prices, at):
+    """prices — {link_id: цена}"""
+    with PriceWriter() as writer:
+        for link_id, price in prices.items():
+            writer.add(link_id, price, at, history_price=price)
+
+
+def fired_now(link_id, price, at):
+    """Пишем одну цену и возвращаем сработавшие правила (без отправки)"""
+    writer = PriceWriter()
+    writer.add(link_id, price, at, history_price=price)
+    items, writer._pending = writer._pending, []
+    return writer._write(items)[1]
+
+
+def stale_index_low(product, user, at):
+    """Новый минимум после сброса индекса: минимум ссылки перечитывается без цены этой же пачки"""
+    link = ProductLink(url="http://shop.test/c", product_id=product.id)
+    db.session.add(link)
+    db.session.commit()
+    db.session.add(AlertRule(user_id=user.id, product_id=product.id, link_id=link.id, kind="low"))
+    db.session.commit()
+    get_alert_index().invalidate()
+    fired_now(link.id, 100.0, at)
+    fired_now(link.id, 120.0, at + timedelta(minutes=10))
+    get_alert_index().invalidate()  # правило добавили/удалили или истёк ALERT_INDEX_TTL
+    fired = fired_now(link.id, 90.0, at + timedelta(minutes=20))
+    return any(a.kind == "low" and a.link_id == link.id for a in fired)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not predicate():
+        time.sleep(0.05)
+    return predicate()
+
+
+def index_timing(links=20000, rules_per_link=5, changes=10000):
+    """Проверка цены стоит O(правил ссылки), а не O(всех правил)"""
+    index = AlertIndex(ttl=3600)
+    index._rules = {
+        link_id: [IndexedRule(link_id * 10 + r, "target", 50.0, "u@test", None, 1, "p") for r in range(rules_per_link)]
+        for link_id in range(links)
+    }
+    index._loaded_at = time.monotonic()
+    batch = [(i % links, 100.0, 99.0) for i in range(changes)]
+    started = time.perf_counter()
+    index.evaluate(batch)
+    elapsed = time.perf_counter() - started
+    print(f"индекс: {links * rules_per_link} правил, {changes} изменений цены — {elapsed * 1000:.1f} мс "
+          f"({elapsed / changes * 1e6:.1f} мкс на цену)")
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        init_db()
+        user = User(email="buyer@test")
+        user.set_password("x")
+        db.session.add(user)
+        db.session.commit()
+        product = Product(name="Чайник", user_id=user.id)
+        product.links.append(ProductLink(url="http://shop.test/a"))
+        product.links.append(ProductLink(url="http://shop.test/b"))
+        db.session.add(product)
+        db.session.commit()
+        a, b = (ln.id for ln in product.links)
+
+        db.session.add_all([
+            AlertRule(user_id=user.id, product_id=product.id, kind="target", threshold=90),
+            AlertRule(user_id=user.id, product_id=product.id, link_id=b, kind="drop_pct", threshold=20,
+                      webhook_url=f"http://127.0.0.1:{hook_port}/hook"),
+            AlertRule(user_id=user.id, product_id=product.id, link_id=a, kind="low"),
+        ])
+        db.session.commit()
+        get_alert_index().invalidate()
+
+        now = datetime.utcnow()
+        write({a: 100.0, b: 100.0}, now)                          # первые цены: ничего
+        write({a: 100.0, b: 100.0}, now + timedelta(minutes=10))  # без изменений: ничего
+        write({a: 95.0, b: 75.0}, now + timedelta(minutes=20))    # a: минимум; b: -25% (webhook) и цель 90
+        write({a: 89.0, b: 76.0}, now + timedelta(minutes=30))    # a: цель 90 и минимум
+
+        ok = wait_for(lambda: len(MAILS) >= 1 and len(HOOKS) >= 1 and get_dispatcher().sent >= 5)
+        get_dispatcher().close()
+
+        hooked = [alert for payload in HOOKS for alert in payload["alerts"]]
+        mailed = "".join(email.message_from_string(body, policy=email.policy.default).get_content() for _, body in MAILS)
+        print(f"писем: {len(MAILS)}, webhook-запросов: {len(HOOKS)}, отправлено уведомлений: {get_dispatcher().sent}")
+        expect = [
+            ("webhook drop_pct по ссылке b", any(h["kind"] == "drop_pct" and h["link_id"] == b for h in hooked)),
+            ("письмо: цель 90 по ссылке b", "→ 75" in mailed),
+            ("письмо: минимум по ссылке a", mailed.count("shop.test/a") >= 2),
+            ("уведомления ушли пачками", len(MAILS) <= 2),
+            ("last_triggered_at записан", AlertRule.query.filter(AlertRule.last_triggered_at.isnot(None)).count() == 3),
+            ("webhook на внутренние адреса отклоняется", all(check_webhook_url(u) for u in (
+                f"http://127.0.0.1:{hook_port}/hook", "http://localhost/", "http://169.254.169.254/latest/meta-data",
+                "http://10.1.2.3/", "http://[::1]/", "http://[::ffff:192.168.0.1]/", "file:///etc/passwd"))),
+            ("минимум срабатывает и при перечитанном индексе", stale_index_low(product, user, now + timedelta(hours=1))),
+            ("webhook подключается к проверенному IP с исходным Host", pinned(hook_port)),
+            ("отправка на loopback без разрешения не уходит", refused(WebhookSink(timeout=2), f"http://127.0.0.1:{hook_port}/hook")),
+        ]
+        for name, passed in expect:
+            print(f"  {'OK  ' if passed else 'FAIL'} {name}")
+        if not ok or not all(passed for _, passed in expect):
+            sys.exit("FAIL")
+
+    index_timing()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
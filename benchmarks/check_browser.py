@@ -0,0 +1,185 @@
+# benchmarks/check_browser.py
+# Проверка пула headless-браузеров на локальных страницах:
+# 1. логика движка с заглушкой браузера (работает везде): статические страницы в браузер
+#    не попадают, JS-страница дорисовывается, домен запоминается как JS-only,
+#    одновременно открыто не больше BROWSER_MAX_TABS вкладок, сбой браузера не теряет цену разбора;
+# 2. настоящий браузер (если установлен Chrome/Chromium или Firefox): цена, которую рисует
+#    скрипт, находится, а картинки и CSS не запрашиваются.
+#
+#   python benchmarks/check_browser.py
+#   BROWSER=firefox python benchmarks/check_browser.py
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DOMAIN_RATE", "1000")
+os.environ.setdefault("DOMAIN_BURST", "1000")
+
+import httpx  # noqa: E402
+
+from browser import BrowserPool, DRIVERS  # noqa: E402
+from engine import FetchEngine  # noqa: E402
+from rules import RuleCache  # noqa: E402
+
+RENDERED = '<span itemprop="price" content="42.00">42,00 ₽</span>'
+PAGES = {
+    "/static": '<html><head><meta property="product:price:amount" content="19.90"></head><body>ok</body></html>',
+    # цену дописывает скрипт через 300 мс; картинка и стили нужны только для проверки блокировки
+    "/js": ('<html><head><link rel="stylesheet" href="/style.css"></head><body>'
+            '<img src="/photo.png"><div id="price"></div>'
+            "<script>setTimeout(function(){var s=document.createElement('span');"
+            "s.setAttribute('item'+'prop','price');s.setAttribute('content','42.00');s.textContent='42,00';"
+            "document.getElementById('price').appendChild(s)}, 300)</script></body></html>"),
+    # цена видна только в тексте страницы — разбор её находит, браузер не нужен
+    "/text": "<html><body><p>Всего за 1 234,00 руб.</p></body></html>",
+    "/empty": "<html><body><div id='app'></div></body></html>",
+}
+HITS = {}
+
+
+class Shop(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        HITS[path] = HITS.get(path, 0) + 1
+        body = PAGES.get(path.rstrip("/0123456789").rstrip("-") if path.startswith("/js-") else path)
+        if body is None:
+            body = "" if path.endswith((".png", ".css")) else None
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/css" if path.endswith(".css") else
+                         "image/png" if path.endswith(".png") else "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDriver:
+    """Заглушка WebDriver: качает страницу и через 0.3 с «выполняет» скрипт — вставляет цену в #price"""
+
+    active = 0
+    peak = 0
+    gets = 0
+    lock = threading.Lock()
+    fail = False
+
+    def __init__(self):
+        self._html = ""
+        self._loaded_at = 0.0
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def get(self, url):
+        if url == "about:blank":
+            with FakeDriver.lock:
+                FakeDriver.active -= 1
+            self._html = ""
+            return
+        with FakeDriver.lock:
+            FakeDriver.gets += 1
+            FakeDriver.active += 1
+            FakeDriver.peak = max(FakeDriver.peak, FakeDriver.active)
+        if FakeDriver.fail:
+            with FakeDriver.lock:
+                FakeDriver.active -= 1
+            raise RuntimeError("browser crashed")
+        self._html = httpx.get(url).text
+        self._loaded_at = time.monotonic()
+
+    @property
+    def page_source(self):
+        if 'id="price"></div><script>' in self._html and time.monotonic() - self._loaded_at >= 0.3:
+            return self._html.replace('<div id="price"></div>', f'<div id="price">{RENDERED}</div>')
+        return self._html
+
+    def execute_script(self, script):
+        pass
+
+    def quit(self):
+        pass
+
+
+def check(name, passed):
+    print(f"  {'OK  ' if passed else 'FAIL'} {name}")
+    return passed
+
+
+def engine_checks(base):
+    pool = BrowserPool(FakeDriver, max_tabs=2, settle=2)
+    engine = FetchEngine(max_concurrency=8, per_host=8, parse_workers=0, browser=pool)
+    rules = RuleCache()
+    static_urls = [f"{base}/static?{i}" for i in range(20)] + [f"{base}/text?{i}" for i in range(5)]
+    js_urls = [f"{base}/js-{i}" for i in range(6)]
+
+    results = engine.fetch_many(static_urls + js_urls, rules=rules)
+    gets = FakeDriver.gets
+    again = engine.fetch_many([f"{base}/text?again"] + static_urls[:20], rules=RuleCache())
+    ok = [
+        check("страницы с разметкой цены — без браузера", gets <= len(js_urls) + 5
+              and all(results[u].price == 19.9 for u in static_urls[:20])),
+        check("цена только в тексте: браузер не помог — дальше без него",
+              all(results[u].price == 1234.0 for u in static_urls[20:]) and FakeDriver.gets == gets
+              and again[f"{base}/text?again"].price == 1234.0),
+        check("JS-страницы дорисованы браузером", all(results[u].price == 42.0 and results[u].strategy == "browser"
+                                                      for u in js_urls)),
+        check(f"вкладок одновременно не больше 2 (было {FakeDriver.peak})", FakeDriver.peak <= 2),
+        check("домен запомнен как JS-only", (rules.hint("127.0.0.1") or (None,))[0] == "browser"),
+    ]
+
+    # выученный домен: сразу в браузер; браузер упал — страница без цены даёт ошибку, а не падение обхода
+    FakeDriver.fail = True
+    results = engine.fetch_many([f"{base}/empty"], rules=rules)
+    ok.append(check("сбой браузера — ошибка ссылки, обход продолжается",
+                    results[f"{base}/empty"].price is None and results[f"{base}/empty"].status == "error"))
+    FakeDriver.fail = False
+    print(f"  пул: {pool.stats()}")
+    engine.shutdown()
+    pool.close()
+    return all(ok)
+
+
+def real_browser_check(base):
+    kind = os.environ.get("BROWSER", "chrome")
+    pool = BrowserPool(lambda: DRIVERS[kind](headless=True, block_resources=True), max_tabs=1, settle=5)
+    HITS.clear()
+    try:
+        price, strategy, inner, seconds = pool.render_price(f"{base}/js")
+    except Exception as e:
+        print(f"  SKIP настоящий браузер ({kind}) недоступен: {type(e).__name__}: {str(e).splitlines()[0][:120]}")
+        return True
+    finally:
+        pool.close()
+    print(f"  {kind}: цена {price} ({strategy}/{inner}) за {seconds:.2f} с, запросы: {HITS}")
+    return all([
+        check("цена, нарисованная скриптом, найдена", price == 42.0),
+        check("картинки и CSS не загружались", not HITS.get("/photo.png") and
+              (kind != "chrome" or not HITS.get("/style.css"))),
+    ])
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Shop)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print("движок с заглушкой браузера:")
+    ok = engine_checks(base)
+    print("настоящий браузер:")
+    ok = real_browser_check(base) and ok
+    if not ok:
+        sys.exit("FAIL")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/check_claims.py
+# Проверка захвата заданий «ровно один раз»: несколько процессов-воркеров
+# одновременно разбирают общую очередь fetch_jobs, после чего сверяем,
+# что каждое задание досталось ровно одному из них.
+#
+#   python benchmarks/check_claims.py --workers 6 --jobs 2000
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def claimer(db_url, worker_id, batch, out):
+    os.environ["DATABASE_URL"] = db_url
+    from worker import create_worker_app
+    from jobqueue import DBJobQueue
+
+    app = create_worker_app()
+    queue = DBJobQueue()
+    claimed = []
+    with app.app_context():
+        while True:
+            jobs = queue.claim(worker_id, limit=batch, lease_seconds=600)
+            if not jobs:
+                break
+            claimed.extend(job_id for job_id, _ in jobs)
+            queue.complete([job_id for job_id, _ in jobs])
+    out.put((worker_id, claimed))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--jobs", type=int, default=1000)
+    ap.add_argument("--batch", type=int, default=20)
+    ap.add_argument("--db", help="URL базы (по умолчанию временный SQLite-файл)")
+    args = ap.parse_args()
+
+    db_url = args.db or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "claims.sqlite")
+    os.environ["DATABASE_URL"] = db_url
+    from worker import create_worker_app
+    from models import db, Product, ProductLink
+    from jobqueue import DBJobQueue
+
+    app = create_worker_app()
+    with app.app_context():
+        db.create_all()
+        product = Product(name="claims")
+        db.session.add(product)
+        db.session.flush()
+        db.session.execute(ProductLink.__table__.insert(),
+                           [{"product_id": product.id, "url": f"http://shop.test/{i}"} for i in range(args.jobs)])
+        db.session.commit()
+        link_ids = [ln.id for ln in ProductLink.query.filter_by(product_id=product.id)]
+        DBJobQueue().enqueue(link_ids)
+
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=claimer, args=(db_url, f"w{i}", args.batch, out)) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    counts = Counter(job_id for _, claimed in results for job_id in claimed)
+    dupes = [job_id for job_id, n in counts.items() if n > 1]
+    for worker_id, claimed in sorted(results):
+        print(f"{worker_id}: {len(claimed)} заданий")
+    print(f"всего заданий: {args.jobs}, захвачено: {len(counts)}, дубликатов: {len(dupes)}")
+    if dupes or len(counts) != args.jobs:
+        sys.exit(1)
+    print("OK: каждое задание захвачено ровно одним воркером")
+
+
+if __name__ == "__main__":
+    main()
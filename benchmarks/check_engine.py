@@ -0,0 +1,84 @@
+# benchmarks/check_engine.py
+# Проверка общих слотов хоста в FetchEngine.fetch_many: два одновременных вызова
+# (плановый обход и пакет «Обновить») к одному медленному хосту при per_host=2.
+# Второй вызов, которому в начале не досталось ни одного слота, должен дождаться
+# освобождения и скачать все свои ссылки, а не вернуть их как "not fetched".
+#
+#   python benchmarks/check_engine.py
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DOMAIN_RATE", "1000")
+os.environ.setdefault("DOMAIN_BURST", "1000")
+
+from engine import FetchEngine  # noqa: E402
+
+PER_HOST = 2
+
+
+class SlowShop(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        time.sleep(0.3)
+        with cls.lock:
+            cls.active -= 1
+        body = f'<html><head><meta property="product:price:amount" content="{len(self.path)}.00"></head></html>'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def check(name, passed):
+    print(f"  {'OK  ' if passed else 'FAIL'} {name}")
+    return passed
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowShop)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    engine = FetchEngine(max_concurrency=8, per_host=PER_HOST, parse_workers=0, timeout=10)
+    sweep = [f"{base}/sweep/{i}" for i in range(6)]
+    batch = [f"{base}/batch/{i}" for i in range(3)]
+    out = {}
+
+    first = threading.Thread(target=lambda: out.update(sweep=engine.fetch_many(sweep)))
+    first.start()
+    time.sleep(0.1)  # обход успел занять оба слота хоста
+    out["batch"] = engine.fetch_many(batch)
+    first.join()
+    engine.shutdown()
+
+    ok = []
+    for name, key, urls in (("обход", "sweep", sweep), ("пакет", "batch", batch)):
+        got = out[key]
+        fetched = sum(1 for u in urls if u in got and got[u].price is not None)
+        ok.append(check(f"{name}: скачано {fetched} из {len(urls)}", fetched == len(urls)))
+    ok.append(check(f"лимит хоста соблюдён: одновременно {SlowShop.peak} из {PER_HOST}", SlowShop.peak <= PER_HOST))
+    if not all(ok):
+        sys.exit("FAIL")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/check_queries.py
+# Регрессия N+1: считаем SQL-запросы при рендере дашборда и страницы продукта
+# на маленьком и большом наборе данных — число запросов не должно расти с объёмом.
+#
+#   python benchmarks/check_queries.py
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "queries.sqlite"))
+os.environ["SCHEDULER_MODE"] = "off"
+os.environ["PAGE_CACHE_TTL"] = "0"  # считаем запросы рендера, а не попадания в кэш страниц
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, User, Product, ProductLink, PriceHistory, init_db, refresh_product_aggregates  # noqa: E402
+
+
+def seed(user, products, links, history):
+    """Добавляем пользователю products продуктов по links ссылок и history записей истории"""
+    now = datetime.utcnow()
+    for p in range(products):
+        product = Product(name=f"product {p}", user_id=user.id)
+        db.session.add(product)
+        db.session.flush()
+        for ln in range(links):
+            link = ProductLink(product_id=product.id, url=f"http://shop.test/{p}/{ln}", last_price=100.0 + ln)
+            db.session.add(link)
+            db.session.flush()
+            db.session.execute(PriceHistory.__table__.insert(), [
+                {"link_id": link.id, "price": 100.0 + h % 7, "checked_at": now - timedelta(minutes=10 * h)}
+                for h in range(history)
+            ])
+    refresh_product_aggregates()
+    db.session.commit()
+
+
+def count_queries(client, path):
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        resp = client.get(path)
+        assert resp.status_code == 200, (path, resp.status_code)
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return len(statements)
+
+
+def measure(app, email, products, links, history):
+    with app.app_context():
+        user = User(email=email)
+        user.set_password("x")
+        db.session.add(user)
+        db.session.commit()
+        seed(user, products, links, history)
+        first_product = Product.query.filter_by(user_id=user.id).first().id
+
+    client = app.test_client()
+    client.post("/login", data={"email": email, "password": "x"})
+    with app.app_context():
+        return count_queries(client, "/"), count_queries(client, f"/product/{first_product}")
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        init_db()
+    small = measure(app, "small@test", products=1, links=1, history=3)
+    large = measure(app, "large@test", products=20, links=5, history=200)
+    print(f"дашборд:  {small[0]} запросов (1 продукт) / {large[0]} запросов (20 продуктов x 5 ссылок)")
+    print(f"продукт:  {small[1]} запросов (1 ссылка, 3 записи) / {large[1]} запросов (5 ссылок x 200 записей)")
+    if small != large:
+        sys.exit("FAIL: число запросов растёт вместе с данными")
+    print("OK: число запросов не зависит от объёма данных")
+
+
+if __name__ == "__main__":
+    main()
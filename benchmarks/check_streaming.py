@@ -0,0 +1,138 @@
+# benchmarks/check_streaming.py
+# Проверка потоковой загрузки (scraper.download_page) на локальном сервере:
+# - цена в <head> или в JSON-LD — многомегабайтная страница дочитывается только до цены;
+# - страница больше FETCH_MAX_BYTES — читается начало, память не растёт с размером страницы;
+# - кодировка из <meta charset> без charset в Content-Type (windows-1251);
+# - хэш обрезанного тела стабилен: повторная загрузка даёт "unchanged";
+# - после ранней остановки с небольшим остатком соединение остаётся в keep-alive.
+# Печатает пик памяти на загрузку (метрика pricewatcher_fetch_peak_bytes и tracemalloc).
+#
+#   python benchmarks/check_streaming.py
+import os
+import sys
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DOMAIN_RATE", "1000")
+os.environ.setdefault("DOMAIN_BURST", "1000")
+os.environ["FETCH_MAX_BYTES"] = str(1024 * 1024)
+
+from http_pool import get_pool  # noqa: E402
+from metrics import FETCH_PEAK_BYTES  # noqa: E402
+from scraper import detect_charset, download_page, fetch_page  # noqa: E402
+
+FILLER = ('<div class="card"><p class="title">Похожий товар с длинным описанием</p>'
+          '<ul><li>Артикул не указан</li></ul></div>\n').encode() * 200
+JSONLD = ('<script type="application/ld+json">{"@type": "Product", "offers": '
+          '{"@type": "Offer", "price": "777.00"}}</script>')
+
+
+def page(head, body, filler_mb):
+    start = f"<!doctype html><html><head>{head}</head><body>{body}".encode()
+    return start, int(filler_mb * 1024 * 1024 / len(FILLER)), b"</body></html>"
+
+
+PAGES = {
+    "/head": page('<meta charset="utf-8"><meta property="product:price:amount" content="1999.00">', "", 20),
+    "/jsonld": page("<title>x</title>", JSONLD, 20),
+    "/body": page("<title>x</title>", '<span class="price">4 250 руб.</span>', 8),
+    "/noprice": page("<title>x</title>", "<p>нет в наличии</p>", 8),
+    "/small": page('<meta property="product:price:amount" content="10.00">', "", 0.02),
+    "/cp1251": ('<html><head><meta charset="windows-1251"><title>Цена</title></head>'
+                '<body><span class="price">Цена: 3 490 руб.</span></body></html>'.encode("cp1251"), 0, b""),
+}
+
+
+class Shop(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        start, repeat, end = PAGES[self.path]
+        self.send_response(200)
+        # без charset: кодировку страница объявляет сама
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(start) + repeat * len(FILLER) + len(end)))
+        self.end_headers()
+        try:
+            self.wfile.write(start)
+            for _ in range(repeat):
+                self.wfile.write(FILLER)
+            self.wfile.write(end)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # клиент прочитал, что нужно, и закрыл соединение
+
+    def log_message(self, *args):
+        pass
+
+
+def check(name, passed):
+    print(f"  {'OK  ' if passed else 'FAIL'} {name}")
+    return passed
+
+
+def measured(url, **kw):
+    tracemalloc.start()
+    result = download_page(url, **kw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Shop)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    mb = 1024 * 1024
+    ok = []
+    download_page(f"{base}/small")  # клиент пула и соединение создаются до замеров
+
+    head, head_peak = measured(f"{base}/head")
+    ok.append(check(f"цена в <head>: 20 МБ страницы, прочитано {len(head.html)} символов, пик {head_peak // 1024} КБ",
+                    head.cut == "early" and len(head.html) < 64 * 1024 and head_peak < mb))
+    again = download_page(f"{base}/head", known_hash=head.content_hash)
+    ok.append(check("обрезанное тело — тот же хэш при повторной загрузке", again.status == "unchanged"))
+
+    jsonld, jsonld_peak = measured(f"{base}/jsonld")
+    ok.append(check(f"JSON-LD в <body>: пик {jsonld_peak // 1024} КБ",
+                    jsonld.cut == "early" and jsonld.html.endswith("</script>") and jsonld_peak < mb))
+
+    body, body_peak = measured(f"{base}/body")
+    full, _ = measured(f"{base}/body", early_stop=False)
+    # пик = буфер в 1 МБ + тот же текст в str (кириллица — 2 байта на символ); от размера страницы не зависит
+    ok.append(check(f"8 МБ при лимите 1 МБ: читаем начало, пик {body_peak // 1024} КБ",
+                    body.cut == "limit" and len(body.html.encode()) <= mb and body_peak < 5 * mb))
+    ok.append(check("цена из начала большой страницы найдена",
+                    fetch_page(f"{base}/body").price == 4250.0 and full.cut == "limit"))
+    noprice = fetch_page(f"{base}/noprice")
+    ok.append(check("нет цены в первых FETCH_MAX_BYTES — понятная ошибка",
+                    noprice.price is None and noprice.error == "price not found (page truncated)"))
+
+    cp = download_page(f"{base}/cp1251")
+    ok.append(check("windows-1251 из <meta charset>", "Цена: 3 490 руб." in cp.html
+                    and fetch_page(f"{base}/cp1251").price == 3490.0))
+    ok.append(check("кодировка: BOM и заголовок важнее значения по умолчанию",
+                    detect_charset(None, b"\xef\xbb\xbf<html>") == "utf-8-sig"
+                    and detect_charset("koi8-r", b"<html>") == "koi8-r"
+                    and detect_charset("no-such", b"<html>") == "utf-8"))
+
+    pool = get_pool()
+    opened = pool.stats()["connections_opened"]
+    for _ in range(5):
+        download_page(f"{base}/small")
+    ok.append(check("ранняя остановка на маленькой странице не рвёт keep-alive",
+                    pool.stats()["connections_opened"] - opened <= 1))
+
+    count, total = FETCH_PEAK_BYTES.snapshot()
+    print(f"  пик памяти на загрузку (буфер + текст): в среднем {total / max(count, 1) / 1024:.0f} КБ "
+          f"на {count} загрузок")
+    if not all(ok):
+        sys.exit("FAIL")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# benchmarks/fakeshop.py
+# Локальный «магазин» для бенчмарков скрейпера: отдаёт карточки товаров из benchmarks/pages.py
+# с настраиваемой задержкой ответа, размером страницы и вариантом разметки цены.
+#
+#   URL товара: http://127.0.0.<домен>:<порт>/<вариант>/<размер_кб>/<id>
+#   (вариант — meta, itemprop, class, jsonld, text; см. pages.VARIANTS)
+#
+# Каждый «домен» — отдельный адрес 127.0.0.N на общем порту, чтобы лимиты
+# скрейпера на хост работали как с настоящими магазинами (127.0.0.0/8 целиком
+# ведёт на loopback в Linux; на macOS адреса кроме 127.0.0.1 нужно добавить алиасами).
+# Цена товара зависит от номера прохода (round): на каждом проходе примерно
+# change_rate товаров меняют цену, остальные отдают ту же страницу (и 304 на If-None-Match при etag).
+#
+#   python benchmarks/fakeshop.py --domains 5 --latency 0.05   # отдельно, для ручных проверок
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from benchmarks.pages import VARIANTS, make_page
+except ImportError:  # запуск как python benchmarks/fakeshop.py
+    from pages import VARIANTS, make_page
+
+SENTINEL = 123456.78
+
+
+def price_for(item_id, rnd, change_rate=0.1):
+    """Цена товара на проходе rnd: меняется с вероятностью change_rate за проход (детерминированно)"""
+    version = 0
+    for r in range(1, rnd + 1):
+        if zlib.crc32(f"{item_id}:{r}".encode()) % 1000 < change_rate * 1000:
+            version = r
+    return round(100 + zlib.crc32(f"{item_id}/{version}".encode()) % 90000 / 100, 2), version
+
+
+def item_url(host, port, variant, size_kb, item_id):
+    return f"http://{host}:{port}/{variant}/{size_kb}/{item_id}"
+
+
+def domain_host(n):
+    """Адрес n-го домена (n с нуля): 127.0.0.1, 127.0.0.2, ..."""
+    return f"127.0.0.{n % 250 + 1}"
+
+
+class _Templates:
+    """Страницы по (вариант, размер) с меткой вместо цены — подставляем цену заменой строки"""
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def render(self, variant, size_kb, price):
+        key = (variant, size_kb)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                page = self._pages[key] = make_page(variant, SENTINEL, size_kb=size_kb, seed=size_kb)
+        shown = f"{price:,.2f}".replace(",", " ").replace(".", ",")
+        return page.replace(f"{SENTINEL:.2f}", f"{price:.2f}").replace("123 456,78", shown)
+
+
+def make_handler(options, rnd):
+    templates = _Templates()
+
+    class ShopHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих магазинов
+
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if len(parts) != 3 or parts[0] not in VARIANTS or not parts[1].isdigit() or not parts[2].isdigit():
+                self.send_error(404)
+                return
+            variant, size_kb, item_id = parts[0], int(parts[1]), int(parts[2])
+
+            delay = options["latency"] * (1 + random.uniform(-options["jitter"], options["jitter"]))
+            if delay > 0:
+                time.sleep(delay)
+            if options["error_rate"] and random.random() < options["error_rate"]:
+                self.send_error(503)
+                return
+
+            price, version = price_for(item_id, rnd.value, options["change_rate"])
+            etag = f'"{item_id}-{version}"'
+            if options["etag"] and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            body = templates.render(variant, size_kb, price).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if options["etag"]:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ShopHandler
+
+
+def serve(options, rnd, ready=None, port=0):
+    """Поднимаем по серверу на каждый адрес домена (общий порт) и обслуживаем до завершения процесса"""
+    handler = make_handler(options, rnd)
+    servers = [ThreadingHTTPServer((domain_host(0), port), handler)]
+    port = servers[0].server_address[1]
+    for n in range(1, options["domains"]):
+        servers.append(ThreadingHTTPServer((domain_host(n), port), handler))
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    if ready is not None:
+        ready.put(port)
+    while True:
+        time.sleep(3600)
+
+
+class FakeShop:
+    """
+    Магазин в отдельном процессе — его CPU и память не попадают в замеры скрейпера.
+    shop.round — номер прохода (меняет цены части товаров), shop.port — общий порт.
+    """
+
+    def __init__(self, domains=10, latency=0.05, jitter=0.5, change_rate=0.1, etag=True, error_rate=0.0):
+        self.options = {"domains": max(1, min(int(domains), 250)), "latency": latency, "jitter": jitter,
+                        "change_rate": change_rate, "etag": etag, "error_rate": error_rate}
+        ctx = multiprocessing.get_context("spawn")
+        self._round = ctx.Value("i", 0)
+        self._ready = ctx.Queue()
+        self._process = ctx.Process(target=serve, args=(self.options, self._round, self._ready), daemon=True)
+        self.port = None
+
+    def start(self, timeout=30):
+        self._process.start()
+        self.port = self._ready.get(timeout=timeout)
+        return self
+
+    def stop(self):
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(5)
+
+    @property
+    def round(self):
+        return self._round.value
+
+    @round.setter
+    def round(self, value):
+        self._round.value = value
+
+    def url(self, item_id, variant, size_kb):
+        return item_url(domain_host(item_id % self.options["domains"]), self.port, variant, size_kb, item_id)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Локальный магазин для бенчмарков скрейпера")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--domains", type=int, default=10)
+    ap.add_argument("--latency", type=float, default=0.05, help="задержка ответа, с")
+    ap.add_argument("--jitter", type=float, default=0.5, help="разброс задержки, доля от latency")
+    ap.add_argument("--change-rate", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    ap.add_argument("--no-etag", action="store_true")
+    args = ap.parse_args()
+
+    options = {"domains": max(1, min(args.domains, 250)), "latency": args.latency, "jitter": args.jitter,
+               "change_rate": args.change_rate, "etag": not args.no_etag, "error_rate": args.error_rate}
+    print(f"магазин: {item_url(domain_host(0), args.port, VARIANTS[0], 100, 1)} "
+          f"(+ ещё {options['domains'] - 1} доменов 127.0.0.N)")
+    serve(options, multiprocessing.Value("i", 0), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/pages.py
+# Синтетические страницы магазинов для бенчмарков: разные варианты разметки цены
+# и «балласт» из карточек товаров, чтобы страница была похожа по размеру на настоящую витрину.
+import json
+import random
+
+VARIANTS = ("meta", "itemprop", "class", "jsonld", "text")
+
+
+def _filler(size_kb, rng):
+    """Балласт: меню, карточки похожих товаров, скрипты — примерно size_kb килобайт"""
+    parts = []
+    total = 0
+    i = 0
+    while total < size_kb * 1024:
+        i += 1
+        chunk = (
+            f'<div class="card" data-sku="{rng.randint(10000, 99999)}">'
+            f'<a href="/item/{i}"><img src="/img/{i}.jpg" alt="Товар {i}"></a>'
+            f'<p class="title">Похожий товар №{i} с длинным описанием для объёма страницы</p>'
+            f'<ul class="specs"><li>Вес: {rng.randint(1, 9)} кг</li><li>Артикул {rng.randint(1000, 9999)}</li></ul>'
+            f'</div>\n'
+        )
+        parts.append(chunk)
+        total += len(chunk)
+    return "".join(parts)
+
+
+def make_page(variant, price, size_kb=100, seed=0):
+    """HTML-страница товара с ценой price, размеченной способом variant (см. VARIANTS)"""
+    rng = random.Random(seed)
+    shown = f"{price:,.2f}".replace(",", " ").replace(".", ",")
+    head = ['<meta charset="utf-8">', "<title>Карточка товара</title>",
+            '<meta name="viewport" content="width=device-width">']
+    body = ["<header><nav>" + "".join(f'<a href="/c/{i}">Раздел каталога</a>' for i in range(30)) + "</nav></header>"]
+
+    if variant == "meta":
+        head.append(f'<meta property="product:price:amount" content="{price:.2f}">')
+        body.append(f"<div class=\"buy\"><b>{shown} ₽</b></div>")
+    elif variant == "itemprop":
+        body.append(f'<div itemscope itemtype="https://schema.org/Offer">'
+                    f'<span itemprop="price" content="{price:.2f}">{shown} ₽</span></div>')
+    elif variant == "jsonld":
+        data = {"@context": "https://schema.org", "@type": "Product", "name": "Карточка товара",
+                "offers": {"@type": "Offer", "price": f"{price:.2f}", "priceCurrency": "RUB"}}
+        head.append(f'<script type="application/ld+json">{json.dumps(data, ensure_ascii=False)}</script>')
+        body.append(f"<div class=\"buy\"><b>{shown} ₽</b></div>")
+    elif variant == "class":
+        body.append(f'<div class="product-card"><span class="product-price__value">{shown} ₽</span></div>')
+    elif variant == "text":
+        body.append(f"<p>Купить сейчас всего за {shown} руб.</p>")
+    else:
+        raise ValueError(f"unknown variant: {variant}")
+
+    # цена — в начале карточки, балласт — после, как на реальных витринах
+    body.append(_filler(size_kb, rng))
+    return ("<!doctype html><html><head>" + "".join(head) + "</head><body>"
+            + "".join(body) + "</body></html>")
+
+
+def make_corpus(n=50, size_kb=100, seed=1):
+    """Список (имя, html, ожидаемая цена) с равномерной смесью вариантов разметки"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        variant = VARIANTS[i % len(VARIANTS)]
+        price = round(rng.uniform(10, 999), 2)
+        corpus.append((f"{variant}-{i}", make_page(variant, price, size_kb=size_kb, seed=i), price))
+    return corpus
@@ -0,0 +1,221 @@
+# browser.py
+# Пул headless-браузеров (selenium) для магазинов, которые рисуют цену JavaScript'ом.
+# Дорогой путь включается только по необходимости (см. FetchEngine.fetch_many):
+# - домен помечен как JS-only (BROWSER_DOMAINS или выученное правило "browser");
+# - обычный разбор HTML цену не нашёл.
+# Ограничения, чтобы браузеры не съели память воркера:
+# - не больше BROWSER_MAX_TABS открытых страниц одновременно (одна вкладка на экземпляр браузера,
+#   экземпляры переиспользуются и перезапускаются каждые BROWSER_MAX_PAGES страниц);
+# - таймаут загрузки страницы BROWSER_PAGE_TIMEOUT и ожидания цены BROWSER_SETTLE секунд;
+# - картинки, шрифты, CSS и видео не загружаются.
+import atexit
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from scraper import extract_price
+from ratelimit import get_limiter
+
+try:
+    from selenium.common.exceptions import TimeoutException
+except ImportError:  # selenium нужен только при BROWSER_ENABLED=1
+    TimeoutException = None
+
+logger = logging.getLogger(__name__)
+
+# что не нужно для цены: блокируем в Chrome через DevTools (Network.setBlockedURLs)
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.bmp",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+]
+
+# стратегии, которым верим и без браузера; «весь текст страницы» — нет
+WEAK_STRATEGIES = (None, "fallback", "soup")
+
+
+def chrome_driver(headless=True, block_resources=True):
+    """Chrome/Chromium через selenium (нужен браузер; драйвер selenium находит сам)"""
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    for arg in ("--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu", "--disable-extensions",
+                "--mute-audio", "--no-first-run", "--window-size=1280,2000"):
+        options.add_argument(arg)
+    # ждём DOMContentLoaded, а не все подресурсы — цену дальше ждём сами
+    options.page_load_strategy = "eager"
+    if block_resources:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        })
+    driver = webdriver.Chrome(options=options)
+    if block_resources:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    return driver
+
+
+def firefox_driver(headless=True, block_resources=True):
+    """Firefox через selenium: картинки и веб-шрифты выключаются настройками (CSS не блокируется)"""
+    from selenium import webdriver
+
+    options = webdriver.FirefoxOptions()
+    if headless:
+        options.add_argument("-headless")
+    options.page_load_strategy = "eager"
+    if block_resources:
+        options.set_preference("permissions.default.image", 2)
+        options.set_preference("browser.display.use_document_fonts", 0)
+        options.set_preference("media.autoplay.default", 5)
+    return webdriver.Firefox(options=options)
+
+
+DRIVERS = {"chrome": chrome_driver, "firefox": firefox_driver}
+
+
+class BrowserPool:
+    """
+    Ограниченный пул браузеров. render_price(url) -> (цена, "browser", стратегия, секунды)
+    в том же виде, что scraper.parse_price_html, — движок применяет результат как обычный разбор.
+    driver_factory — функция без аргументов, возвращающая WebDriver (для проверок — заглушка).
+    """
+
+    def __init__(self, driver_factory, max_tabs=2, page_timeout=20, settle=3.0, max_pages=50):
+        self.driver_factory = driver_factory
+        self.max_tabs = max(1, int(max_tabs))
+        self.page_timeout = page_timeout
+        self.settle = settle
+        self.max_pages = max(1, int(max_pages))
+        self.rendered = 0
+        self.failed = 0
+        self.started = 0
+        self._tabs = threading.BoundedSemaphore(self.max_tabs)
+        self._idle = []  # [(driver, страниц отрисовано)]
+        self._open = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            driver = self.driver_factory()
+            driver.set_page_load_timeout(self.page_timeout)
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+        with self._lock:
+            self.started += 1
+        return driver, 0
+
+    def _checkin(self, driver, pages, broken=False):
+        with self._lock:
+            keep = not broken and not self._closed and pages < self.max_pages
+            if keep:
+                self._idle.append((driver, pages))
+                return
+            self._open -= 1
+        self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug("quit: %s", e)
+
+    def _wait_for_price(self, driver, deadline):
+        """Ждём, пока скрипты страницы дорисуют цену: опрашиваем DOM до deadline"""
+        best = (None, None, None)
+        while True:
+            price, strategy, _ = extract_price(driver.page_source)
+            if price is not None and strategy not in WEAK_STRATEGIES:
+                return price, strategy
+            if price is not None and best[0] is None:
+                best = (price, strategy, None)
+            if time.monotonic() >= deadline:
+                return best[0], best[1]
+            time.sleep(0.25)
+
+    def render_price(self, url):
+        started = time.perf_counter()
+        domain = urlsplit(url).hostname or ""
+        with self._tabs:
+            get_limiter().acquire(domain)
+            driver, pages = self._checkout()
+            broken = False
+            try:
+                try:
+                    driver.get(url)
+                except Exception as e:
+                    # таймаут загрузки: останавливаем страницу и разбираем то, что успело отрисоваться
+                    if TimeoutException is None or not isinstance(e, TimeoutException):
+                        raise
+                    driver.execute_script("window.stop();")
+                price, strategy = self._wait_for_price(driver, time.monotonic() + self.settle)
+                # пустая вкладка между страницами: не держим в памяти прошлый магазин
+                driver.get("about:blank")
+            except Exception:
+                broken = True
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                self._checkin(driver, pages + 1, broken)
+        with self._lock:
+            self.rendered += 1
+        # стратегия "browser" (с внутренней стратегией вместо селектора) запоминается в rules.py —
+        # в следующий раз домен сразу идёт в браузер
+        return price, ("browser" if price is not None else None), strategy, time.perf_counter() - started
+
+    def stats(self):
+        with self._lock:
+            return {"max_tabs": self.max_tabs, "open": self._open, "idle": len(self._idle),
+                    "started": self.started, "rendered": self.rendered, "failed": self.failed}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for driver, _ in idle:
+            self._quit(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool(config=None):
+    """
+    Пул браузеров процесса или None, если он выключен (BROWSER_ENABLED=0)
+    или selenium не установлен. Браузеры запускаются лениво — при первой JS-странице.
+    """
+    global _pool
+    config = config or {}
+    if not config.get("BROWSER_ENABLED", False):
+        return None
+    with _pool_lock:
+        if _pool is None:
+            if TimeoutException is None:
+                logger.warning("BROWSER_ENABLED=1, но selenium не установлен — JS-страницы не рендерятся")
+                return None
+            make = DRIVERS.get(config.get("BROWSER", "chrome"), chrome_driver)
+            block = config.get("BROWSER_BLOCK_RESOURCES", True)
+            _pool = BrowserPool(
+                lambda: make(headless=True, block_resources=block),
+                max_tabs=config.get("BROWSER_MAX_TABS", 2),
+                page_timeout=config.get("BROWSER_PAGE_TIMEOUT", 20),
+                settle=config.get("BROWSER_SETTLE", 3.0),
+                max_pages=config.get("BROWSER_MAX_PAGES", 50),
+            )
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,181 @@
+# cache.py
+# Кэш отрендеренных фрагментов страниц: дашборд пользователя и данные страницы продукта.
+# Данные меняются только когда обход записывает новые цены, поэтому фрагмент живёт
+# до PAGE_CACHE_TTL секунд и сбрасывается точечно:
+# - путь записи (persistence.PriceWriter) — по продуктам, у ссылок которых изменилась цена;
+# - действия пользователя (добавил/изменил/удалил продукт, правило уведомления).
+# Хранилище — общее (PAGE_CACHE_URL=redis://..., нужен пакет redis): сброс из любого процесса
+# виден всем веб-процессам и воркерам. Кэш в памяти процесса (LRU на PAGE_CACHE_MAX_ENTRIES записей)
+# включается только явно (PAGE_CACHE_LOCAL=1) и годится лишь для одного процесса: сброс из
+# соседнего gunicorn-воркера или из worker.py до него не доходит. Без того и другого кэша нет.
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from metrics import PAGE_CACHE
+
+logger = logging.getLogger(__name__)
+
+
+def dashboard_key(user_id):
+    return f"dashboard:{user_id}"
+
+
+def product_key(product_id):
+    return f"product:{product_id}"
+
+
+class MemoryBackend:
+    """Кэш в памяти процесса: TTL на запись и вытеснение давно не читанных сверх max_entries"""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max(1, int(max_entries))
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (истекает, значение)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._data), "max_entries": self.max_entries,
+                    "evictions": self.evictions}
+
+
+class RedisBackend:
+    """Общий кэш для нескольких процессов (веб + воркеры); TTL и вытеснение — на стороне Redis"""
+
+    def __init__(self, url, prefix="pricewatcher:page:"):
+        import redis  # необязательная зависимость: нужна только при PAGE_CACHE_URL
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self.prefix + key, value.encode(), ex=max(1, int(ttl)))
+
+    def delete(self, keys):
+        keys = [self.prefix + k for k in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+class PageCache:
+    """
+    Фрагменты HTML по ключу (dashboard_key / product_key).
+    Ошибка общего хранилища не ломает страницу: фрагмент просто рендерится заново.
+    """
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get_or_render(self, key, render):
+        """Фрагмент из кэша или render() с сохранением результата"""
+        try:
+            html = self.backend.get(key)
+        except Exception as e:
+            logger.warning("кэш страниц недоступен: %s", e)
+            html = None
+        if html is not None:
+            PAGE_CACHE.inc(result="hit")
+            return html
+        PAGE_CACHE.inc(result="miss")
+        html = render()
+        try:
+            self.backend.set(key, html, self.ttl)
+        except Exception as e:
+            logger.warning("кэш страниц недоступен: %s", e)
+        return html
+
+    def invalidate(self, product_ids=(), user_ids=()):
+        """Сбрасываем страницы продуктов и дашборды пользователей"""
+        keys = [product_key(p) for p in set(product_ids)] + [dashboard_key(u) for u in set(user_ids)]
+        if not keys:
+            return
+        try:
+            self.backend.delete(keys)
+        except Exception as e:
+            logger.warning("не удалось сбросить кэш страниц: %s", e)
+
+    def stats(self):
+        return dict(self.backend.stats(), ttl=self.ttl,
+                    hits=PAGE_CACHE.value(result="hit"), misses=PAGE_CACHE.value(result="miss"))
+
+
+class NullCache:
+    """Кэш выключен (PAGE_CACHE_TTL=0 или нет ни PAGE_CACHE_URL, ни PAGE_CACHE_LOCAL): всегда рендерим"""
+
+    def get_or_render(self, key, render):
+        return render()
+
+    def invalidate(self, product_ids=(), user_ids=()):
+        pass
+
+    def stats(self):
+        return {"backend": "off"}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Кэш страниц процесса (настройки PAGE_CACHE_* из Config)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if Config.PAGE_CACHE_TTL <= 0:
+                _cache = NullCache()
+            elif Config.PAGE_CACHE_URL:
+                try:
+                    _cache = PageCache(RedisBackend(Config.PAGE_CACHE_URL), ttl=Config.PAGE_CACHE_TTL)
+                except ImportError:
+                    logger.warning("PAGE_CACHE_URL задан, но пакет redis не установлен — страницы не кэшируются")
+                    _cache = NullCache()
+            elif Config.PAGE_CACHE_LOCAL:
+                _cache = PageCache(MemoryBackend(Config.PAGE_CACHE_MAX_ENTRIES), ttl=Config.PAGE_CACHE_TTL)
+            else:
+                # кэш в памяти одного из нескольких процессов отдавал бы устаревшие страницы до TTL
+                _cache = NullCache()
+        return _cache
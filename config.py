@@ -8,6 +8,10 @@ class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")  # замените в продакшне
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///" + os.path.join(basedir, "db.sqlite"))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite: несколько процессов (веб + воркеры) пишут в одну базу — ждём блокировку, а не падаем
+    SQLALCHEMY_ENGINE_OPTIONS = (
+        {"connect_args": {"timeout": 30}} if SQLALCHEMY_DATABASE_URI.startswith("sqlite") else {}
+    )
 
     # Stripe (пример) - заполняйте в .env или окружении
     STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
@@ -15,3 +19,138 @@ class Config:
 
     # Планировщик: как часто обновлять цены (в секундах)
     PRICE_UPDATE_INTERVAL = int(os.environ.get("PRICE_UPDATE_INTERVAL", 600))  # 600 сек = 10 мин
+
+    # Движок загрузки: общий лимит параллельных запросов, лимит на один хост,
+    # число процессов для парсинга HTML (0 — парсить в потоках загрузки) и таймаут запроса
+    FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 16))
+    FETCH_PER_HOST = int(os.environ.get("FETCH_PER_HOST", 4))
+    PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", 2))
+    FETCH_TIMEOUT = int(os.environ.get("FETCH_TIMEOUT", 15))
+
+    # Пул HTTP-соединений: соединений на хост, сколько хостов держать открытыми,
+    # время жизни простаивающего соединения (сек) и HTTP/2 (нужен пакет h2)
+    HTTP_POOL_PER_HOST = int(os.environ.get("HTTP_POOL_PER_HOST", 4))
+    HTTP_POOL_MAX_HOSTS = int(os.environ.get("HTTP_POOL_MAX_HOSTS", 256))
+    HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 60))
+    HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "1") == "1"
+
+    # Запись результатов обхода: сколько ссылок писать в одной транзакции
+    PERSIST_BATCH_SIZE = int(os.environ.get("PERSIST_BATCH_SIZE", 500))
+
+    # Адаптивное расписание: границы интервала проверки одной ссылки (сек),
+    # сколько последних цен учитывать, как часто искать просроченные ссылки (сек),
+    # сколько ссылок брать за один тик и как часто сверять очередь с базой (сек)
+    REFRESH_MIN_INTERVAL = int(os.environ.get("REFRESH_MIN_INTERVAL", 120))
+    REFRESH_MAX_INTERVAL = int(os.environ.get("REFRESH_MAX_INTERVAL", 6 * 3600))
+    REFRESH_HISTORY_WINDOW = int(os.environ.get("REFRESH_HISTORY_WINDOW", 10))
+    DISPATCH_TICK = int(os.environ.get("DISPATCH_TICK", 5))
+    DISPATCH_BATCH = int(os.environ.get("DISPATCH_BATCH", 200))
+    QUEUE_RESYNC_INTERVAL = int(os.environ.get("QUEUE_RESYNC_INTERVAL", 60))
+
+    # Вежливость к магазинам: запросов в секунду и размер «ведра» на домен по умолчанию,
+    # персональные лимиты ("shop.ru=0.5:2,example.com=2"), пауза после 429/503
+    # (база и потолок экспоненты, сек) и сколько максимум ждать очереди к домену (сек)
+    DOMAIN_RATE = float(os.environ.get("DOMAIN_RATE", 1.0))
+    DOMAIN_BURST = float(os.environ.get("DOMAIN_BURST", 2))
+    DOMAIN_RATE_LIMITS = os.environ.get("DOMAIN_RATE_LIMITS", "")
+    DOMAIN_BACKOFF_BASE = float(os.environ.get("DOMAIN_BACKOFF_BASE", 5))
+    DOMAIN_BACKOFF_MAX = float(os.environ.get("DOMAIN_BACKOFF_MAX", 900))
+    DOMAIN_MAX_WAIT = float(os.environ.get("DOMAIN_MAX_WAIT", 30))
+
+    # Выученные правила извлечения цены: сколько доменов помнить (LRU)
+    EXTRACTION_RULES_MAX = int(os.environ.get("EXTRACTION_RULES_MAX", 5000))
+
+    # Режим проверки цен: "embedded" — веб-процесс проверяет сам, "queue" — веб только
+    # ставит задания в очередь для worker.py, "off" — планировщика в вебе нет.
+    # Очередь: "db" (таблица fetch_jobs, общая для всех машин) или "memory" (один процесс);
+    # аренда задания (сек), число попыток и сколько хранить завершённые задания (сек)
+    SCHEDULER_MODE = os.environ.get("SCHEDULER_MODE", "embedded")
+    JOB_QUEUE_BACKEND = os.environ.get("JOB_QUEUE_BACKEND", "db")
+    JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 300))
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 3600))
+    WORKER_BATCH = int(os.environ.get("WORKER_BATCH", 50))
+
+    # Проверка «по требованию» (обновить сейчас / новый продукт): фоновых потоков в веб-процессе
+    ONDEMAND_WORKERS = int(os.environ.get("ONDEMAND_WORKERS", 4))
+
+    # Сколько последних записей истории показывать по каждой ссылке на странице продукта
+    HISTORY_ON_PAGE = int(os.environ.get("HISTORY_ON_PAGE", 10))
+
+    # Хранение истории цен: строка на изменение цены, старые отрезки сворачиваются в бакеты
+    # - HISTORY_RAW_DAYS — сколько дней хранить отрезки как есть (0 — не сворачивать);
+    # - HISTORY_HOURLY_DAYS — сколько дней хранить часовые бакеты, дальше — суточные;
+    # - HISTORY_RETENTION_DAYS — срок хранения суточных бакетов (0 — бессрочно);
+    # - HISTORY_COMPACT_INTERVAL — как часто запускать уплотнение, сек
+    HISTORY_RAW_DAYS = int(os.environ.get("HISTORY_RAW_DAYS", 7))
+    HISTORY_HOURLY_DAYS = int(os.environ.get("HISTORY_HOURLY_DAYS", 90))
+    HISTORY_RETENTION_DAYS = int(os.environ.get("HISTORY_RETENTION_DAYS", 730))
+    HISTORY_COMPACT_INTERVAL = int(os.environ.get("HISTORY_COMPACT_INTERVAL", 3600))
+    HISTORY_COMPACT_CHUNK = int(os.environ.get("HISTORY_COMPACT_CHUNK", 20000))
+
+    # Уведомления о снижении цены (alerts.py)
+    # - правила держатся в памяти и перечитываются из базы раз в ALERT_INDEX_TTL секунд;
+    # - уведомления копятся до ALERT_BATCH_SIZE штук или ALERT_FLUSH_SECONDS секунд
+    #   и уходят одним письмом / одним webhook-запросом на получателя;
+    # - без ALERT_SMTP_HOST письма не отправляются, а только пишутся в лог;
+    # - webhook только на публичные адреса: loopback, частные и link-local сети (в том числе
+    #   адрес метаданных облака) отклоняются при сохранении и перед отправкой, редиректы не выполняются;
+    #   ALERT_WEBHOOK_ALLOW_PRIVATE=1 — разрешить внутренние адреса (webhook внутри своей сети)
+    ALERTS_ENABLED = os.environ.get("ALERTS_ENABLED", "1") == "1"
+    ALERT_INDEX_TTL = int(os.environ.get("ALERT_INDEX_TTL", 60))
+    ALERT_BATCH_SIZE = int(os.environ.get("ALERT_BATCH_SIZE", 50))
+    ALERT_FLUSH_SECONDS = float(os.environ.get("ALERT_FLUSH_SECONDS", 5))
+    ALERT_SMTP_HOST = os.environ.get("ALERT_SMTP_HOST", "")
+    ALERT_SMTP_PORT = int(os.environ.get("ALERT_SMTP_PORT", 25))
+    ALERT_SMTP_USER = os.environ.get("ALERT_SMTP_USER", "")
+    ALERT_SMTP_PASSWORD = os.environ.get("ALERT_SMTP_PASSWORD", "")
+    ALERT_SMTP_TLS = os.environ.get("ALERT_SMTP_TLS", "0") == "1"
+    ALERT_MAIL_FROM = os.environ.get("ALERT_MAIL_FROM", "pricewatcher@localhost")
+    ALERT_WEBHOOK_TIMEOUT = float(os.environ.get("ALERT_WEBHOOK_TIMEOUT", 10))
+    ALERT_WEBHOOK_ALLOW_PRIVATE = os.environ.get("ALERT_WEBHOOK_ALLOW_PRIVATE", "0") == "1"
+
+    # Наблюдаемость: уровень логов и ограничение одинаковых сообщений (logs.py),
+    # метрики Prometheus на /metrics (metrics.py); METRICS_TOKEN — если задан,
+    # /metrics требует заголовок "Authorization: Bearer <токен>"
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_RATE_BURST = int(os.environ.get("LOG_RATE_BURST", 20))
+    LOG_RATE_WINDOW = float(os.environ.get("LOG_RATE_WINDOW", 60))
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+    METRICS_MAX_DOMAINS = int(os.environ.get("METRICS_MAX_DOMAINS", 200))
+
+    # Кэш отрендеренных дашбордов и страниц продуктов (cache.py): живёт PAGE_CACHE_TTL секунд
+    # (0 — выключен) и сбрасывается при изменении цен. PAGE_CACHE_URL=redis://... — общий кэш
+    # для веба и воркеров; PAGE_CACHE_LOCAL=1 — кэш в памяти процесса (не больше
+    # PAGE_CACHE_MAX_ENTRIES фрагментов), только если веб и обход живут в одном процессе.
+    # Без них кэша нет: сброс в памяти одного процесса не виден остальным
+    PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 300))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", 2000))
+    PAGE_CACHE_URL = os.environ.get("PAGE_CACHE_URL", "")
+    PAGE_CACHE_LOCAL = os.environ.get("PAGE_CACHE_LOCAL", "0") == "1"
+
+    # Headless-браузер для магазинов, рисующих цену JavaScript'ом (browser.py, нужен Chrome или Firefox):
+    # включается BROWSER_ENABLED=1 и используется только для BROWSER_DOMAINS ("shop.ru,other.com"),
+    # выученных JS-доменов и страниц, где обычный разбор не нашёл цену.
+    # BROWSER_MAX_TABS — страниц в браузере одновременно, BROWSER_MAX_PAGES — перезапуск экземпляра
+    # после стольких страниц, таймауты — в секундах; картинки, шрифты и CSS не грузятся
+    BROWSER_ENABLED = os.environ.get("BROWSER_ENABLED", "0") == "1"
+    BROWSER = os.environ.get("BROWSER", "chrome")
+    BROWSER_DOMAINS = os.environ.get("BROWSER_DOMAINS", "")
+    BROWSER_MAX_TABS = int(os.environ.get("BROWSER_MAX_TABS", 2))
+    BROWSER_MAX_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", 50))
+    BROWSER_PAGE_TIMEOUT = float(os.environ.get("BROWSER_PAGE_TIMEOUT", 20))
+    BROWSER_SETTLE = float(os.environ.get("BROWSER_SETTLE", 3))
+    BROWSER_BLOCK_RESOURCES = os.environ.get("BROWSER_BLOCK_RESOURCES", "1") == "1"
+
+    # Нормализация адресов (urls.py): ссылки на одну страницу с разными метками трекинга
+    # скачиваются за проход один раз. Кроме utm_*, gclid, fbclid, yclid и т.п. вырезаем
+    # URL_STRIP_PARAMS ("ref,from" — параметры через запятую, "aff_*" — по префиксу)
+    URL_STRIP_PARAMS = os.environ.get("URL_STRIP_PARAMS", "")
+
+    # Загрузка страниц потоком (scraper.download_page): тело больше FETCH_MAX_BYTES байт
+    # не дочитывается (разбираем начало), а при FETCH_EARLY_STOP=1 чтение останавливается,
+    # как только цена нашлась в <head> (meta-теги, JSON-LD) или в JSON-LD в начале <body>.
+    # Остаток до FETCH_DRAIN_BYTES дочитывается вхолостую, чтобы соединение HTTP/1.1 осталось в keep-alive
+    FETCH_MAX_BYTES = int(os.environ.get("FETCH_MAX_BYTES", 5 * 1024 * 1024))
+    FETCH_EARLY_STOP = os.environ.get("FETCH_EARLY_STOP", "1") == "1"
+    FETCH_DRAIN_BYTES = int(os.environ.get("FETCH_DRAIN_BYTES", 64 * 1024))
@@ -0,0 +1,244 @@
+# engine.py
+# Конкурентный движок загрузки цен.
+# - сетевой I/O выполняется в пуле потоков (глобальный лимит = размер пула);
+# - на каждый хост действует собственный лимит одновременных запросов;
+# - разбор HTML (BeautifulSoup) вынесен в пул процессов, чтобы CPU не тормозил загрузки;
+# - страницы, где цену рисует JavaScript, дорисовываются в headless-браузере (browser.py) —
+#   только для помеченных доменов или если обычный разбор цену не нашёл
+#   (либо нашёл лишь число в тексте страницы — часто это не та цена).
+import logging
+import atexit
+import multiprocessing
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+from scraper import FetchResult, EARLY_STRATEGIES, download_page, parse_price_html, apply_parsed_price
+from rules import domain_key
+from browser import WEAK_STRATEGIES, get_browser_pool
+
+logger = logging.getLogger(__name__)
+
+
+def host_of(url):
+    """Хост ссылки в нижнем регистре (пустая строка, если URL кривой)"""
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+class FetchEngine:
+    """
+    Пул для параллельной загрузки цен.
+    - max_concurrency: сколько запросов одновременно во всём процессе;
+    - per_host: сколько одновременных запросов к одному хосту;
+    - parse_workers: число процессов для парсинга (0 — парсим прямо в потоке загрузки);
+    - browser: пул браузеров (browser.BrowserPool) или None; browser_domains — домены,
+      которые всегда рендерятся браузером.
+    """
+
+    def __init__(self, max_concurrency=16, per_host=4, parse_workers=2, timeout=15,
+                 browser=None, browser_domains=()):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.per_host = max(1, int(per_host))
+        self.parse_workers = max(0, int(parse_workers))
+        self.timeout = timeout
+        self.browser = browser
+        self.browser_domains = {domain_key(d) for d in browser_domains if d}
+        # отдельные потоки под браузер: медленные JS-страницы не занимают потоки загрузки
+        self._browser_pool = None
+        # домены, где браузер не нашёл ничего лучше текста страницы: туда браузер больше не ходит
+        self._static_ok = OrderedDict()
+        if browser is not None:
+            self._browser_pool = ThreadPoolExecutor(max_workers=browser.max_tabs, thread_name_prefix="browser")
+
+        self._io_pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="fetch")
+        self._parse_pool = None
+        if self.parse_workers:
+            # spawn вместо fork: процесс веб-приложения многопоточный (APScheduler, пул загрузок)
+            ctx = multiprocessing.get_context("spawn")
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=ctx)
+
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, host):
+        with self._lock:
+            sem = self._host_slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._host_slots[host] = sem
+            return sem
+
+    def _download(self, url, sem, validators, early_stop=None):
+        try:
+            return download_page(
+                url,
+                timeout=self.timeout,
+                etag=validators.get("etag"),
+                last_modified=validators.get("last_modified"),
+                known_hash=validators.get("content_hash"),
+                early_stop=early_stop,
+            )
+        finally:
+            sem.release()
+
+    def _parse(self, html, hint):
+        if self._parse_pool is None:
+            return self._io_pool.submit(parse_price_html, html, hint)
+        return self._parse_pool.submit(parse_price_html, html, hint)
+
+    def _js_domain(self, host, hint):
+        return domain_key(host) in self.browser_domains or (hint is not None and hint[0] == "browser")
+
+    def _needs_browser(self, host, hint, parsed):
+        """
+        После обычного разбора: браузер — для JS-доменов, если цена не найдена или найдена
+        только в тексте страницы (кроме доменов, где браузер уже не помог)
+        """
+        if self.browser is None:
+            return False
+        if parsed[0] is None or self._js_domain(host, hint):
+            return True
+        with self._lock:
+            return parsed[1] in WEAK_STRATEGIES and domain_key(host) not in self._static_ok
+
+    def _browser_useless(self, host):
+        with self._lock:
+            self._static_ok[domain_key(host)] = True
+            self._static_ok.move_to_end(domain_key(host))
+            if len(self._static_ok) > 10000:
+                self._static_ok.popitem(last=False)
+
+    def fetch_many(self, urls, validators=None, rules=None):
+        """
+        Загружаем все ссылки параллельно и возвращаем {url: FetchResult}.
+        Одинаковые URL скачиваются один раз.
+        validators: {url: {"etag", "last_modified", "content_hash"}} прошлой загрузки —
+        для условного GET; на 304 или неизменном теле парсинг пропускается.
+        rules: кэш выученных правил (rules.RuleCache) — правило домена уходит в парсер
+        подсказкой, а сработавшая стратегия записывается обратно.
+        Если обычный разбор не нашёл цену (или домен помечен как JS-only), страница
+        дорисовывается в браузере; результат браузера без цены уступает результату разбора.
+        Слот хоста занимается без блокировки: если хост уже занят, его очередь
+        просто ждёт, а поток пула уходит на другой хост (нет head-of-line блокировки).
+        Слоты общие для всех вызовов (обход и пакет «Обновить» идут параллельно): если
+        все нужные слоты заняты чужими загрузками, ждём освобождения, а не выходим.
+        """
+        queues = OrderedDict()
+        for url in OrderedDict.fromkeys(urls):
+            queues.setdefault(host_of(url), deque()).append(url)
+
+        validators = validators or {}
+        results = {}
+        inflight = {}  # future -> ("download" | "parse" | "browser", url)
+        static = {}  # url -> результат обычного разбора, пока страница в браузере
+        early_stop = {}  # host -> можно ли дочитывать страницу только до цены (см. scraper.download_page)
+
+        def submit(host, sem):
+            if host not in early_stop:
+                # выученное правило из <body> (itemprop, class/id, браузер) — страницу дочитываем целиком
+                hint = rules.hint(host) if rules is not None else None
+                early_stop[host] = None if hint is None or hint[0] in EARLY_STRATEGIES else False
+            url = queues[host].popleft()
+            fut = self._io_pool.submit(self._download, url, sem, validators.get(url) or {}, early_stop[host])
+            inflight[fut] = ("download", url)
+            if not queues[host]:
+                del queues[host]
+
+        while queues or inflight:
+            # раздаём задачи всем хостам, у которых есть свободный слот
+            for host in list(queues):
+                sem = self._slot(host)
+                while host in queues and sem.acquire(blocking=False):
+                    submit(host, sem)
+
+            if not inflight:
+                # своих загрузок нет, а слоты хостов заняты другими вызовами — ждём первый слот
+                host = next(iter(queues))
+                sem = self._slot(host)
+                if sem.acquire(timeout=0.2):
+                    submit(host, sem)
+                continue
+
+            done, _ = wait(list(inflight), timeout=0.5, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, url = inflight.pop(fut)
+                host = host_of(url)
+                try:
+                    value = fut.result()
+                except Exception as e:
+                    logger.warning("%s error for %s: %s", kind, url, e)
+                    if kind == "browser" and url in static:
+                        # браузер упал — остаёмся с тем, что нашёл обычный разбор
+                        self._finish(results[url], static.pop(url), host, rules)
+                    else:
+                        results[url] = FetchResult(error=f"{kind} error: {e}")
+                    continue
+
+                hint = rules.hint(host) if rules is not None and kind != "browser" else None
+                if kind == "download":
+                    results[url] = value
+                    if value.status != "downloaded":
+                        continue
+                    if self.browser is not None and self._js_domain(host, hint):
+                        # JS-only домен: статический разбор заведомо бесполезен
+                        static[url] = (None, None, None)
+                        inflight[self._browser_pool.submit(self.browser.render_price, url)] = ("browser", url)
+                    else:
+                        inflight[self._parse(value.html, hint)] = ("parse", url)
+                elif kind == "parse" and self._needs_browser(host, hint, value):
+                    static[url] = value
+                    results[url].html = None
+                    inflight[self._browser_pool.submit(self.browser.render_price, url)] = ("browser", url)
+                elif kind == "parse":
+                    self._finish(results[url], value, host, rules)
+                else:
+                    fallback = static.pop(url, None)
+                    if fallback is not None and fallback[0] is not None and value[2] in WEAK_STRATEGIES:
+                        # браузер не нашёл ничего надёжнее текста страницы — остаёмся с разбором
+                        self._browser_useless(host)
+                        value = fallback
+                    self._finish(results[url], value, host, rules)
+
+        return results
+
+    @staticmethod
+    def _finish(result, parsed, host, rules):
+        apply_parsed_price(result, parsed)
+        if rules is not None:
+            rules.record(host, result.strategy, result.selector)
+
+    def shutdown(self):
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+        if self._browser_pool is not None:
+            self._browser_pool.shutdown(wait=False, cancel_futures=True)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(config=None):
+    """
+    Общий движок на процесс. Создаётся лениво при первом обращении;
+    параметры берутся из config (app.config или Config), если он передан.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            config = config or {}
+            _engine = FetchEngine(
+                max_concurrency=config.get("FETCH_CONCURRENCY", 16),
+                per_host=config.get("FETCH_PER_HOST", 4),
+                parse_workers=config.get("PARSE_WORKERS", 2),
+                timeout=config.get("FETCH_TIMEOUT", 15),
+                browser=get_browser_pool(config),
+                browser_domains=[d.strip() for d in config.get("BROWSER_DOMAINS", "").split(",")],
+            )
+            atexit.register(_engine.shutdown)
+        return _engine
@@ -0,0 +1,184 @@
+# history.py
+# Уплотнение и срок хранения истории цен, чтобы таблицы и их индексы оставались небольшими:
+# - отрезки PriceHistory старше HISTORY_RAW_DAYS сворачиваются в часовые бакеты (PriceBucket);
+#   последний отрезок ссылки не сворачивается никогда — от него PriceWriter продлевает историю;
+# - часовые бакеты старше HISTORY_HOURLY_DAYS — в суточные;
+# - суточные бакеты старше HISTORY_RETENTION_DAYS удаляются.
+# Работает пачками по HISTORY_COMPACT_CHUNK строк (одна транзакция на пачку),
+# запускается планировщиком (compact_history) или воркером с --enqueue.
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, exists, func, or_, select, tuple_
+
+from models import db, PriceHistory, PriceBucket
+
+history_table = PriceHistory.__table__
+buckets_table = PriceBucket.__table__
+
+
+def bucket_start(ts, resolution):
+    """Начало часа или суток, в которые попадает ts"""
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _merge(agg, price_min, price_max, avg, samples, last_seen):
+    """Добавляем к бакету agg значения другого бакета (или отрезка)"""
+    total = agg["samples"] + samples
+    if agg["samples"] and agg["avg_price"] is not None and avg is not None:
+        agg["avg_price"] = (agg["avg_price"] * agg["samples"] + avg * samples) / total
+    elif avg is not None:
+        agg["avg_price"] = avg
+    agg["min_price"] = price_min if agg["min_price"] is None else min(agg["min_price"], price_min)
+    agg["max_price"] = price_max if agg["max_price"] is None else max(agg["max_price"], price_max)
+    agg["samples"] = total
+    if last_seen is not None and (agg["last_seen_at"] is None or last_seen > agg["last_seen_at"]):
+        agg["last_seen_at"] = last_seen
+
+
+def _store_buckets(resolution, aggs):
+    """
+    Пишем бакеты {(link_id, bucket_start): agg}: существующие (бакет уже частично
+    заполнен прошлым проходом) дополняем, новые вставляем.
+    """
+    keys = list(aggs)
+    existing = db.session.execute(
+        select(buckets_table)
+        .where(buckets_table.c.resolution == resolution)
+        .where(tuple_(buckets_table.c.link_id, buckets_table.c.bucket_start).in_(keys))
+    ).mappings().all()
+
+    updates = []
+    for row in existing:
+        agg = aggs.pop((row["link_id"], row["bucket_start"]))
+        merged = {"min_price": row["min_price"], "max_price": row["max_price"], "avg_price": row["avg_price"],
+                  "samples": row["samples"] or 0, "last_seen_at": row["last_seen_at"]}
+        _merge(merged, agg["min_price"], agg["max_price"], agg["avg_price"], agg["samples"], agg["last_seen_at"])
+        merged["_id"] = row["id"]
+        updates.append(merged)
+    if updates:
+        db.session.execute(
+            buckets_table.update().where(buckets_table.c.id == bindparam("_id"))
+            .values(min_price=bindparam("min_price"), max_price=bindparam("max_price"),
+                    avg_price=bindparam("avg_price"), samples=bindparam("samples"),
+                    last_seen_at=bindparam("last_seen_at")),
+            updates,
+        )
+    if aggs:
+        db.session.execute(buckets_table.insert(), [
+            dict(agg, link_id=link_id, resolution=resolution, bucket_start=start)
+            for (link_id, start), agg in aggs.items()
+        ])
+
+
+def _new_agg():
+    return {"min_price": None, "max_price": None, "avg_price": None, "samples": 0, "last_seen_at": None}
+
+
+def compact_raw(border, chunk):
+    """
+    Отрезки, закончившиеся раньше border, — в часовые бакеты. Возвращаем число свёрнутых строк.
+    Текущий (последний) отрезок ссылки остаётся: без него queries.latest_runs ничего не вернёт,
+    и следующая та же цена записалась бы как изменение (None -> цена) с ложными уведомлениями.
+    """
+    last_seen = func.coalesce(history_table.c.last_seen_at, history_table.c.checked_at)
+    newer = history_table.alias("newer")
+    # тот же порядок «последнего», что и в queries._latest_runs: checked_at, затем id
+    not_latest = exists().where(and_(
+        newer.c.link_id == history_table.c.link_id,
+        or_(newer.c.checked_at > history_table.c.checked_at,
+            and_(newer.c.checked_at == history_table.c.checked_at, newer.c.id > history_table.c.id)),
+    ))
+    done = 0
+    while True:
+        rows = db.session.execute(
+            select(history_table.c.id, history_table.c.link_id, history_table.c.price,
+                   history_table.c.checked_at, last_seen.label("last_seen_at"),
+                   func.coalesce(history_table.c.samples, 1).label("samples"))
+            .where(history_table.c.checked_at < border)  # по индексу: last_seen_at >= checked_at
+            .where(last_seen < border)
+            .where(not_latest)
+            .order_by(history_table.c.id)
+            .limit(chunk)
+        ).all()
+        if not rows:
+            return done
+
+        aggs = {}
+        for r in rows:
+            if r.price is None:
+                continue
+            agg = aggs.setdefault((r.link_id, bucket_start(r.checked_at, "hour")), _new_agg())
+            _merge(agg, r.price, r.price, r.price, r.samples, r.last_seen_at)
+        if aggs:
+            _store_buckets("hour", aggs)
+        db.session.execute(history_table.delete().where(history_table.c.id.in_([r.id for r in rows])))
+        db.session.commit()
+        done += len(rows)
+
+
+def compact_hourly(border, chunk):
+    """Часовые бакеты раньше border — в суточные. Возвращаем число свёрнутых бакетов"""
+    done = 0
+    while True:
+        rows = db.session.execute(
+            select(buckets_table)
+            .where(buckets_table.c.resolution == "hour")
+            .where(buckets_table.c.bucket_start < border)
+            .order_by(buckets_table.c.id)
+            .limit(chunk)
+        ).mappings().all()
+        if not rows:
+            return done
+
+        aggs = {}
+        for r in rows:
+            agg = aggs.setdefault((r["link_id"], bucket_start(r["bucket_start"], "day")), _new_agg())
+            _merge(agg, r["min_price"], r["max_price"], r["avg_price"], r["samples"] or 0, r["last_seen_at"])
+        _store_buckets("day", aggs)
+        db.session.execute(buckets_table.delete().where(buckets_table.c.id.in_([r["id"] for r in rows])))
+        db.session.commit()
+        done += len(rows)
+
+
+def apply_retention(border):
+    """Удаляем суточные бакеты раньше border. Возвращаем число удалённых"""
+    result = db.session.execute(
+        buckets_table.delete()
+        .where(buckets_table.c.resolution == "day")
+        .where(buckets_table.c.bucket_start < border)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def compact_history(config, now=None):
+    """
+    Один проход уплотнения по настройкам HISTORY_* (нужен app context).
+    Возвращаем {"raw": свёрнуто отрезков, "hourly": свёрнуто часовых, "expired": удалено суточных}.
+    """
+    now = now or datetime.utcnow()
+    chunk = config.get("HISTORY_COMPACT_CHUNK", 20000)
+    raw_days = config.get("HISTORY_RAW_DAYS", 7)
+    hourly_days = config.get("HISTORY_HOURLY_DAYS", 90)
+    retention_days = config.get("HISTORY_RETENTION_DAYS", 730)
+
+    stats = {"raw": 0, "hourly": 0, "expired": 0}
+    if raw_days > 0:
+        # бакет часа должен быть полным: режем по границе часа
+        stats["raw"] = compact_raw(bucket_start(now - timedelta(days=raw_days), "hour"), chunk)
+        stats["hourly"] = compact_hourly(bucket_start(now - timedelta(days=max(hourly_days, raw_days)), "day"), chunk)
+    if retention_days > 0:
+        stats["expired"] = apply_retention(now - timedelta(days=retention_days))
+    return stats
+
+
+def history_size():
+    """Размер таблиц истории: {"runs": строк PriceHistory, "hour": ..., "day": ...}"""
+    out = {"runs": db.session.execute(select(func.count()).select_from(history_table)).scalar()}
+    for resolution, n in db.session.execute(
+        select(buckets_table.c.resolution, func.count()).group_by(buckets_table.c.resolution)
+    ):
+        out[resolution] = n
+    return out
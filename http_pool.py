@@ -0,0 +1,205 @@
+# http_pool.py
+# Общий пул HTTP-соединений для скрейпера.
+# - на каждый хост свой httpx.Client с keep-alive и ограниченным числом соединений;
+# - HTTP/2 включается, если установлен пакет h2 и сервер его поддерживает;
+# - считаем запросы, новые TCP-соединения и TLS-рукопожатия, чтобы видеть переиспользование;
+# - по событиям httpcore меряем фазы запроса (connect, tls, ttfb, download) для /metrics.
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import Config
+from metrics import FETCH_PHASE_SECONDS
+
+try:
+    import h2  # noqa: F401  — нужен httpx для HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HostPool:
+    """
+    Набор клиентов httpx по хостам.
+    - per_host: максимум соединений к одному хосту (и столько же держим в keep-alive);
+    - max_hosts: сколько клиентов держим открытыми, самые давно неиспользуемые закрываются
+      (клиент, на котором ещё идёт запрос, закрывается, когда запрос завершится);
+    - keepalive_expiry: сколько секунд держать простаивающее соединение.
+    """
+
+    def __init__(self, headers=None, per_host=4, max_hosts=256, keepalive_expiry=60.0, http2=True):
+        self.headers = dict(headers or {})
+        self.per_host = max(1, int(per_host))
+        self.max_hosts = max(1, int(max_hosts))
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = bool(http2) and HTTP2_AVAILABLE
+
+        self._clients = OrderedDict()  # host -> httpx.Client (в порядке LRU)
+        self._busy = {}  # httpx.Client -> число идущих на нём запросов
+        self._retired = set()  # вытеснены из _clients, но ещё заняты: закрываем после запроса
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "tls_handshakes": 0,
+            "http2_responses": 0,
+            "clients_evicted": 0,
+        }
+
+    @contextmanager
+    def _lease(self, url):
+        """Клиент хоста на время запроса: пока он занят, вытеснение его не закрывает"""
+        client = self._client(url)
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._busy[client] -= 1
+                idle = not self._busy[client]
+                if idle:
+                    del self._busy[client]
+                close = idle and client in self._retired
+                if close:
+                    self._retired.discard(client)
+            if close:
+                client.close()
+
+    def _client(self, url):
+        """Клиент хоста, помеченный занятым (освобождает _lease)"""
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{(parts.hostname or '').lower()}:{parts.port or ''}"
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self._busy[client] = self._busy.get(client, 0) + 1
+                return client
+
+            client = httpx.Client(
+                headers=self.headers,
+                http2=self.http2,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.per_host,
+                    max_keepalive_connections=self.per_host,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            self._clients[key] = client
+            self._busy[client] = 1
+
+            idle = []
+            while len(self._clients) > self.max_hosts:
+                _, old = self._clients.popitem(last=False)
+                self._stats["clients_evicted"] += 1
+                if old in self._busy:
+                    self._retired.add(old)
+                else:
+                    idle.append(old)
+        for old in idle:
+            old.close()
+        return client
+
+    def _trace(self, event_name, info):
+        # httpcore сообщает о каждом новом соединении и TLS-рукопожатии;
+        # запрос без этих событий ушёл по уже открытому соединению
+        if event_name == "connection.connect_tcp.complete":
+            self._count("connections_opened")
+        elif event_name == "connection.start_tls.complete":
+            self._count("tls_handshakes")
+
+    # событие httpcore (без префикса http11./http2.) -> фаза в метриках
+    PHASES = {
+        "connection.connect_tcp": "connect",  # DNS + TCP: httpcore резолвит имя внутри connect
+        "connection.start_tls": "tls",
+        "receive_response_headers": "ttfb",
+        "receive_response_body": "download",
+    }
+
+    def _request_trace(self):
+        """trace-колбэк для одного запроса: считает соединения и время фаз"""
+        started = {}
+
+        def trace(event_name, info):
+            self._trace(event_name, info)
+            base, _, stage = event_name.rpartition(".")
+            if base.startswith(("http11.", "http2.")):
+                base = base.split(".", 1)[1]
+            phase = self.PHASES.get(base)
+            if phase is None:
+                return
+            if stage == "started":
+                started[phase] = time.perf_counter()
+            elif stage in ("complete", "failed") and phase in started:
+                FETCH_PHASE_SECONDS.observe(time.perf_counter() - started.pop(phase), phase=phase)
+
+        return trace
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def get(self, url, timeout=15, headers=None):
+        """GET через пул соединений хоста; исключения httpx пробрасываются вызывающему"""
+        self._count("requests")
+        with self._lease(url) as client:
+            resp = client.get(url, headers=headers, timeout=timeout, extensions={"trace": self._request_trace()})
+        if resp.http_version == "HTTP/2":
+            self._count("http2_responses")
+        return resp
+
+    @contextmanager
+    def stream(self, url, timeout=15, headers=None):
+        """
+        GET без чтения тела: внутри with доступны статус и заголовки, тело читается
+        по частям (resp.iter_bytes()). Недочитанный ответ закрывается на выходе из with.
+        """
+        self._count("requests")
+        with self._lease(url) as client, client.stream("GET", url, headers=headers, timeout=timeout,
+                                                       extensions={"trace": self._request_trace()}) as resp:
+            if resp.http_version == "HTTP/2":
+                self._count("http2_responses")
+            yield resp
+
+    def stats(self):
+        """Снимок счётчиков: сколько соединений переиспользовано и рукопожатий сэкономлено"""
+        with self._lock:
+            s = dict(self._stats)
+            s["open_clients"] = len(self._clients)
+        s["http2_enabled"] = self.http2
+        s["connections_reused"] = max(0, s["requests"] - s["connections_opened"])
+        s["handshakes_saved"] = s["connections_reused"]
+        s["reuse_ratio"] = round(s["connections_reused"] / s["requests"], 3) if s["requests"] else 0.0
+        return s
+
+    def close(self):
+        with self._lock:
+            clients = [c for c in self._clients.values() if c not in self._busy]
+            self._retired.update(c for c in self._clients.values() if c in self._busy)
+            self._clients.clear()
+        for c in clients:
+            c.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Общий пул на процесс (создаётся при первом запросе)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from scraper import HEADERS
+            _pool = HostPool(
+                headers=HEADERS,
+                per_host=Config.HTTP_POOL_PER_HOST,
+                max_hosts=Config.HTTP_POOL_MAX_HOSTS,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+                http2=Config.HTTP2_ENABLED,
+            )
+        return _pool
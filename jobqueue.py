@@ -0,0 +1,308 @@
+# jobqueue.py
+# Очередь заданий «проверить ссылку» для распределённого режима:
+# веб-процессы (или отдельный enqueuer) только ставят задания,
+# воркеры (worker.py) на любых машинах забирают их с арендой (lease).
+# - DBJobQueue   — таблица fetch_jobs в общей базе (SQLite/PostgreSQL);
+# - MemoryJobQueue — то же в памяти одного процесса (для разработки и embedded-режима).
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, FetchJob, ProductLink
+
+jobs_table = FetchJob.__table__
+
+
+class DBJobQueue:
+    """
+    Очередь на таблице fetch_jobs.
+    Захват атомарен: один UPDATE ... WHERE id IN (кандидаты) AND (задание всё ещё свободно).
+    В SQLite запись сериализуется блокировкой базы, в PostgreSQL кандидаты выбираются
+    с FOR UPDATE SKIP LOCKED — в обоих случаях задание достаётся ровно одному воркеру.
+    Аренда истекла (воркер умер) — задание снова можно забрать; после max_attempts
+    захватов оно помечается failed.
+    """
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+
+    def enqueue(self, link_ids, batch_id=None):
+        """
+        Ставим ссылки в очередь; уже стоящие там новых заданий не получают. Возвращаем число новых заданий.
+        С batch_id активные задания этих ссылок (плановые или из прошлой пачки) переходят в пачку:
+        её статус покрывает все ссылки, а плановые задания получают приоритет ручных.
+        """
+        link_ids = list(dict.fromkeys(link_ids))
+        if not link_ids:
+            return 0
+        added = self._insert(link_ids, batch_id)
+        if batch_id is not None:
+            self._adopt(link_ids, batch_id)
+        return added
+
+    def _adopt(self, link_ids, batch_id):
+        db.session.execute(
+            jobs_table.update()
+            .where(jobs_table.c.active_link_id.in_(link_ids))
+            .where(or_(jobs_table.c.batch_id.is_(None), jobs_table.c.batch_id != batch_id))
+            .values(batch_id=batch_id)
+        )
+        db.session.commit()
+
+    def _insert(self, link_ids, batch_id):
+        active = set(db.session.execute(
+            select(jobs_table.c.active_link_id).where(jobs_table.c.active_link_id.in_(link_ids))
+        ).scalars())
+        now = datetime.utcnow()
+        rows = [
+            {"link_id": i, "active_link_id": i, "batch_id": batch_id, "status": "queued",
+             "attempts": 0, "enqueued_at": now}
+            for i in link_ids if i not in active
+        ]
+        if not rows:
+            return 0
+        try:
+            db.session.execute(jobs_table.insert(), rows)
+            db.session.commit()
+            return len(rows)
+        except IntegrityError:
+            # гонка с другим enqueuer'ом — вставляем по одной, дубликаты отбрасывает уникальный индекс
+            db.session.rollback()
+            added = 0
+            for row in rows:
+                try:
+                    db.session.execute(jobs_table.insert(), [row])
+                    db.session.commit()
+                    added += 1
+                except IntegrityError:
+                    db.session.rollback()
+            return added
+
+    def claim(self, worker_id, limit=50, lease_seconds=300, batch_id=None):
+        """
+        Забираем до limit заданий в аренду. Возвращаем [(job_id, link_id)].
+        Задания из ручных пачек (с batch_id) идут раньше плановых;
+        batch_id — забрать только задания этой пачки.
+        """
+        now = datetime.utcnow()
+        token = f"{worker_id}:{uuid.uuid4().hex}"
+        claimable = and_(
+            jobs_table.c.attempts < self.max_attempts,
+            or_(jobs_table.c.status == "queued",
+                and_(jobs_table.c.status == "leased", jobs_table.c.lease_until < now)),
+        )
+        if batch_id is not None:
+            claimable = and_(claimable, jobs_table.c.batch_id == batch_id)
+        candidates = (select(jobs_table.c.id).where(claimable)
+                      .order_by(jobs_table.c.batch_id.is_(None), jobs_table.c.id).limit(limit))
+        if db.engine.dialect.name == "postgresql":
+            candidates = candidates.with_for_update(skip_locked=True)
+
+        db.session.execute(
+            jobs_table.update()
+            .where(jobs_table.c.id.in_(candidates))
+            .where(claimable)
+            .values(status="leased", lease_token=token,
+                    lease_until=now + timedelta(seconds=lease_seconds),
+                    attempts=jobs_table.c.attempts + 1)
+        )
+        db.session.commit()
+        return [tuple(r) for r in db.session.execute(
+            select(jobs_table.c.id, jobs_table.c.link_id).where(jobs_table.c.lease_token == token)
+        )]
+
+    def _finish(self, job_ids, status, error=None):
+        if not job_ids:
+            return
+        db.session.execute(
+            jobs_table.update().where(jobs_table.c.id.in_(list(job_ids)))
+            .values(status=status, active_link_id=None, lease_until=None,
+                    error=(error or None) and str(error)[:512], finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def complete(self, job_ids):
+        """Задания выполнены"""
+        self._finish(job_ids, "done")
+
+    def release(self, job_ids, error=None):
+        """Воркер не справился: возвращаем в очередь (или failed, если попытки кончились)"""
+        if not job_ids:
+            return
+        job_ids = list(job_ids)
+        db.session.execute(
+            jobs_table.update()
+            .where(jobs_table.c.id.in_(job_ids))
+            .where(jobs_table.c.attempts < self.max_attempts)
+            .values(status="queued", lease_token=None, lease_until=None,
+                    error=(error or None) and str(error)[:512])
+        )
+        db.session.commit()
+        exhausted = db.session.execute(
+            select(jobs_table.c.id).where(jobs_table.c.id.in_(job_ids))
+            .where(jobs_table.c.attempts >= self.max_attempts)
+            .where(jobs_table.c.status == "leased")
+        ).scalars().all()
+        self._finish(exhausted, "failed", error)
+
+    def cleanup(self, keep_seconds=3600):
+        """Удаляем завершённые задания старше keep_seconds; «мёртвые» аренды без попыток — в failed"""
+        now = datetime.utcnow()
+        dead = db.session.execute(
+            select(jobs_table.c.id)
+            .where(jobs_table.c.status == "leased")
+            .where(jobs_table.c.lease_until < now)
+            .where(jobs_table.c.attempts >= self.max_attempts)
+        ).scalars().all()
+        self._finish(dead, "failed", "lease expired")
+        db.session.execute(
+            jobs_table.delete()
+            .where(jobs_table.c.status.in_(("done", "failed")))
+            .where(jobs_table.c.finished_at < now - timedelta(seconds=keep_seconds))
+        )
+        db.session.commit()
+
+    def batch_status(self, batch_id):
+        """Задания пачки: [{"id", "link_id", "status", "error"}]"""
+        rows = db.session.execute(
+            select(jobs_table.c.id, jobs_table.c.link_id, jobs_table.c.status, jobs_table.c.error)
+            .where(jobs_table.c.batch_id == batch_id).order_by(jobs_table.c.id)
+        ).all()
+        return [{"id": r.id, "link_id": r.link_id, "status": r.status, "error": r.error} for r in rows]
+
+    def stats(self):
+        rows = db.session.execute(
+            select(jobs_table.c.status, func.count()).group_by(jobs_table.c.status)
+        ).all()
+        return {status: n for status, n in rows}
+
+
+class MemoryJobQueue:
+    """
+    Та же очередь в памяти процесса — для разработки и одиночного запуска.
+    Между процессами не работает: воркеры на других машинах её не видят.
+    """
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+        self._jobs = {}    # job_id -> dict
+        self._active = {}  # link_id -> job_id
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def enqueue(self, link_ids, batch_id=None):
+        added = 0
+        with self._lock:
+            for link_id in dict.fromkeys(link_ids):
+                if link_id in self._active:
+                    if batch_id is not None:
+                        # как в DBJobQueue: активное задание переходит в новую пачку
+                        self._jobs[self._active[link_id]]["batch_id"] = batch_id
+                    continue
+                job_id = self._next_id
+                self._next_id += 1
+                self._jobs[job_id] = {"id": job_id, "link_id": link_id, "batch_id": batch_id,
+                                      "status": "queued", "attempts": 0, "lease_until": None,
+                                      "error": None, "enqueued_at": datetime.utcnow(), "finished_at": None}
+                self._active[link_id] = job_id
+                added += 1
+        return added
+
+    def claim(self, worker_id, limit=50, lease_seconds=300, batch_id=None):
+        now = datetime.utcnow()
+        out = []
+        with self._lock:
+            # ручные пачки раньше плановых, как и в DBJobQueue
+            for job in sorted(self._jobs.values(), key=lambda j: (j["batch_id"] is None, j["id"])):
+                if len(out) >= limit:
+                    break
+                if batch_id is not None and job["batch_id"] != batch_id:
+                    continue
+                free = job["status"] == "queued" or (job["status"] == "leased" and job["lease_until"] < now)
+                if free and job["attempts"] < self.max_attempts:
+                    job.update(status="leased", lease_until=now + timedelta(seconds=lease_seconds),
+                               attempts=job["attempts"] + 1)
+                    out.append((job["id"], job["link_id"]))
+        return out
+
+    def _finish(self, job_ids, status, error=None):
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job.update(status=status, lease_until=None, error=error, finished_at=datetime.utcnow())
+                self._active.pop(job["link_id"], None)
+
+    def complete(self, job_ids):
+        self._finish(job_ids, "done")
+
+    def release(self, job_ids, error=None):
+        exhausted = []
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if job["attempts"] < self.max_attempts:
+                    job.update(status="queued", lease_until=None, error=error)
+                else:
+                    exhausted.append(job_id)
+        self._finish(exhausted, "failed", error)
+
+    def cleanup(self, keep_seconds=3600):
+        border = datetime.utcnow() - timedelta(seconds=keep_seconds)
+        with self._lock:
+            for job_id in [j["id"] for j in self._jobs.values()
+                           if j["finished_at"] is not None and j["finished_at"] < border]:
+                del self._jobs[job_id]
+
+    def batch_status(self, batch_id):
+        with self._lock:
+            return [{"id": j["id"], "link_id": j["link_id"], "status": j["status"], "error": j["error"]}
+                    for j in self._jobs.values() if j["batch_id"] == batch_id]
+
+    def stats(self):
+        out = {}
+        with self._lock:
+            for job in self._jobs.values():
+                out[job["status"]] = out.get(job["status"], 0) + 1
+        return out
+
+
+def enqueue_due_links(queue, limit=500):
+    """Ставим в очередь ссылки, у которых наступил next_check_at (или его ещё нет)"""
+    now = datetime.utcnow()
+    ids = db.session.execute(
+        select(ProductLink.id)
+        .where(or_(ProductLink.next_check_at.is_(None), ProductLink.next_check_at <= now))
+        .where(ProductLink.id.notin_(
+            select(jobs_table.c.active_link_id).where(jobs_table.c.active_link_id.isnot(None))
+        ))
+        .order_by(ProductLink.next_check_at)
+        .limit(limit)
+    ).scalars().all()
+    return queue.enqueue(ids)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue(config):
+    """Очередь процесса: JOB_QUEUE_BACKEND = "db" (по умолчанию) или "memory" """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            backend = config.get("JOB_QUEUE_BACKEND", "db")
+            max_attempts = config.get("JOB_MAX_ATTEMPTS", 3)
+            if backend == "memory":
+                _queue = MemoryJobQueue(max_attempts=max_attempts)
+            elif backend == "db":
+                _queue = DBJobQueue(max_attempts=max_attempts)
+            else:
+                raise ValueError(f"unknown JOB_QUEUE_BACKEND: {backend}")
+        return _queue
@@ -0,0 +1,61 @@
+# logs.py
+# Логирование вместо print: уровни (LOG_LEVEL) и ограничение частоты одинаковых сообщений.
+# Одинаковыми считаются записи одного логгера, уровня и шаблона сообщения
+# (поэтому в коде — logger.info("... %s", x), а не f-строки): за LOG_RATE_WINDOW секунд
+# проходит не больше LOG_RATE_BURST таких записей, остальные подавляются,
+# а их число дописывается к первой записи следующего окна.
+import logging
+import threading
+import time
+
+FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst=20, window=60.0):
+        super().__init__()
+        self.burst = max(1, int(burst))
+        self.window = window
+        self._state = {}  # key -> [начало окна, пропущено записей, подавлено записей]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR and record.exc_info:
+            return True  # ошибки с трассировкой не режем
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if len(self._state) > 10000:
+                    self._forget(now)
+                if suppressed:
+                    record.msg = f"{record.msg} (ещё {suppressed} таких сообщений подавлено)"
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+    def _forget(self, now):
+        for key in [k for k, s in self._state.items() if now - s[0] >= self.window and not s[2]]:
+            del self._state[key]
+
+
+def setup_logging(level="INFO", burst=20, window=60.0):
+    """Настраиваем корневой логгер процесса (повторный вызов ничего не дублирует)"""
+    root = logging.getLogger()
+    if getattr(root, "_pricewatcher_configured", False):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(FORMAT))
+    handler.addFilter(RateLimitFilter(burst=burst, window=window))
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    # шум сторонних библиотек — только предупреждения
+    for name in ("httpx", "httpcore", "apscheduler", "hpack"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    root._pricewatcher_configured = True
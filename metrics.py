@@ -0,0 +1,220 @@
+# metrics.py
+# Метрики скрейпера и планировщика в формате Prometheus (отдаются на /metrics).
+# Свой небольшой реестр без внешних зависимостей: счётчики, gauge и гистограммы с метками.
+# Метрики живут в памяти процесса: у веб-процесса и у каждого воркера свои
+# (воркер может отдавать их сам: python worker.py --metrics-port 9101).
+import threading
+from bisect import bisect_left
+
+from config import Config
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels {sorted(labels)} != {sorted(self.labelnames)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счётчики по бакетам (не накопительные) + переполнение, сумма, количество]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels):
+        """(количество, сумма) — для проверок и админки"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _num(float(bound))))} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labelnames=()):
+        return self._add(Counter(name, doc, labelnames))
+
+    def gauge(self, name, doc, labelnames=()):
+        return self._add(Gauge(name, doc, labelnames))
+
+    def histogram(self, name, doc, labelnames=(), buckets=None):
+        if buckets is None:
+            return self._add(Histogram(name, doc, labelnames))
+        return self._add(Histogram(name, doc, labelnames, buckets))
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# домены в метках: не больше METRICS_MAX_DOMAINS разных, остальные — "other"
+_domains = set()
+_domains_lock = threading.Lock()
+
+
+def domain_label(domain):
+    domain = domain or "unknown"
+    with _domains_lock:
+        if domain in _domains:
+            return domain
+        if len(_domains) < Config.METRICS_MAX_DOMAINS:
+            _domains.add(domain)
+            return domain
+    return "other"
+
+
+# --- загрузка и разбор ---
+FETCH_PHASE_SECONDS = REGISTRY.histogram(
+    "pricewatcher_fetch_phase_seconds",
+    "Время фаз проверки ссылки: connect (DNS+TCP), tls, ttfb, download, parse, db_commit",
+    ["phase"], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+RESPONSE_BYTES = REGISTRY.histogram(
+    "pricewatcher_response_bytes", "Прочитано байт тела ответа магазина (после распаковки)",
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+RESPONSES = REGISTRY.counter(
+    "pricewatcher_responses_total", "Ответы магазинов по доменам и HTTP-статусам (error — сетевая ошибка)",
+    ["domain", "status"])
+EXTRACTIONS = REGISTRY.counter(
+    "pricewatcher_extract_total", "Какая стратегия извлечения нашла цену (none — не нашла)", ["strategy"])
+FETCH_PEAK_BYTES = REGISTRY.histogram(
+    "pricewatcher_fetch_peak_bytes", "Пик памяти под тело одной страницы: буфер байтов + декодированный текст",
+    buckets=(16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864))
+BODY_CUTS = REGISTRY.counter(
+    "pricewatcher_body_cut_total",
+    "Тело страницы дочитано не до конца: early — цена уже в <head>/JSON-LD, limit — больше FETCH_MAX_BYTES",
+    ["reason"])
+FETCH_RESULTS = REGISTRY.counter(
+    "pricewatcher_fetch_results_total", "Итог проверки ссылки: ok, not_modified, unchanged, error", ["status"])
+
+# --- планировщик ---
+SWEEP_SECONDS = REGISTRY.histogram(
+    "pricewatcher_sweep_seconds", "Длительность прохода планировщика/воркера", ["kind"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+SWEEP_LINKS = REGISTRY.counter("pricewatcher_sweep_links_total", "Проверено ссылок", ["kind"])
+SWEEP_PAGES = REGISTRY.counter(
+    "pricewatcher_sweep_pages_total", "Скачано страниц (ссылки на одну страницу качаются один раз)", ["kind"])
+SWEEP_DEDUP_RATIO = REGISTRY.gauge(
+    "pricewatcher_sweep_dedup_ratio", "Ссылок на одну скачанную страницу в последнем проходе", ["kind"])
+SWEEP_INTERVAL_RATIO = REGISTRY.gauge(
+    "pricewatcher_sweep_interval_ratio",
+    "Длительность последнего прохода / его интервал (больше 1 — проходы не успевают)", ["kind"])
+SCHEDULE_LAG_SECONDS = REGISTRY.histogram(
+    "pricewatcher_schedule_lag_seconds", "Насколько позже next_check_at ссылка была проверена",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600))
+
+# --- веб ---
+PAGE_CACHE = REGISTRY.counter(
+    "pricewatcher_page_cache_total", "Фрагменты страниц из кэша (hit) и отрендеренные заново (miss)", ["result"])
+
+
+def observe_sweep(kind, seconds, links, interval=None, pages=None):
+    """Учёт одного прохода: длительность, число ссылок и страниц, отношение к интервалу"""
+    SWEEP_SECONDS.observe(seconds, kind=kind)
+    SWEEP_LINKS.inc(links, kind=kind)
+    if pages:
+        SWEEP_PAGES.inc(pages, kind=kind)
+        SWEEP_DEDUP_RATIO.set(round(links / pages, 4), kind=kind)
+    if interval:
+        SWEEP_INTERVAL_RATIO.set(round(seconds / interval, 4), kind=kind)
+
+
+def render():
+    return REGISTRY.render()
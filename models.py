@@ -1,10 +1,16 @@
 # models.py
-# SQLAlchemy-модели: User, Plan, Product, ProductLink, PriceHistory
+# SQLAlchemy-модели: User, Plan, Product, TrackedPage, ProductLink, PriceHistory
+import logging
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import ClauseElement
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
+logger = logging.getLogger(__name__)
+
 db = SQLAlchemy()
 
 class Plan(db.Model):
@@ -50,29 +56,272 @@ class Product(db.Model):
     __tablename__ = "products"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(256))  # пользовательский заголовок (опционально)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # денормализованные агрегаты по ссылкам — поддерживаются путём записи
+    # (persistence.PriceWriter, add_product) через refresh_product_aggregates()
+    current_min_price = db.Column(db.Float, nullable=True)
+    link_count = db.Column(db.Integer, default=0)
+
     links = db.relationship("ProductLink", backref="product", cascade="all,delete-orphan")
 
     def min_price(self):
-        """Возвращаем минимальную из последних цен по ссылкам (или None)."""
+        """Возвращаем минимальную из последних цен по ссылкам (или None). Дашборд берёт current_min_price."""
         prices = [ln.last_price for ln in self.links if ln.last_price is not None]
         return min(prices) if prices else None
 
+class TrackedPage(db.Model):
+    """
+    Страница магазина по каноническому адресу (urls.canonical_url).
+    Ссылки разных пользователей на одну карточку (в том числе с разными utm-метками)
+    ссылаются на одну TrackedPage: за проход она скачивается один раз, цена раздаётся всем ссылкам.
+    """
+    __tablename__ = "tracked_pages"
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(2000), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    links = db.relationship("ProductLink", backref="page")
+
+
 class ProductLink(db.Model):
     __tablename__ = "product_links"
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), index=True)
     url = db.Column(db.String(2000), nullable=False)
+    page_id = db.Column(db.Integer, db.ForeignKey("tracked_pages.id"), nullable=True, index=True)
     last_price = db.Column(db.Float, nullable=True)
     last_checked = db.Column(db.DateTime, nullable=True)
 
+    # валидаторы прошлой загрузки — для условного GET и пропуска парсинга неизменных страниц
+    etag = db.Column(db.String(256), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+
+    # адаптивное расписание: собственный интервал ссылки (сек) и срок следующей проверки
+    check_interval = db.Column(db.Integer, nullable=True)
+    next_check_at = db.Column(db.DateTime, nullable=True, index=True)
+
     histories = db.relationship("PriceHistory", backref="link", cascade="all,delete-orphan")
+    buckets = db.relationship("PriceBucket", backref="link", cascade="all,delete-orphan")
 
 class PriceHistory(db.Model):
+    """
+    История цен «по изменениям»: одна строка на отрезок, пока цена не менялась.
+    checked_at — когда цена впервые увидена, last_seen_at — последняя проверка
+    с той же ценой, samples — сколько проверок в отрезке (см. persistence.PriceWriter).
+    Старые отрезки сворачиваются в PriceBucket (history.compact_history).
+    """
     __tablename__ = "price_history"
     id = db.Column(db.Integer, primary_key=True)
     link_id = db.Column(db.Integer, db.ForeignKey("product_links.id"))
     price = db.Column(db.Float, nullable=True)
     checked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # у строк, записанных до хранения «по изменениям», NULL: считаем last_seen_at = checked_at, samples = 1
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    samples = db.Column(db.Integer, default=1)
+
+    __table_args__ = (
+        # «последние N записей ссылки» и история по ссылке — без полного скана таблицы
+        db.Index("ix_price_history_link_checked", "link_id", checked_at.desc()),
+        # выборки по времени (очистка/уплотнение старой истории)
+        db.Index("ix_price_history_checked_at", "checked_at"),
+    )
+
+
+class PriceBucket(db.Model):
+    """
+    Свёрнутая история: min/max/среднее цены ссылки за час или за сутки.
+    Отрезок PriceHistory попадает в бакет часа, в котором он начался;
+    среднее взвешено по числу проверок (samples).
+    """
+    __tablename__ = "price_buckets"
+    id = db.Column(db.Integer, primary_key=True)
+    link_id = db.Column(db.Integer, db.ForeignKey("product_links.id"), nullable=False)
+    resolution = db.Column(db.String(8), nullable=False)  # hour | day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    min_price = db.Column(db.Float, nullable=True)
+    max_price = db.Column(db.Float, nullable=True)
+    avg_price = db.Column(db.Float, nullable=True)
+    samples = db.Column(db.Integer, default=0)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("link_id", "resolution", "bucket_start", name="uq_price_buckets_link_res_start"),
+        # очистка по сроку хранения
+        db.Index("ix_price_buckets_res_start", "resolution", "bucket_start"),
+    )
+
+
+class AlertRule(db.Model):
+    """
+    Правило уведомления о снижении цены (см. alerts.py):
+    - kind = "target"   — цена опустилась до threshold или ниже;
+    - kind = "drop_pct" — цена упала на threshold процентов и больше за одну проверку;
+    - kind = "low"      — новый минимум за всю историю ссылки.
+    link_id = NULL — правило на все ссылки продукта. Уведомление уходит на email
+    пользователя или POST-запросом на webhook_url, если он задан.
+    """
+    __tablename__ = "alert_rules"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    link_id = db.Column(db.Integer, db.ForeignKey("product_links.id", ondelete="CASCADE"), nullable=True)
+    kind = db.Column(db.String(16), nullable=False)
+    threshold = db.Column(db.Float, nullable=True)
+    webhook_url = db.Column(db.String(2000), nullable=True)
+    active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_triggered_at = db.Column(db.DateTime, nullable=True)
+
+    product = db.relationship("Product", backref=db.backref("alerts", cascade="all,delete-orphan"))
+
+
+class ExtractionRule(db.Model):
+    """Выученное правило извлечения цены для домена (см. rules.py)"""
+    __tablename__ = "extraction_rules"
+    id = db.Column(db.Integer, primary_key=True)
+    domain = db.Column(db.String(255), unique=True, nullable=False)
+    strategy = db.Column(db.String(32), nullable=False)
+    selector = db.Column(db.String(255), nullable=True)
+    hits = db.Column(db.Integer, default=0)
+    misses = db.Column(db.Integer, default=0)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class FetchJob(db.Model):
+    """
+    Задание на проверку ссылки для отдельных воркеров (см. jobqueue.py).
+    active_link_id = link_id, пока задание в очереди или в работе, и NULL после завершения:
+    уникальный индекс по нему не даёт поставить одну ссылку в очередь дважды.
+    """
+    __tablename__ = "fetch_jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    link_id = db.Column(db.Integer, db.ForeignKey("product_links.id", ondelete="CASCADE"), index=True)
+    active_link_id = db.Column(db.Integer, unique=True, nullable=True)
+    batch_id = db.Column(db.String(36), nullable=True, index=True)
+    status = db.Column(db.String(16), default="queued", index=True)  # queued | leased | done | failed
+    lease_token = db.Column(db.String(64), nullable=True, index=True)
+    lease_until = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(512), nullable=True)
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+def refresh_product_aggregates(product_ids=None):
+    """
+    Пересчитываем Product.current_min_price и link_count по ссылкам
+    одним UPDATE с подзапросами (для всех продуктов, если product_ids не задан).
+    Коммит — за вызывающим.
+    """
+    products = Product.__table__
+    links = ProductLink.__table__
+    stmt = products.update().values(
+        current_min_price=select(func.min(links.c.last_price))
+        .where(links.c.product_id == products.c.id).scalar_subquery(),
+        link_count=select(func.count(links.c.id))
+        .where(links.c.product_id == products.c.id).scalar_subquery(),
+    )
+    if product_ids is not None:
+        # список id или подзапрос select(product_id)
+        if not isinstance(product_ids, ClauseElement):
+            product_ids = list(product_ids)
+            if not product_ids:
+                return
+        stmt = stmt.where(products.c.id.in_(product_ids))
+    db.session.execute(stmt)
+
+
+def attach_pages(links):
+    """
+    Привязываем ссылки без page_id к TrackedPage их канонического адреса (создаём недостающие).
+    Коммит — за вызывающим. Параллельно созданную страницу с тем же адресом
+    ловим по уникальному индексу и берём существующую.
+    """
+    from urls import canonical_url
+
+    links = [ln for ln in links if ln.page_id is None]
+    by_url = {}
+    for ln in links:
+        by_url.setdefault(canonical_url(ln.url), []).append(ln)
+    if not by_url:
+        return
+    pages = {}
+    urls = list(by_url)
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        pages.update(db.session.execute(
+            select(TrackedPage.url, TrackedPage.id).where(TrackedPage.url.in_(chunk))).all())
+    for url in urls:
+        if url not in pages:
+            page = TrackedPage(url=url)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(page)
+                pages[url] = page.id
+            except IntegrityError:
+                pages[url] = db.session.execute(select(TrackedPage.id).where(TrackedPage.url == url)).scalar_one()
+        for ln in by_url[url]:
+            ln.page_id = pages[url]
+
+
+def init_db():
+    """
+    Разовая подготовка базы (flask --app app init-db или python worker.py --init-db):
+    таблицы, недостающие колонки и индексы (upgrade_schema) и бесплатный тариф.
+    Вызывается внутри app context; повторный запуск безопасен.
+    """
+    db.create_all()
+    upgrade_schema()
+    if not Plan.query.filter_by(price_cents=0).first():
+        db.session.add(Plan(name="Free", price_cents=0, max_products=1, max_links_per_product=5))
+        db.session.commit()
+        logger.info("создан бесплатный тариф")
+
+
+def upgrade_schema():
+    """
+    Простая «миграция» для уже существующих баз: create_all() не добавляет
+    новые колонки и индексы в старые таблицы, поэтому досоздаём недостающие
+    (колонки через ALTER TABLE, индексы через CREATE INDEX) и заполняем
+    новые денормализованные поля. Вызывается из init_db после db.create_all() внутри app context.
+    """
+    insp = inspect(db.engine)
+    added = set()
+    for table in db.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing:
+                continue
+            col_type = col.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}'))
+            added.add(f"{table.name}.{col.name}")
+            logger.info("добавлена колонка %s.%s", table.name, col.name)
+
+        indexes = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(bind=db.engine)
+                logger.info("создан индекс %s", index.name)
+
+    if added & {"products.current_min_price", "products.link_count"}:
+        refresh_product_aggregates()
+        db.session.commit()
+        logger.info("заполнены агрегаты продуктов")
+
+    # ссылки, добавленные до появления tracked_pages, привязываем к страницам пачками
+    attached = 0
+    while True:
+        links = ProductLink.query.filter(ProductLink.page_id.is_(None)).order_by(ProductLink.id).limit(1000).all()
+        if not links:
+            break
+        attach_pages(links)
+        db.session.commit()
+        attached += len(links)
+    if attached:
+        logger.info("ссылки привязаны к страницам: %d", attached)
@@ -0,0 +1,223 @@
+# persistence.py
+# Пакетная запись результатов обхода: вместо commit() на каждую ссылку
+# копим обновления ProductLink и новые строки PriceHistory и сбрасываем их
+# пачками через executemany — одна транзакция (и один fsync в SQLite) на пачку.
+# История пишется «по изменениям»: та же цена, что в последнем отрезке ссылки,
+# только продлевает его (last_seen_at, samples), новая строка — лишь на новую цену.
+# Новые цены тут же проверяются правилами уведомлений (alerts.py), а страницы
+# затронутых продуктов сбрасываются из кэша (cache.py).
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, select
+
+from config import Config
+from models import db, AlertRule, Product, ProductLink, PriceHistory, refresh_product_aggregates
+from queries import latest_runs
+from alerts import get_alert_index, get_dispatcher
+from cache import get_page_cache
+from metrics import FETCH_PHASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+links_table = ProductLink.__table__
+history_table = PriceHistory.__table__
+
+_update_link = (
+    links_table.update()
+    .where(links_table.c.id == bindparam("_id"))
+    .values(
+        last_price=bindparam("last_price"),
+        last_checked=bindparam("last_checked"),
+        etag=bindparam("etag"),
+        last_modified=bindparam("last_modified"),
+        content_hash=bindparam("content_hash"),
+        # None — оставить текущее расписание ссылки как есть
+        check_interval=func.coalesce(bindparam("check_interval"), links_table.c.check_interval),
+        next_check_at=func.coalesce(bindparam("next_check_at"), links_table.c.next_check_at),
+    )
+)
+
+
+_extend_run = (
+    history_table.update()
+    .where(history_table.c.id == bindparam("_id"))
+    .values(
+        last_seen_at=bindparam("last_seen_at"),
+        samples=func.coalesce(history_table.c.samples, 1) + bindparam("added"),
+    )
+)
+
+
+def invalidate_pages(link_ids):
+    """Сбрасываем кэш страниц продуктов этих ссылок и дашбордов их владельцев"""
+    link_ids = list(set(link_ids))
+    if not link_ids:
+        return
+    rows = db.session.execute(
+        select(links_table.c.product_id, Product.user_id)
+        .join(Product, Product.id == links_table.c.product_id)
+        .where(links_table.c.id.in_(link_ids))
+        .distinct()
+    ).all()
+    get_page_cache().invalidate(product_ids=[r.product_id for r in rows], user_ids=[r.user_id for r in rows])
+
+
+class PriceWriter:
+    """
+    Буфер записей для обхода цен. Используется внутри app context:
+
+        with PriceWriter(batch_size=500) as writer:
+            writer.add(link_id, last_price, last_checked, history_price=price)
+
+    - пачка пишется одной транзакцией (executemany для UPDATE и INSERT);
+    - если пачка упала, она переписывается по одной ссылке: сбойная ссылка
+      откатывается одна и не тянет за собой остальные;
+    - запись идёт мимо ORM: уже загруженные объекты ProductLink не обновляются;
+    - сброс кэша и уведомления — после commit и вне повтора пачки: их сбой не
+      переписывает уже записанное (см. _after_commit).
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = max(1, int(batch_size))
+        self.written = 0
+        self.failed = 0
+        self._pending = []  # [(link_row, history_row | None)]
+
+    def add(self, link_id, last_price, last_checked, etag=None, last_modified=None,
+            content_hash=None, history_price=None, check_interval=None, next_check_at=None):
+        """Ставим в очередь новое состояние ссылки и (опционально) строку истории"""
+        link_row = {
+            "_id": link_id,
+            "last_price": last_price,
+            "last_checked": last_checked,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "check_interval": check_interval,
+            "next_check_at": next_check_at,
+        }
+        hist_row = None
+        if history_price is not None:
+            hist_row = {"link_id": link_id, "price": history_price, "checked_at": last_checked,
+                        "last_seen_at": last_checked, "samples": 1}
+        self._pending.append((link_row, hist_row))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def _split_history(hist_rows):
+        """
+        Делим проверки на продления текущих отрезков и новые отрезки:
+        ([{"_id", "last_seen_at", "added"}], [новые строки PriceHistory], [(link_id, старая цена, новая)])
+        """
+        current = latest_runs({hr["link_id"] for hr in hist_rows})  # link_id -> (id, цена)
+        extend, insert, changes = {}, [], []
+        fresh = {}  # link_id -> ещё не записанный последний отрезок ссылки в этой пачке
+        for hr in hist_rows:
+            link_id, price = hr["link_id"], hr["price"]
+            new = fresh.get(link_id)
+            if new is not None and new["price"] == price:
+                new["last_seen_at"] = hr["last_seen_at"]
+                new["samples"] += 1
+            elif new is None and link_id in current and current[link_id][1] == price:
+                ext = extend.setdefault(link_id, {"_id": current[link_id][0], "last_seen_at": None, "added": 0})
+                ext["last_seen_at"] = hr["last_seen_at"]
+                ext["added"] += 1
+            else:
+                old = fresh[link_id]["price"] if link_id in fresh else current.get(link_id, (None, None))[1]
+                changes.append((link_id, old, price))
+                fresh[link_id] = dict(hr)
+                insert.append(fresh[link_id])
+        return list(extend.values()), insert, changes
+
+    def _write(self, items):
+        """Пишем пачку одной транзакцией; возвращаем (изменения цен, сработавшие уведомления)"""
+        started = time.perf_counter()
+        link_rows = [lr for lr, _ in items]
+        hist_rows = [hr for _, hr in items if hr is not None]
+        db.session.execute(_update_link, link_rows)
+        changes, fired = [], []
+        if hist_rows:
+            extend, insert, changes = self._split_history(hist_rows)
+            if changes and Config.ALERTS_ENABLED:
+                # индекс (с минимумами ссылок) — до записи истории пачки, см. AlertIndex.refresh
+                get_alert_index().refresh()
+            if extend:
+                db.session.execute(_extend_run, extend)
+            if insert:
+                db.session.execute(history_table.insert(), insert)
+            if changes and Config.ALERTS_ENABLED:
+                fired = get_alert_index().evaluate(changes)
+                if fired:
+                    db.session.execute(
+                        AlertRule.__table__.update()
+                        .where(AlertRule.__table__.c.id.in_({a.rule_id for a in fired}))
+                        .values(last_triggered_at=datetime.utcnow())
+                    )
+        # денормализованные min-цена и число ссылок затронутых продуктов — в той же транзакции
+        refresh_product_aggregates(
+            select(links_table.c.product_id)
+            .where(links_table.c.id.in_([lr["_id"] for lr in link_rows]))
+            .distinct().scalar_subquery()
+        )
+        db.session.commit()
+        FETCH_PHASE_SECONDS.observe(time.perf_counter() - started, phase="db_commit")
+        return changes, fired
+
+    @staticmethod
+    def _after_commit(changes, fired):
+        """Побочные эффекты записанной пачки; каждый сбой только в лог — данные уже в базе"""
+        if not changes:
+            return
+        try:
+            invalidate_pages([link_id for link_id, _, _ in changes])
+        except Exception as e:
+            db.session.rollback()
+            logger.error("кэш страниц не сброшен для %d ссылок: %s", len(changes), e)
+        if not Config.ALERTS_ENABLED:
+            return
+        # уведомления — только о записанных ценах, отправка асинхронно
+        try:
+            get_alert_index().observe(changes)
+        except Exception as e:
+            logger.error("индекс уведомлений не обновлён: %s", e)
+        try:
+            get_dispatcher().submit(fired)
+        except Exception as e:
+            logger.error("уведомления не отправлены (%d): %s", len(fired), e)
+
+    def flush(self):
+        """Сбрасываем накопленное; возвращаем (записано, упало) за всё время жизни буфера"""
+        items, self._pending = self._pending, []
+        if not items:
+            return self.written, self.failed
+
+        written = []  # [(изменения, уведомления)] записанных транзакций
+        try:
+            written.append(self._write(items))
+            self.written += len(items)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("пачка из %d не записана (%s), пишем по одной", len(items), e)
+            for item in items:
+                try:
+                    written.append(self._write([item]))
+                    self.written += 1
+                except Exception as e1:
+                    db.session.rollback()
+                    self.failed += 1
+                    logger.error("link %s: %s", item[0]["_id"], e1)
+
+        for changes, fired in written:
+            self._after_commit(changes, fired)
+
+        return self.written, self.failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
@@ -0,0 +1,100 @@
+# queries.py
+# Агрегирующие запросы для страниц и планировщика: фиксированное число запросов
+# к базе независимо от количества продуктов, ссылок и строк истории.
+from sqlalchemy import and_, func, or_, select
+
+from models import db, Product, ProductLink, PriceHistory
+
+links_table = ProductLink.__table__
+
+
+def product_cards(user_id):
+    """
+    Продукты пользователя для дашборда одним запросом:
+    [(Product, минимальная последняя цена или None, число ссылок)].
+    Агрегаты берём из денормализованных Product.current_min_price/link_count
+    (их поддерживает PriceWriter), без JOIN и GROUP BY по ссылкам.
+    """
+    products = db.session.execute(
+        select(Product).where(Product.user_id == user_id).order_by(Product.id)
+    ).scalars().all()
+    return [(p, p.current_min_price, p.link_count or 0) for p in products]
+
+
+def _latest_runs(link_ids, limit):
+    """
+    Последние limit отрезков истории по каждой ссылке:
+    [(link_id, id, checked_at, last_seen_at, price, samples)] по ссылкам, от новых к старым.
+    Два запроса вместо row_number() по всей истории ссылок:
+    - граница ссылки — checked_at её limit-го отрезка с конца (подзапрос с LIMIT по индексу
+      (link_id, checked_at)); считается один раз на ссылку;
+    - отрезки не старше своей границы — по тому же индексу.
+    Объём чтения не растёт с длиной истории.
+    """
+    history = PriceHistory.__table__
+    cutoff = (
+        select(history.c.checked_at)
+        .where(history.c.link_id == links_table.c.id)
+        .order_by(history.c.checked_at.desc())
+        .offset(limit - 1).limit(1)
+        .scalar_subquery()
+    )
+    bounds = db.session.execute(
+        select(links_table.c.id, cutoff).where(links_table.c.id.in_(list(link_ids)))
+    ).all()
+    # меньше limit отрезков — границы нет, берём все отрезки ссылки
+    short = [link_id for link_id, border in bounds if border is None]
+    ranges = [and_(history.c.link_id == link_id, history.c.checked_at >= border)
+              for link_id, border in bounds if border is not None]
+    if short:
+        ranges.append(history.c.link_id.in_(short))
+    if not ranges:
+        return []
+    rows = db.session.execute(
+        select(history.c.link_id, history.c.id, history.c.checked_at,
+               func.coalesce(history.c.last_seen_at, history.c.checked_at).label("last_seen_at"),
+               history.c.price, func.coalesce(history.c.samples, 1).label("samples"))
+        .where(or_(*ranges))
+    ).all()
+    # одинаковый checked_at на границе может дать лишние строки — порядок и обрезка как у row_number()
+    rows.sort(key=lambda r: (r.link_id, r.checked_at, r.id), reverse=True)
+    out, taken = [], {}
+    for r in rows:
+        if taken.get(r.link_id, 0) < limit:
+            taken[r.link_id] = taken.get(r.link_id, 0) + 1
+            out.append(tuple(r))
+    return out
+
+
+def latest_history(link_ids, limit):
+    """
+    Последние limit изменений цены по каждой ссылке одним запросом:
+    {link_id: [(с какого момента, по какую проверку, цена), ...] от новых к старым}.
+    """
+    if not link_ids:
+        return {}
+    out = {}
+    for link_id, _, checked_at, last_seen_at, price, _ in _latest_runs(link_ids, limit):
+        out.setdefault(link_id, []).append((checked_at, last_seen_at, price))
+    return out
+
+
+def latest_runs(link_ids):
+    """Текущий (последний) отрезок истории ссылок: {link_id: (id строки, цена)}"""
+    if not link_ids:
+        return {}
+    return {link_id: (row_id, price) for link_id, row_id, _, _, price, _ in _latest_runs(link_ids, 1)}
+
+
+def recent_prices(link_ids, window):
+    """
+    Цены последних window проверок по каждой ссылке: {link_id: [новые → старые]}.
+    Отрезок из samples проверок разворачивается в samples одинаковых цен.
+    """
+    if not link_ids:
+        return {}
+    out = {}
+    for link_id, _, _, _, price, samples in _latest_runs(link_ids, window):
+        prices = out.setdefault(link_id, [])
+        prices.extend([price] * min(samples, window - len(prices)))
+    return out
@@ -0,0 +1,208 @@
+# ratelimit.py
+# Вежливость к магазинам: на каждый домен свой «ведро токенов» (token bucket)
+# и экспоненциальная пауза после 429/503 с учётом заголовка Retry-After.
+# Используется в scraper.download_page — то есть на всех путях загрузки
+# (планировщик, «обновить сейчас», добавление продукта).
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# статусы, после которых домену нужно дать передышку
+BACKOFF_STATUSES = (429, 503)
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After: число секунд или HTTP-дата. Возвращаем секунды (или None)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+def parse_domain_limits(spec):
+    """
+    Строка вида "shop.ru=0.5:2,example.com=2" -> {домен: (запросов в секунду, размер ведра)}.
+    Размер ведра (burst) необязателен, по умолчанию 1. Домены приводятся к виду,
+    в котором их ищет лимитер (DomainRateLimiter.normalize: нижний регистр, без www.).
+    """
+    limits = {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part or "=" not in part:
+            continue
+        domain, value = part.split("=", 1)
+        rate, _, burst = value.partition(":")
+        try:
+            limits[DomainRateLimiter.normalize(domain.strip())] = (float(rate), float(burst or 1))
+        except ValueError:
+            logger.warning("некорректный лимит для %s: %s", domain, value)
+    return limits
+
+
+class DomainState:
+    """Состояние одного домена: токены, пауза после отказов и счётчики"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+
+class DomainRateLimiter:
+    """
+    Token bucket на домен + экспоненциальный backoff.
+    - acquire(domain) блокирует поток, пока у домена нет токена или идёт пауза;
+    - report(domain, status, retry_after) вызывается после ответа: на 429/503 пауза
+      растёт как base * 2^n (не больше max_backoff), Retry-After имеет приоритет;
+      успешный ответ сбрасывает счётчик отказов.
+    Домен берётся «как есть» (www. отбрасывается), лимиты для поддоменов задаются отдельно.
+    """
+
+    def __init__(self, default_rate=1.0, default_burst=2, limits=None,
+                 backoff_base=5.0, max_backoff=900.0, max_wait=None):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.limits = {self.normalize(d): v for d, v in (limits or {}).items()}
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self._domains = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(domain):
+        domain = (domain or "").lower()
+        return domain[4:] if domain.startswith("www.") else domain
+
+    def _state(self, domain):
+        st = self._domains.get(domain)
+        if st is None:
+            rate, burst = self.limits.get(domain, (self.default_rate, self.default_burst))
+            st = DomainState(rate, burst)
+            self._domains[domain] = st
+        return st
+
+    def _refill(self, st, now):
+        if st.rate > 0:
+            st.tokens = min(st.burst, st.tokens + (now - st.updated) * st.rate)
+        st.updated = now
+
+    def acquire(self, domain):
+        """
+        Ждём своей очереди к домену. Возвращаем время ожидания в секундах.
+        Если max_wait задан и ждать пришлось бы дольше — бросаем RateLimited,
+        чтобы поток пула не простаивал на забаненном домене.
+        """
+        domain = self.normalize(domain)
+        waited = 0.0
+        while True:
+            with self._lock:
+                st = self._state(domain)
+                now = time.monotonic()
+                self._refill(st, now)
+                if now >= st.blocked_until and st.tokens >= 1:
+                    st.tokens -= 1
+                    st.requests += 1
+                    st.waited += waited
+                    if waited:
+                        st.throttled += 1
+                    return waited
+                if now < st.blocked_until:
+                    delay = st.blocked_until - now
+                elif st.rate > 0:
+                    delay = (1 - st.tokens) / st.rate
+                else:
+                    delay = 1.0
+
+            if self.max_wait is not None and waited + delay > self.max_wait:
+                raise RateLimited(domain, delay)
+            time.sleep(delay)
+            waited += delay
+
+    def report(self, domain, status, retry_after=None):
+        """Учитываем ответ сервера: ставим паузу на 429/503, сбрасываем её на успехе"""
+        domain = self.normalize(domain)
+        with self._lock:
+            st = self._state(domain)
+            if status in BACKOFF_STATUSES:
+                st.failures += 1
+                pause = parse_retry_after(retry_after)
+                if pause is None:
+                    pause = self.backoff_base * (2 ** (st.failures - 1))
+                    pause *= random.uniform(0.8, 1.2)
+                pause = min(self.max_backoff, pause)
+                st.blocked_until = max(st.blocked_until, time.monotonic() + pause)
+                st.tokens = 0
+                logger.warning("%s: статус %s, пауза %.0f с (отказ №%d)", domain, status, pause, st.failures)
+            elif status is not None and status < 400:
+                st.failures = 0
+
+    def snapshot(self):
+        """Текущее состояние всех доменов — для /admin/ratelimits"""
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for domain, st in self._domains.items():
+                self._refill(st, now)
+                out[domain] = {
+                    "rate": st.rate,
+                    "burst": st.burst,
+                    "tokens": round(st.tokens, 2),
+                    "backoff_remaining": round(max(0.0, st.blocked_until - now), 1),
+                    "failures": st.failures,
+                    "requests": st.requests,
+                    "throttled": st.throttled,
+                    "waited_seconds": round(st.waited, 1),
+                }
+        return out
+
+
+class RateLimited(Exception):
+    """Домен на паузе дольше, чем допустимо ждать"""
+
+    def __init__(self, domain, delay):
+        super().__init__(f"{domain} rate limited for {delay:.0f}s")
+        self.domain = domain
+        self.delay = delay
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Общий лимитер на процесс (настройки из Config)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = DomainRateLimiter(
+                default_rate=Config.DOMAIN_RATE,
+                default_burst=Config.DOMAIN_BURST,
+                limits=parse_domain_limits(Config.DOMAIN_RATE_LIMITS),
+                backoff_base=Config.DOMAIN_BACKOFF_BASE,
+                max_backoff=Config.DOMAIN_BACKOFF_MAX,
+                max_wait=Config.DOMAIN_MAX_WAIT,
+            )
+        return _limiter
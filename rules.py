@@ -0,0 +1,175 @@
+# rules.py
+# Выученные правила извлечения цены по доменам.
+# Запоминаем, какая стратегия (и какой селектор) нашла цену на сайте,
+# и в следующий раз пробуем её первой — без прохода по всей цепочке.
+# Правила живут в памяти (LRU с ограничением размера) и сбрасываются в таблицу
+# extraction_rules; при старте подгружаются обратно.
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# «весь текст страницы» и BeautifulSoup не запоминаем: они ненадёжны и ничего не экономят;
+# "browser" — цену нашёл только headless-браузер (browser.py): домен дальше рендерится сразу им
+CACHEABLE = ("meta property", "itemprop", "json-ld", "meta name", "class/id", "browser")
+
+
+def domain_key(domain):
+    domain = (domain or "").lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+class Rule:
+    __slots__ = ("strategy", "selector", "hits", "misses", "last_used_at")
+
+    def __init__(self, strategy, selector=None, hits=0, misses=0, last_used_at=None):
+        self.strategy = strategy
+        self.selector = selector
+        self.hits = hits
+        self.misses = misses
+        self.last_used_at = last_used_at or datetime.utcnow()
+
+
+class RuleCache:
+    """
+    LRU-кэш правил {домен: Rule}. Потокобезопасен — им пользуются потоки FetchEngine.
+    - hint(domain) -> (стратегия, селектор) или None;
+    - record(domain, strategy, selector) — итог разбора: совпал с правилом — hit,
+      иначе miss, и правило заменяется новой сработавшей стратегией;
+    - load()/flush() — синхронизация с таблицей extraction_rules (нужен app context).
+    """
+
+    def __init__(self, max_rules=5000):
+        self.max_rules = max(1, int(max_rules))
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+        self._rules = OrderedDict()
+        self._dirty = set()
+        self._evicted = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rules)
+
+    def _put(self, domain, rule):
+        self._rules[domain] = rule
+        self._rules.move_to_end(domain)
+        self._evicted.discard(domain)
+        while len(self._rules) > self.max_rules:
+            old, _ = self._rules.popitem(last=False)
+            self._dirty.discard(old)
+            self._evicted.add(old)
+
+    def hint(self, domain):
+        domain = domain_key(domain)
+        with self._lock:
+            rule = self._rules.get(domain)
+            if rule is None:
+                return None
+            self._rules.move_to_end(domain)
+            return rule.strategy, rule.selector
+
+    def record(self, domain, strategy, selector=None):
+        domain = domain_key(domain)
+        now = datetime.utcnow()
+        with self._lock:
+            rule = self._rules.get(domain)
+            if rule is not None and rule.strategy == strategy and rule.selector == selector:
+                rule.hits += 1
+                rule.last_used_at = now
+                self.hits += 1
+                self._rules.move_to_end(domain)
+                self._dirty.add(domain)
+                return
+
+            if rule is not None:
+                rule.misses += 1
+                self.misses += 1
+                self._dirty.add(domain)
+
+            if strategy in CACHEABLE:
+                misses = rule.misses if rule is not None else 0
+                self._put(domain, Rule(strategy, selector, misses=misses, last_used_at=now))
+                self._dirty.add(domain)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "rules": len(self._rules),
+                "max_rules": self.max_rules,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "domains": {
+                    d: {"strategy": r.strategy, "selector": r.selector, "hits": r.hits, "misses": r.misses}
+                    for d, r in reversed(self._rules.items())
+                },
+            }
+
+    def load(self):
+        """Загружаем самые свежие правила из базы (не больше max_rules)"""
+        from models import ExtractionRule
+
+        rows = (ExtractionRule.query
+                .order_by(ExtractionRule.last_used_at.desc())
+                .limit(self.max_rules).all())
+        with self._lock:
+            # от старых к новым, чтобы порядок LRU совпал с last_used_at
+            for row in reversed(rows):
+                if row.domain not in self._rules:
+                    self._rules[row.domain] = Rule(row.strategy, row.selector, row.hits,
+                                                   row.misses, row.last_used_at)
+            self.loaded = True
+
+    def flush(self):
+        """Сохраняем изменённые правила и удаляем вытесненные (одна транзакция)"""
+        from models import db, ExtractionRule
+
+        with self._lock:
+            dirty = {d: self._rules[d] for d in self._dirty if d in self._rules}
+            evicted = set(self._evicted)
+            self._dirty.clear()
+            self._evicted.clear()
+        if not dirty and not evicted:
+            return
+
+        try:
+            existing = {}
+            if dirty:
+                existing = {r.domain: r for r in
+                            ExtractionRule.query.filter(ExtractionRule.domain.in_(list(dirty))).all()}
+            for domain, rule in dirty.items():
+                row = existing.get(domain) or ExtractionRule(domain=domain)
+                row.strategy = rule.strategy
+                row.selector = rule.selector
+                row.hits = rule.hits
+                row.misses = rule.misses
+                row.last_used_at = rule.last_used_at
+                db.session.add(row)
+            if evicted:
+                ExtractionRule.query.filter(ExtractionRule.domain.in_(list(evicted))).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("не удалось сохранить правила: %s", e)
+            with self._lock:
+                self._dirty.update(d for d in dirty if d in self._rules)
+                self._evicted.update(evicted)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_rule_cache():
+    """Общий кэш правил на процесс (размер — EXTRACTION_RULES_MAX)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from config import Config
+            _cache = RuleCache(max_rules=Config.EXTRACTION_RULES_MAX)
+        return _cache
@@ -1,71 +1,305 @@
 # scheduler.py
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
-from models import db, ProductLink, PriceHistory
-from scraper import fetch_price
-import traceback
+import logging
+import time
+from sqlalchemy import select
+from models import db, ProductLink
+from queries import recent_prices
+from persistence import PriceWriter
+from adaptive import DueQueue, compute_interval, jittered
+from rules import get_rule_cache
+from jobqueue import get_queue, enqueue_due_links as _enqueue_due
+from history import compact_history as _compact_history
+from metrics import FETCH_RESULTS, SCHEDULE_LAG_SECONDS, observe_sweep
+from urls import canonical_url
+
+logger = logging.getLogger(__name__)
 
 scheduler = BackgroundScheduler()
 
+# очередь ссылок по сроку следующей проверки (наполняется из БД в dispatch_due_links)
+due_queue = DueQueue()
+_last_resync = None
+
+
+def _fetch_and_record(config, links, writer, schedule=None):
+    """
+    Общая часть обхода: параллельная загрузка ссылок и запись результатов в writer.
+    - Ссылки группируются по каноническому адресу (urls.canonical_url): страница,
+      на которую подписаны несколько ссылок, скачивается один раз, цена раздаётся всем.
+    - Для страниц с известной ценой делаем условный GET по валидаторам самой свежей
+      ссылки группы: на 304 или неизменной странице всем ссылкам ставится её цена без парсинга.
+    - schedule(ln, price) -> (check_interval, next_check_at) — расписание ссылки
+      после проверки (price = None, если цену получить не удалось).
+    Возвращаем (число ссылок без изменений, число скачанных страниц).
+    """
+    # движок и парсеры — только когда действительно нужно скачивать (веб-процесс их не грузит)
+    from engine import get_engine
+    from scraper import FetchResult
+
+    pages = {ln.id: canonical_url(ln.url) for ln in links}
+
+    # Валидаторы прошлой загрузки берём у последней проверенной ссылки страницы с известной ценой:
+    # если страница не изменилась, её цена и есть цена всех ссылок группы
+    source = {}
+    for ln in links:
+        if ln.last_price is None:
+            continue
+        best = source.get(pages[ln.id])
+        if best is None or (ln.last_checked or datetime.min) > (best.last_checked or datetime.min):
+            source[pages[ln.id]] = ln
+    validators = {
+        url: {"etag": ln.etag, "last_modified": ln.last_modified, "content_hash": ln.content_hash}
+        for url, ln in source.items()
+    }
+
+    # Выученные правила извлечения по доменам: загружаем при первом обходе
+    rules = get_rule_cache()
+    if not rules.loaded:
+        rules.load()
+
+    # Сеть и парсинг — параллельно; запись в БД — здесь, в одном потоке с сессией
+    urls = list(dict.fromkeys(pages.values()))
+    results = get_engine(config).fetch_many(urls, validators, rules)
+
+    unchanged = 0
+    for ln in links:
+        try:
+            page = pages[ln.id]
+            res = results.get(page) or FetchResult(error="not fetched")
+            now = datetime.utcnow()
+
+            FETCH_RESULTS.inc(status=res.status)
+            if res.is_unchanged:
+                # 304 или то же тело — цена страницы прежняя, парсинг пропущен
+                unchanged += 1
+                price = source[page].last_price
+                values = (price, now, res.etag, res.last_modified, res.content_hash)
+            elif res.price is not None:
+                price = res.price
+                values = (price, now, res.etag, res.last_modified, res.content_hash)
+                logger.debug("%s — новая цена: %s", ln.url, res.price)
+            else:
+                # fetch_price вернул ошибку — отмечаем проверку, цену и валидаторы не трогаем
+                price = None
+                values = (ln.last_price, now, ln.etag, ln.last_modified, ln.content_hash)
+                logger.warning("%s — ошибка получения цены: %s", ln.url, res.error)
+
+            interval, next_check_at = schedule(ln, price) if schedule else (None, None)
+            writer.add(ln.id, *values, history_price=price,
+                       check_interval=interval, next_check_at=next_check_at)
+
+        except Exception as e:
+            # Ошибка одной ссылки не должна остановить цикл
+            logger.exception("ошибка при обновлении %s: %s", ln.url, e)
+
+    rules.flush()
+    if len(urls) < len(links):
+        logger.debug("ссылок: %d, страниц: %d", len(links), len(urls))
+    return unchanged, len(urls)
+
+
 def update_all_prices():
     """
-    Обновляем цены для всех ProductLink в фоне.
+    Полный обход: обновляем цены для всех ProductLink разом (например, вручную).
+    В штатном режиме ссылки проверяются по одной по мере наступления их срока —
+    см. dispatch_due_links.
     - Используем корректный Flask application context,
       который назначается в start_scheduler(app, ...).
-    - Для каждой ссылки пытаемся получить цену через fetch_price,
-      обновляем поля last_price/last_checked, добавляем запись в PriceHistory.
-    - Коммитим изменения; при исключении делаем rollback и логируем трассировку.
+    - Все ссылки скачиваются параллельно через общий FetchEngine
+      (глобальный и per-host лимиты, парсинг в пуле процессов).
+    - По результатам обновляем поля last_price/last_checked, добавляем запись в PriceHistory.
+    - Запись идёт пачками через PriceWriter (PERSIST_BATCH_SIZE ссылок на транзакцию);
+      сбой одной ссылки не откатывает остальные.
     """
     # Правильный контекст приложения (scheduler.app устанавливается в start_scheduler)
     with scheduler.app.app_context():
-        print(f"[scheduler] Начало обновления цен — {datetime.utcnow()}")
+        started = time.monotonic()
+        logger.info("начало полного обхода")
         links = ProductLink.query.all()
 
+        with PriceWriter(batch_size=scheduler.app.config.get("PERSIST_BATCH_SIZE", 500)) as writer:
+            unchanged, pages = _fetch_and_record(scheduler.app.config, links, writer)
+
+        elapsed = time.monotonic() - started
+        observe_sweep("full", elapsed, len(links), pages=pages)
+        logger.info("обход завершён: %d ссылок на %d страницах (x%.2f), без изменений: %d, записано: %d, "
+                    "ошибок записи: %d, за %.1f с", len(links), pages, len(links) / max(pages, 1),
+                    unchanged, writer.written, writer.failed, elapsed)
+
+
+def _resync_queue(config, force=False):
+    """Раз в QUEUE_RESYNC_INTERVAL секунд подтягиваем в очередь новые ссылки и убираем удалённые"""
+    global _last_resync
+    now = datetime.utcnow()
+    period = config.get("QUEUE_RESYNC_INTERVAL", 60)
+    if not force and _last_resync and (now - _last_resync).total_seconds() < period:
+        return
+    rows = db.session.execute(
+        select(ProductLink.id, ProductLink.next_check_at, ProductLink.last_checked, ProductLink.check_interval)
+    ).all()
+    due_queue.sync(rows, base_interval=scheduler.base_interval)
+    _last_resync = now
+
+
+def check_links(config, links, base_interval, track_lag=False):
+    """
+    Проверка пачки ссылок с адаптивным расписанием (нужен app context).
+    - скачиваем ссылки через FetchEngine и пишем результаты через PriceWriter;
+    - по последним REFRESH_HISTORY_WINDOW ценам пересчитываем интервал ссылки
+      (чаще для «живых» цен, реже для стабильных) и сохраняем next_check_at.
+    - к пачке добавляются остальные ссылки на те же страницы (TrackedPage): страница
+      скачивается один раз, и все её ссылки получают общий срок следующей проверки.
+    Возвращаем (число ссылок без изменений, {link_id: next_check_at}, число скачанных страниц).
+    Используется тиком планировщика и отдельными воркерами (worker.py);
+    track_lag — учесть в метриках, насколько позже срока проверены ссылки.
+    """
+    if track_lag:
+        now = datetime.utcnow()
         for ln in links:
-            try:
-                price, err = fetch_price(ln.url)
-                ln.last_checked = datetime.utcnow()
+            if ln.next_check_at is not None:
+                SCHEDULE_LAG_SECONDS.observe(max(0.0, (now - ln.next_check_at).total_seconds()))
+    page_ids = {ln.page_id for ln in links if ln.page_id is not None}
+    if page_ids:
+        known = {ln.id for ln in links}
+        siblings = ProductLink.query.filter(ProductLink.page_id.in_(page_ids), ProductLink.id.notin_(known)).all()
+        links = list(links) + siblings
+    ids = [ln.id for ln in links]
+    history = recent_prices(ids, config.get("REFRESH_HISTORY_WINDOW", 10))
+    min_interval = config.get("REFRESH_MIN_INTERVAL", 120)
+    max_interval = config.get("REFRESH_MAX_INTERVAL", 6 * 3600)
+    scheduled = {}
+    by_page = {}  # page_id -> (интервал, срок) первой ссылки страницы
+
+    def schedule(ln, price):
+        if ln.page_id is not None and ln.page_id in by_page:
+            interval, due = by_page[ln.page_id]
+            scheduled[ln.id] = due
+            return interval, due
+        current = ln.check_interval or base_interval
+        if price is None:
+            # ошибка — ритм не меняем, просто пробуем снова через обычный интервал
+            interval = current
+        else:
+            interval = compute_interval([price] + history.get(ln.id, []), current, min_interval, max_interval)
+        due = jittered(datetime.utcnow(), interval)
+        scheduled[ln.id] = due
+        if ln.page_id is not None:
+            by_page[ln.page_id] = (interval, due)
+        return interval, due
 
-                if price is not None:
-                    ln.last_price = price
+    with PriceWriter(batch_size=config.get("PERSIST_BATCH_SIZE", 500)) as writer:
+        unchanged, pages = _fetch_and_record(config, links, writer, schedule=schedule)
+    return unchanged, scheduled, pages
 
-                    # Сохраняем историю цен (используем backref 'link' или явно link_id)
-                    hist = PriceHistory(link=ln, price=price)
-                    db.session.add(hist)
-                    db.session.commit()
 
-                    print(f"[update_all_prices] ✅ {ln.url} — новая цена: {price}")
-                else:
-                    # fetch_price вернул ошибку — логируем
-                    print(f"[update_all_prices] ⚠ {ln.url} — ошибка получения цены: {err}")
+def dispatch_due_links():
+    """
+    Тик адаптивного планировщика (каждые DISPATCH_TICK секунд).
+    - Достаём из очереди до DISPATCH_BATCH ссылок с наступившим сроком;
+    - проверяем их (check_links) и ставим обратно в очередь с новым сроком.
+    Так проверки идут непрерывным потоком, а не одной волной раз в интервал.
+    """
+    app = scheduler.app
+    config = app.config
+    with app.app_context():
+        try:
+            _resync_queue(config)
+        except Exception as e:
+            db.session.rollback()
+            logger.error("не удалось сверить очередь с базой: %s", e)
+
+        ids = due_queue.pop_due(limit=config.get("DISPATCH_BATCH", 200))
+        if not ids:
+            return
 
-            except Exception as e:
-                # Откатываем транзакцию и печатаем трассировку, чтобы не остановить цикл
-                db.session.rollback()
-                print(f"[update_all_prices] ❌ Ошибка при обновлении {ln.url}: {e}")
-                traceback.print_exc()
+        started = time.monotonic()
+        links = ProductLink.query.filter(ProductLink.id.in_(ids)).all()
+        unchanged, scheduled, pages = check_links(config, links, scheduler.base_interval, track_lag=True)
+        observe_sweep("dispatch", time.monotonic() - started, len(scheduled) or len(links), pages=pages,
+                      interval=config.get("DISPATCH_TICK", 5))
 
-        print(f"[scheduler] Завершено обновление — {datetime.utcnow()}\n")
+        # возвращаем ссылки в очередь (вместе с подтянутыми ссылками на те же страницы);
+        # если запись упала — повторим через базовый интервал
+        for link_id in set(ids) | set(scheduled):
+            due_queue.push(link_id, scheduled.get(link_id) or jittered(datetime.utcnow(), scheduler.base_interval))
 
+        nxt = due_queue.next_due()
+        logger.info("проверено %d ссылок на %d страницах (без изменений: %d), в очереди %d, следующая: %s",
+                    len(scheduled) or len(links), pages, unchanged, len(due_queue), nxt)
 
-def start_scheduler(app, interval_seconds=600):
+
+def enqueue_due_links():
+    """
+    Тик в распределённом режиме (SCHEDULER_MODE=queue): сам ничего не скачивает,
+    только ставит ссылки с наступившим сроком в очередь заданий для worker.py.
+    """
+    app = scheduler.app
+    config = app.config
+    with app.app_context():
+        try:
+            queue = get_queue(config)
+            added = _enqueue_due(queue, limit=config.get("DISPATCH_BATCH", 200))
+            queue.cleanup(keep_seconds=config.get("JOB_RETENTION", 3600))
+            if added:
+                logger.info("поставлено в очередь: %d, состояние: %s", added, queue.stats())
+        except Exception as e:
+            db.session.rollback()
+            logger.error("ошибка постановки в очередь: %s", e)
+
+
+def compact_history():
+    """Периодическое уплотнение истории цен и срок хранения (см. history.py)"""
+    app = scheduler.app
+    with app.app_context():
+        try:
+            started = time.monotonic()
+            stats = _compact_history(app.config)
+            if any(stats.values()):
+                logger.info("уплотнение истории: %s за %.1f с", stats, time.monotonic() - started)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("ошибка уплотнения истории: %s", e)
+
+
+def start_scheduler(app, interval_seconds=600, mode="embedded"):
     """
     Запускает фоновый планировщик.
-    - Назначаем app в scheduler.app (чтобы update_all_prices мог получить context)
+    - Назначаем app в scheduler.app (чтобы задачи могли получить context)
+    - interval_seconds — стартовый интервал для ссылок, у которых своего ещё нет
+    - mode: "embedded" — процесс сам проверяет ссылки (dispatch_due_links);
+      "queue" — только ставит задания в очередь, проверяют воркеры (worker.py)
+    - В обоих режимах раз в HISTORY_COMPACT_INTERVAL секунд уплотняется история цен
     - Добавляем job только если он ещё не создан, чтобы избежать дублирования
     - Запускаем планировщик
     """
     scheduler.app = app
+    scheduler.base_interval = interval_seconds
+    tick = app.config.get("DISPATCH_TICK", 5)
+    func, job_id = (enqueue_due_links, "enqueue_due_links") if mode == "queue" else (dispatch_due_links, "dispatch_due_links")
 
     # Если job уже есть — не добавляем заново (replace_existing=True даёт дополнительную страховку)
-    if not scheduler.get_job("update_prices_job"):
+    if not scheduler.get_job(job_id):
+        scheduler.add_job(
+            func=func,
+            trigger="interval",
+            seconds=tick,
+            id=job_id,
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+    if not scheduler.get_job("compact_history"):
         scheduler.add_job(
-            func=update_all_prices,
+            func=compact_history,
             trigger="interval",
-            seconds=interval_seconds,
-            id="update_prices_job",
+            seconds=app.config.get("HISTORY_COMPACT_INTERVAL", 3600),
+            id="compact_history",
+            max_instances=1,
+            coalesce=True,
             replace_existing=True
         )
 
     scheduler.start()
-    print(f"[scheduler] Планировщик запущен. Интервал: {interval_seconds} секунд")
+    logger.info("планировщик запущен (%s). Тик: %s с, базовый интервал ссылки: %s с", mode, tick, interval_seconds)
@@ -1,8 +1,27 @@
 # scraper.py
+import codecs
+import hashlib
+import json
+import logging
 import re
-import requests
+import sys
+import time
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
 
+try:
+    from parsel import Selector  # lxml под капотом — второй уровень извлечения цены
+except ImportError:
+    Selector = None
+
+from config import Config
+from http_pool import get_pool
+from ratelimit import get_limiter, RateLimited
+from metrics import (FETCH_PHASE_SECONDS, FETCH_PEAK_BYTES, BODY_CUTS, RESPONSE_BYTES, RESPONSES, EXTRACTIONS,
+                     domain_label)
+
+logger = logging.getLogger(__name__)
+
 HEADERS = {
     "User-Agent": "pricewatcher-bot/1.0 (+https://example.com)"
 }
@@ -51,7 +70,7 @@ def extract_price_from_html(soup):
     if meta and meta.get("content"):
         p = parse_price_text(meta["content"])
         if p is not None:
-            print(f"[extract_price] meta property: {p}")
+            logger.debug("meta property: %s", p)
             return p
 
     # itemprop
@@ -60,7 +79,7 @@ def extract_price_from_html(soup):
         content = meta.get("content") or meta.get_text()
         p = parse_price_text(content)
         if p is not None:
-            print(f"[extract_price] itemprop: {p}")
+            logger.debug("itemprop: %s", p)
             return p
 
     # meta name=price
@@ -68,7 +87,7 @@ def extract_price_from_html(soup):
     if meta and meta.get("content"):
         p = parse_price_text(meta["content"])
         if p is not None:
-            print(f"[extract_price] meta name: {p}")
+            logger.debug("meta name: %s", p)
             return p
 
     # span/div с классом/id содержащим 'price'
@@ -83,33 +102,469 @@ def extract_price_from_html(soup):
         text = c.get_text(" ", strip=True)
         p = parse_price_text(text)
         if p is not None:
-            print(f"[extract_price] class/id: {p}")
+            logger.debug("class/id: %s", p)
             return p
 
     # fallback — текст страницы
     body_text = soup.get_text(separator=' ', strip=True)
     p = parse_price_text(body_text)
     if p is not None:
-        print(f"[extract_price] fallback: {p}")
+        logger.debug("fallback: %s", p)
         return p
 
-    print("[extract_price] price not found")
+    logger.debug("price not found")
     return None
 
-def fetch_price(url, timeout=15):
-    """Получаем страницу и возвращаем цену"""
+# --- быстрый путь: регулярки по сырому HTML, без построения дерева ---
+META_TAG_RE = re.compile(r"<meta\b[^>]*>", re.I)
+ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+ITEMPROP_RE = re.compile(
+    r"""<([a-z][\w-]*)\b([^>]*\bitemprop\s*=\s*(?:"price"|'price'|price(?=[\s/>]))[^>]*)>([^<]*)""", re.I)
+JSONLD_RE = re.compile(
+    r"""<script\b[^>]*type\s*=\s*["']?application/ld\+json["']?[^>]*>(.*?)</script>""", re.I | re.S)
+
+LOWER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+PRICE_NODES_XPATH = (
+    "//*[self::span or self::div]"
+    f"[contains(translate(@class, '{LOWER}', '{LOWER.lower()}'), 'price')"
+    f" or contains(translate(@id, '{LOWER}', '{LOWER.lower()}'), 'price')]"
+)
+
+def _attrs(tag):
+    return {m.group(1).lower(): next(g for g in m.groups()[1:] if g is not None)
+            for m in ATTR_RE.finditer(tag)}
+
+def _meta_price(html, key, value):
+    for m in META_TAG_RE.finditer(html):
+        tag = m.group(0)
+        if value not in tag.lower():
+            continue
+        attrs = _attrs(tag)
+        if attrs.get(key, "").lower() == value and attrs.get("content"):
+            p = parse_price_text(attrs["content"])
+            if p is not None:
+                return p
+    return None
+
+def _itemprop_price(html):
+    m = ITEMPROP_RE.search(html)
+    if not m:
+        return None
+    attrs = _attrs(m.group(2))
+    return parse_price_text(attrs.get("content") or m.group(3))
+
+def _jsonld_offer_price(node):
+    """Ищем offers.price (или lowPrice) в разобранном JSON-LD любой вложенности"""
+    if isinstance(node, list):
+        for item in node:
+            p = _jsonld_offer_price(item)
+            if p is not None:
+                return p
+        return None
+    if not isinstance(node, dict):
+        return None
+
+    offers = node.get("offers")
+    for offer in (offers if isinstance(offers, list) else [offers]):
+        if isinstance(offer, dict):
+            for key in ("price", "lowPrice"):
+                value = offer.get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    return float(value)
+                if isinstance(value, str):
+                    p = parse_price_text(value)
+                    if p is not None:
+                        return p
+
+    for key in ("@graph", "mainEntity", "itemListElement"):
+        if key in node:
+            p = _jsonld_offer_price(node[key])
+            if p is not None:
+                return p
+    return None
+
+def _jsonld_price(html):
+    for m in JSONLD_RE.finditer(html):
+        try:
+            data = json.loads(m.group(1).strip())
+        except ValueError:
+            continue
+        p = _jsonld_offer_price(data)
+        if p is not None:
+            return p
+    return None
+
+FAST_STRATEGIES = (
+    ("meta property", lambda html: _meta_price(html, "property", "product:price:amount")),
+    ("itemprop", _itemprop_price),
+    ("json-ld", _jsonld_price),
+    ("meta name", lambda html: _meta_price(html, "name", "price")),
+)
+
+def _node_text(node):
+    return " ".join(t.strip() for t in node.xpath(".//text()").getall() if t.strip())
+
+def _lxml_itemprop(sel):
+    node = sel.xpath("//*[@itemprop='price'][1]")
+    if node:
+        return parse_price_text(node.attrib.get("content") or _node_text(node))
+    return None
+
+def _node_selector(node):
+    """Как найти этот узел в следующий раз: '.класс' с 'price' в имени или '#id'"""
+    for cls in (node.attrib.get("class") or "").split():
+        if "price" in cls.lower() and "'" not in cls:
+            return "." + cls
+    node_id = node.attrib.get("id") or ""
+    if "price" in node_id.lower() and "'" not in node_id:
+        return "#" + node_id
+    return None
+
+def _selector_xpath(selector):
+    if selector.startswith("#"):
+        return f"//*[self::span or self::div][@id='{selector[1:]}']"
+    return f"//*[self::span or self::div][contains(concat(' ', normalize-space(@class), ' '), ' {selector[1:]} ')]"
+
+def _lxml_nodes(sel, xpath):
+    for node in sel.xpath(xpath):
+        p = parse_price_text(_node_text(node))
+        if p is not None:
+            return p, _node_selector(node)
+    return None, None
+
+def _lxml_price(html):
+    """Второй уровень: дерево lxml (через parsel) — itemprop с вложенной разметкой, класс/id, текст"""
+    sel = Selector(text=html)
+
+    p = _lxml_itemprop(sel)
+    if p is not None:
+        return p, "itemprop", None
+
+    p, selector = _lxml_nodes(sel, PRICE_NODES_XPATH)
+    if p is not None:
+        return p, "class/id", selector
+
+    p = parse_price_text(_node_text(sel))
+    if p is not None:
+        return p, "fallback", None
+    return None, None, None
+
+def _hinted_price(html, hint):
+    """Пробуем только стратегию, которая сработала на этом домене в прошлый раз"""
+    strategy, selector = hint
+    fast = dict(FAST_STRATEGIES).get(strategy)
+    if fast is not None:
+        p = fast(html)
+        if p is not None or strategy != "itemprop":
+            return p
+    if Selector is None:
+        return None
+    if strategy == "itemprop":
+        return _lxml_itemprop(Selector(text=html))
+    if strategy == "class/id" and selector:
+        p, _ = _lxml_nodes(Selector(text=html), _selector_xpath(selector))
+        return p
+    return None
+
+def extract_price(html, hint=None):
+    """
+    Многоуровневое извлечение цены из сырого HTML. Возвращаем (цена, стратегия, селектор).
+    0. hint = (стратегия, селектор) — выученное правило домена: пробуем его первым;
+    1. регулярки без построения дерева: product:price:amount, itemprop=price,
+       JSON-LD offers.price, meta name=price — покрывает большинство магазинов;
+    2. lxml/parsel: itemprop со вложенной разметкой, span/div с 'price' в классе/id, весь текст;
+    3. BeautifulSoup (extract_price_from_html) — только если parsel недоступен или lxml упал.
+    """
+    if hint:
+        try:
+            p = _hinted_price(html, hint)
+        except Exception as e:
+            logger.warning("rule %s error: %s", hint, e)
+            p = None
+        if p is not None:
+            logger.debug("rule %s: %s", hint[0], p)
+            return p, hint[0], hint[1]
+
+    for name, strategy in FAST_STRATEGIES:
+        p = strategy(html)
+        if p is not None:
+            logger.debug("%s: %s", name, p)
+            return p, name, None
+
+    if Selector is not None:
+        try:
+            p, name, selector = _lxml_price(html)
+            if p is not None:
+                logger.debug("%s: %s", name, p)
+            else:
+                logger.debug("price not found")
+            return p, name, selector
+        except Exception as e:
+            logger.warning("lxml error, fallback to BeautifulSoup: %s", e)
+
+    p = extract_price_from_html(BeautifulSoup(html, "html.parser"))
+    return p, ("soup" if p is not None else None), None
+
+class FetchResult:
+    """
+    Результат загрузки одной страницы.
+    status:
+    - "downloaded"   — тело получено, ещё не разобрано (html заполнен);
+    - "ok"           — цена найдена;
+    - "not_modified" — сервер ответил 304 на условный запрос;
+    - "unchanged"    — тело совпало по хэшу с прошлой загрузкой;
+    - "error"        — ошибка сети/статуса или цена не найдена.
+    Для "not_modified"/"unchanged" price = None: цена осталась прежней, парсинг пропущен.
+    cut — тело прочитано не целиком: "early" (цена уже в <head>/JSON-LD) или "limit" (FETCH_MAX_BYTES).
+    """
+
+    def __init__(self, status="error", price=None, error=None, etag=None,
+                 last_modified=None, content_hash=None, html=None):
+        self.status = status
+        self.cut = None
+        self.strategy = None  # какой способ извлечения нашёл цену
+        self.selector = None
+        self.price = price
+        self.error = error
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.html = html
+
+    @property
+    def is_unchanged(self):
+        return self.status in ("not_modified", "unchanged")
+
+    def __repr__(self):
+        return f"<FetchResult {self.status} price={self.price} error={self.error}>"
+
+def content_hash(body):
+    """Короткий хэш тела ответа для сравнения между проверками"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+# граница <head> (или начало <body>, если </head> не закрыт), блоки JSON-LD, charset в <meta>
+HEAD_END_RE = re.compile(rb"</head\s*>|<body[\s>]", re.I)
+LDJSON_RE = re.compile(rb"application/ld\+json", re.I)
+SCRIPT_END_RE = re.compile(rb"</script\s*>", re.I)
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w:.-]+)""", re.I)
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+# стратегии, для которых хватает начала страницы: meta property идёт в extract_price первой,
+# а JSON-LD — структурированные данные самого товара
+EARLY_STRATEGIES = ("meta property", "json-ld")
+
+def detect_charset(declared, body):
+    """
+    Кодировка страницы без декодирования тела: BOM, charset из Content-Type,
+    <meta charset> / http-equiv в первых 4 КБ; иначе utf-8
+    """
+    for bom, name in BOMS:
+        if body.startswith(bom):
+            return name
+    m = META_CHARSET_RE.search(body, 0, 4096)
+    for name in (declared, m and m.group(1).decode("ascii", "ignore")):
+        if name:
+            try:
+                return codecs.lookup(name.strip()).name
+            except LookupError:
+                continue
+    return "utf-8"
+
+class _PriceRegion:
+    """
+    Ищем по мере чтения, где кончается участок с ценой: закрытый <head> с
+    product:price:amount или JSON-LD, либо блок JSON-LD с offers.price в теле.
+    Каждый участок декодируется и разбирается один раз.
+    """
+
+    def __init__(self, declared_charset):
+        self.declared = declared_charset
+        self.charset = None
+        self.head_end = None
+        self.pos = 0
+
+    def _text(self, buf, start, end):
+        if self.charset is None:
+            self.charset = detect_charset(self.declared, buf)
+        return bytes(buf[start:end]).decode(self.charset, "replace")
+
+    def end(self, buf):
+        """Позиция конца участка с ценой или None, если цена пока не видна"""
+        if self.head_end is None:
+            m = HEAD_END_RE.search(buf, max(0, self.pos - 16))
+            if m is None:
+                self.pos = len(buf)
+                return None
+            self.head_end = self.pos = m.end()
+            head = self._text(buf, 0, m.end())
+            for name, strategy in FAST_STRATEGIES:
+                if name in EARLY_STRATEGIES and strategy(head) is not None:
+                    return m.end()
+        while True:
+            m = LDJSON_RE.search(buf, self.pos)
+            if m is None:
+                self.pos = max(self.pos, len(buf) - 32)
+                return None
+            close = SCRIPT_END_RE.search(buf, m.end())
+            if close is None:
+                self.pos = m.start()
+                return None
+            start = max(buf.rfind(b"<", 0, m.start()), 0)
+            self.pos = close.end()
+            if _jsonld_price(self._text(buf, start, close.end())) is not None:
+                return close.end()
+
+def _read_body(resp, max_bytes, early_stop, drain_bytes, deadline):
+    """
+    Читаем тело потоком в один буфер. Возвращаем (буфер, где обрезано, пик буфера):
+    - больше max_bytes не читаем ("limit");
+    - early_stop: как только участок с ценой прочитан, буфер обрезается по его концу ("early");
+      остаток до drain_bytes дочитывается вхолостую, чтобы соединение HTTP/1.1 вернулось в пул
+      (в HTTP/2 закрывается только поток, дочитывать незачем).
+    """
+    buf = bytearray()
+    region = _PriceRegion(resp.charset_encoding) if early_stop else None
+    cut = None
+    peak = 0
+    chunks = resp.iter_bytes()
+    for chunk in chunks:
+        buf += chunk
+        peak = max(peak, len(buf))
+        if len(buf) > max_bytes:
+            del buf[max_bytes:]
+            cut = "limit"
+            break
+        if region is not None:
+            end = region.end(buf)
+            if end is not None:
+                del buf[end:]
+                cut = "early"
+                break
+        if time.monotonic() > deadline:
+            raise TimeoutError("body read timeout")
+    if cut == "early" and resp.http_version != "HTTP/2":
+        drained = 0
+        for chunk in chunks:
+            drained += len(chunk)
+            if drained > drain_bytes or time.monotonic() > deadline:
+                break
+    return buf, cut, peak
+
+def download_page(url, timeout=15, etag=None, last_modified=None, known_hash=None, early_stop=None):
+    """
+    Скачиваем страницу и возвращаем FetchResult.
+    Запрос идёт через общий пул соединений (keep-alive, HTTP/2 при поддержке сервером).
+    Если известны валидаторы прошлой загрузки — делаем условный GET
+    (If-None-Match / If-Modified-Since); при 304 или том же хэше тела HTML не возвращаем.
+    Перед запросом ждём токен домена (ratelimit), после — сообщаем лимитеру статус,
+    чтобы на 429/503 домен ушёл на паузу (с учётом Retry-After).
+    Тело читается потоком не дальше FETCH_MAX_BYTES; при early_stop (по умолчанию FETCH_EARLY_STOP)
+    чтение заканчивается на участке с ценой (см. _read_body), хэш считается по прочитанному.
+    Текст декодируется один раз и только если страница изменилась.
+    """
+    if early_stop is None:
+        early_stop = Config.FETCH_EARLY_STOP
+    limiter = get_limiter()
+    domain = urlsplit(url).hostname or ""
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=timeout)
+        limiter.acquire(domain)
+    except RateLimited as e:
+        logger.info("%s", e)
+        return FetchResult(error=f"rate limited: {e}")
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    try:
+        with get_pool().stream(url, timeout=timeout, headers=headers or None) as resp:
+            limiter.report(domain, resp.status_code, resp.headers.get("Retry-After"))
+            RESPONSES.inc(domain=domain_label(domain), status=resp.status_code)
+
+            if resp.status_code == 304 and headers:
+                return FetchResult(
+                    status="not_modified",
+                    etag=resp.headers.get("ETag") or etag,
+                    last_modified=resp.headers.get("Last-Modified") or last_modified,
+                    content_hash=known_hash,
+                )
+
+            if resp.status_code != 200:
+                logger.warning("status %s: %s", resp.status_code, url)
+                return FetchResult(error=f"status {resp.status_code}")
+
+            body, cut, peak = _read_body(resp, Config.FETCH_MAX_BYTES, early_stop, Config.FETCH_DRAIN_BYTES,
+                                         time.monotonic() + timeout)
+            declared = resp.charset_encoding
+            result_headers = resp.headers
     except Exception as e:
-        print(f"[fetch_price] request error: {e}")
-        return None, f"request error: {e}"
+        RESPONSES.inc(domain=domain_label(domain), status="error")
+        logger.warning("request error %s: %s", url, e)
+        return FetchResult(error=f"request error: {e}")
+
+    RESPONSE_BYTES.observe(len(body))
+    if cut:
+        BODY_CUTS.inc(reason=cut)
+        if cut == "limit":
+            logger.info("%s: тело больше %d байт, разбираем начало", url, Config.FETCH_MAX_BYTES)
 
-    if resp.status_code != 200:
-        print(f"[fetch_price] status code: {resp.status_code}")
-        return None, f"status {resp.status_code}"
+    digest = content_hash(body)
+    result = FetchResult(
+        status="unchanged" if known_hash and digest == known_hash else "downloaded",
+        etag=result_headers.get("ETag"),
+        last_modified=result_headers.get("Last-Modified"),
+        content_hash=digest,
+    )
+    result.cut = cut
+    if result.status == "downloaded":
+        result.html = body.decode(detect_charset(declared, body), "replace")
+        peak += sys.getsizeof(result.html)
+    FETCH_PEAK_BYTES.observe(peak)
+    return result
+
+def parse_price_html(html, hint=None):
+    """
+    Разбираем HTML и достаём цену: возвращаем (цена, стратегия, селектор, время разбора в сек).
+    Функция верхнего уровня и без состояния — её можно выполнять в пуле процессов
+    (время меряем здесь, а метрики пишет apply_parsed_price в основном процессе).
+    """
+    started = time.perf_counter()
+    return (*extract_price(html, hint=hint), time.perf_counter() - started)
 
-    soup = BeautifulSoup(resp.text, "html.parser")
-    price = extract_price_from_html(soup)
+def apply_parsed_price(result, parsed):
+    """Переводим загруженный FetchResult в итоговое состояние после парсинга"""
+    price, result.strategy, result.selector = parsed[:3]
+    if len(parsed) > 3:
+        FETCH_PHASE_SECONDS.observe(parsed[3], phase="parse")
+    EXTRACTIONS.inc(strategy=result.strategy or "none")
+    result.html = None
     if price is None:
-        return None, "price not found"
-    return price, None
+        result.status = "error"
+        result.error = "price not found" + (" (page truncated)" if result.cut == "limit" else "")
+    else:
+        result.status = "ok"
+        result.price = price
+    return result
+
+def fetch_page(url, timeout=15, etag=None, last_modified=None, known_hash=None, rules=None):
+    """
+    Синхронная загрузка + разбор одной страницы, возвращает FetchResult.
+    rules — кэш выученных правил (rules.RuleCache): подсказка для домена и учёт результата.
+    """
+    domain = urlsplit(url).hostname or ""
+    hint = rules.hint(domain) if rules is not None else None
+    result = download_page(url, timeout=timeout, etag=etag, last_modified=last_modified, known_hash=known_hash,
+                           early_stop=None if hint is None or hint[0] in EARLY_STRATEGIES else False)
+    if result.status != "downloaded":
+        return result
+    apply_parsed_price(result, parse_price_html(result.html, hint))
+    if rules is not None:
+        rules.record(domain, result.strategy, result.selector)
+    return result
+
+def fetch_price(url, timeout=15, rules=None):
+    """Получаем страницу и возвращаем цену"""
+    result = fetch_page(url, timeout=timeout, rules=rules)
+    return result.price, result.error
@@ -0,0 +1,230 @@
+# series.py
+# История цен ссылки как компактные колонки (время + цена) вместо объектов ORM:
+# - загрузка одним запросом через Core по отрезкам PriceHistory и бакетам PriceBucket;
+# - массивы NumPy, если он установлен, иначе array.array из стандартной библиотеки;
+# - сводки (min/max/среднее, изменение в %, минимум за N дней) — векторно по массивам;
+#   min/max берутся из min_price/max_price бакетов, а не из их средних;
+# - выдача в JSON или в бинарном виде (см. encode_binary), для API — с gzip.
+import array
+import bisect
+import gzip
+import json
+import struct
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, union_all
+
+from models import db, PriceHistory, PriceBucket
+
+# NumPy необязателен (без него те же массивы на array.array) и грузится при первом ряде,
+# а не при импорте модуля: веб-процессу он нужен только в API истории
+np = None
+_np_checked = False
+
+history_table = PriceHistory.__table__
+buckets_table = PriceBucket.__table__
+
+# dtype цены -> код для array.array / struct
+DTYPES = {"float64": "d", "float32": "f"}
+EPOCH = datetime(1970, 1, 1)
+
+BINARY_MAGIC = b"PWS1"
+
+
+class PriceSeries:
+    """
+    История одной ссылки в хронологическом порядке:
+    t — секунды Unix (int64), p — цены (float64 или float32).
+    Точка — начало отрезка одинаковой цены или бакета (для бакетов — средняя цена).
+    lo/hi — минимум и максимум цены в точке: у отрезка равны p, у бакета — min_price/max_price;
+    нужны только для сводок и в выдачу не попадают.
+    """
+
+    __slots__ = ("link_id", "t", "p", "lo", "hi")
+
+    def __init__(self, link_id, t, p, lo=None, hi=None):
+        self.link_id = link_id
+        self.t = t
+        self.p = p
+        self.lo = p if lo is None else lo
+        self.hi = p if hi is None else hi
+
+    def __len__(self):
+        return len(self.t)
+
+    def to_dict(self):
+        # tolist() есть и у ndarray, и у array.array
+        return {"link_id": self.link_id, "t": self.t.tolist(), "p": self.p.tolist()}
+
+
+def _numpy():
+    global np, _np_checked
+    if not _np_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _np_checked = True
+    return np
+
+
+def _to_epoch(ts):
+    return int((ts - EPOCH).total_seconds())
+
+
+def _make_arrays(times, prices, dtype, lows, highs):
+    if _numpy() is not None:
+        return (np.asarray(times, dtype=np.int64), np.asarray(prices, dtype=np.dtype(dtype)),
+                np.asarray(lows, dtype=np.float64), np.asarray(highs, dtype=np.float64))
+    return (array.array("q", times), array.array(DTYPES[dtype], prices),
+            array.array("d", lows), array.array("d", highs))
+
+
+def load_series(link_ids, since=None, dtype="float64"):
+    """
+    История ссылок одним запросом: {link_id: PriceSeries}.
+    since — только точки не раньше этого момента (datetime) или None — всё.
+    Последний отрезок или бакет, начавшийся до since, тоже попадает в ряд со временем since:
+    история хранится по изменениям, и без него цена, не менявшаяся дольше окна, дала бы пустой ряд.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"unsupported dtype: {dtype}")
+    link_ids = list(link_ids)
+    if not link_ids:
+        return {}
+
+    runs = (select(history_table.c.link_id, history_table.c.checked_at.label("ts"), history_table.c.price,
+                   history_table.c.price.label("lo"), history_table.c.price.label("hi"))
+            .where(history_table.c.link_id.in_(link_ids))
+            .where(history_table.c.price.isnot(None)))
+    buckets = (select(buckets_table.c.link_id, buckets_table.c.bucket_start.label("ts"),
+                      buckets_table.c.avg_price.label("price"),
+                      func.coalesce(buckets_table.c.min_price, buckets_table.c.avg_price).label("lo"),
+                      func.coalesce(buckets_table.c.max_price, buckets_table.c.avg_price).label("hi"))
+               .where(buckets_table.c.link_id.in_(link_ids))
+               .where(buckets_table.c.avg_price.isnot(None)))
+    parts = [runs, buckets]
+    if since is not None:
+        # по каждой ссылке — последняя точка до since (отрезок или бакет)
+        before = union_all(runs.where(history_table.c.checked_at < since),
+                           buckets.where(buckets_table.c.bucket_start < since)).subquery()
+        ranked = select(before, func.row_number().over(partition_by=before.c.link_id,
+                                                       order_by=before.c.ts.desc()).label("rn")).subquery()
+        parts = [select(ranked.c.link_id, ranked.c.ts, ranked.c.price, ranked.c.lo, ranked.c.hi)
+                 .where(ranked.c.rn == 1),
+                 runs.where(history_table.c.checked_at >= since),
+                 buckets.where(buckets_table.c.bucket_start >= since)]
+    points = union_all(*parts).subquery()
+
+    rows = db.session.execute(
+        select(points.c.link_id, points.c.ts, points.c.price, points.c.lo, points.c.hi)
+        .order_by(points.c.link_id, points.c.ts)
+    )
+
+    columns = {link_id: ([], [], [], []) for link_id in link_ids}
+    for link_id, ts, price, lo, hi in rows:
+        times, prices, lows, highs = columns[link_id]
+        if since is not None and ts < since:
+            # точка до окна (самая ранняя в ряду): в окне действовала только её цена, не min/max бакета
+            ts, lo, hi = since, price, price
+        times.append(_to_epoch(ts))
+        prices.append(price)
+        lows.append(lo)
+        highs.append(hi)
+    return {link_id: PriceSeries(link_id, *_make_arrays(times, prices, dtype, lows, highs))
+            for link_id, (times, prices, lows, highs) in columns.items()}
+
+
+def summarize(series, windows=(7, 30, 90), now=None):
+    """
+    Сводка по истории ссылки: min/max (с учётом min/max бакетов), mean (по точкам ряда),
+    первая и последняя цена, изменение в %, и для каждого окна N дней — минимум за окно
+    и «последняя цена — минимум за N дней».
+    """
+    out = {"link_id": series.link_id, "points": len(series)}
+    if not len(series):
+        return out
+    now_ts = _to_epoch(now or datetime.utcnow())
+
+    if _numpy() is not None:
+        t, p, lo = series.t, series.p.astype(np.float64), np.asarray(series.lo, dtype=np.float64)
+        first, last = float(p[0]), float(p[-1])
+        out.update(min=float(lo.min()), max=float(np.max(series.hi)), mean=float(p.mean()))
+        for days in windows:
+            # t отсортирован: начало окна — бинарным поиском; точка перед окном
+            # тоже в счёт — её цена действовала на момент начала окна (min бакета — нет)
+            start = int(np.searchsorted(t, now_ts - days * 86400))
+            window = lo[start:] if start == 0 else np.append(lo[start:], p[start - 1])
+            low = float(window.min()) if len(window) else None
+            out[f"min_{days}d"] = low
+            out[f"lowest_{days}d"] = low is not None and last <= low
+    else:
+        t, p, lo = series.t, series.p, series.lo
+        first, last = p[0], p[-1]
+        out.update(min=min(lo), max=max(series.hi), mean=sum(p) / len(p))
+        for days in windows:
+            start = bisect.bisect_left(t, now_ts - days * 86400)
+            window = list(lo[start:]) + ([p[start - 1]] if start else [])
+            low = min(window) if len(window) else None
+            out[f"min_{days}d"] = low
+            out[f"lowest_{days}d"] = low is not None and last <= low
+
+    out.update(first=first, last=last,
+               change_pct=round((last - first) / first * 100, 2) if first else None)
+    return out
+
+
+def encode_json(series_map, summaries=None):
+    """JSON: {"series": [{"link_id", "t": [...], "p": [...]}], "summary": [...]}"""
+    payload = {"series": [s.to_dict() for s in series_map.values()]}
+    if summaries is not None:
+        payload["summary"] = summaries
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def encode_binary(series_map, dtype="float64"):
+    """
+    Бинарный формат (little-endian):
+      b"PWS1", dtype (1 байт: b"d" или b"f"), число рядов uint32;
+      на ряд: link_id uint32, n uint32, t int64[n], p float64/float32[n].
+    """
+    code = DTYPES[dtype]
+    parts = [BINARY_MAGIC, code.encode(), struct.pack("<I", len(series_map))]
+    for s in series_map.values():
+        parts.append(struct.pack("<II", s.link_id, len(s)))
+        if _numpy() is not None:
+            parts.append(s.t.astype("<i8").tobytes())
+            parts.append(s.p.astype("<" + code).tobytes())
+        else:
+            parts.append(struct.pack(f"<{len(s)}q", *s.t))
+            parts.append(struct.pack(f"<{len(s)}{code}", *s.p))
+    return b"".join(parts)
+
+
+def decode_binary(data):
+    """Обратное к encode_binary: {link_id: (t, p)} в виде списков (для клиентов и проверок)"""
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError("not a price series payload")
+    code = data[4:5].decode()
+    size = struct.calcsize(code)
+    (count,), pos = struct.unpack_from("<I", data, 5), 9
+    out = {}
+    for _ in range(count):
+        link_id, n = struct.unpack_from("<II", data, pos)
+        pos += 8
+        t = list(struct.unpack_from(f"<{n}q", data, pos))
+        pos += 8 * n
+        p = list(struct.unpack_from(f"<{n}{code}", data, pos))
+        pos += size * n
+        out[link_id] = (t, p)
+    return out
+
+
+def compress(body, level=6):
+    return gzip.compress(body, compresslevel=level)
+
+
+def since_days(days):
+    """Параметр ?days=N -> datetime или None"""
+    return datetime.utcnow() - timedelta(days=days) if days else None
@@ -2,8 +2,8 @@
 // Минимальный vanilla JS для улучшения UX.
 // - на странице добавления продукта показывает только нужное число полей для ссылок,
 //   и добавляет кнопку "Добавить ещё" до лимита.
-// - на странице product_detail перехватывает "Обновить цены сейчас" и делает POST через fetch,
-//   показывает простое сообщение и перезагружает страницу после завершения.
+// - на странице product_detail перехватывает "Обновить цены сейчас": POST через fetch ставит
+//   проверку в очередь, затем скрипт опрашивает статус и показывает прогресс по ссылкам.
 
 // Ждём, когда DOM загрузится
 document.addEventListener("DOMContentLoaded", function() {
@@ -68,49 +68,104 @@ document.addEventListener("DOMContentLoaded", function() {
     }
   })();
 
-  // ---------- Логика для страницы "Детали продукта" (обновление через AJAX) ----------
+  // ---------- Логика для страницы "Детали продукта" (фоновое обновление + опрос статуса) ----------
   (function initProductDetail() {
     var form = document.getElementById("update-now-form");
     if (!form) return; // не на этой странице
 
     var btn = document.getElementById("update-now-btn");
     var status = document.getElementById("update-status");
+    var oldText = btn ? btn.innerText : "";
+
+    function setBusy(busy) {
+      if (!btn) return;
+      btn.disabled = busy;
+      btn.innerText = busy ? "Обновление..." : oldText;
+    }
+
+    // Обновляем строку таблицы ссылок по данным из статуса
+    function updateRow(item) {
+      var row = document.querySelector('tr[data-link-id="' + item.link_id + '"]');
+      if (!row) return;
+      var price = row.querySelector(".link-price");
+      var checked = row.querySelector(".link-checked");
+      if (item.status === "done" || item.status === "failed") {
+        if (price) price.innerText = item.last_price !== null ? item.last_price : "—";
+        if (checked && item.last_checked) checked.innerText = item.last_checked.replace("T", " ").slice(0, 16);
+      } else if (price) {
+        price.innerText = item.status === "leased" ? "проверяется…" : "в очереди…";
+      }
+    }
+
+    // Опрашиваем /jobs/<id> раз в секунду, пока все ссылки не проверены
+    function poll(jobId) {
+      var url = form.dataset.statusUrl.replace("__JOB__", encodeURIComponent(jobId));
+      setBusy(true);
+
+      function tick() {
+        fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+          .then(function(response) {
+            if (!response.ok) throw new Error("status " + response.status);
+            return response.json();
+          })
+          .then(function(data) {
+            data.links.forEach(updateRow);
+            status.innerText = "Проверено " + data.finished + " из " + data.total;
+            if (data.state === "done") {
+              status.innerText = "Готово — обновлено.";
+              // Перезагрузим страницу, чтобы показать свежую историю цен.
+              setTimeout(function() {
+                location.replace(location.pathname);
+              }, 700); // чуть задержим чтобы пользователь увидел сообщение
+            } else {
+              setTimeout(tick, 1000);
+            }
+          })
+          .catch(function(err) {
+            status.innerText = "Не удалось получить статус обновления.";
+            console.error(err);
+            setBusy(false);
+          });
+      }
+      tick();
+    }
 
     form.addEventListener("submit", function(ev) {
       ev.preventDefault(); // не даём форме сделать обычный POST и редирект — используем fetch
       if (!btn) return;
+      setBusy(true);
 
-      btn.disabled = true;
-      var oldText = btn.innerText;
-      btn.innerText = "Обновление...";
-
-      // Отправляем fetch к тому же URL, методом POST.
+      // Сервер ставит проверку в очередь и сразу отвечает job_id.
       // Передаём credentials: 'same-origin', чтобы cookie-сессия ушла на сервер.
       fetch(form.action, {
         method: 'POST',
         credentials: 'same-origin', // важно: передаём куки для сессии
         headers: {
-          'Accept': 'text/html'
+          'Accept': 'application/json'
         }
       }).then(function(response) {
-        if (response.ok) {
-          status.innerText = "Готово — обновлено.";
-          // Перезагрузим страницу, чтобы показать свежие цены.
-          setTimeout(function() {
-            location.reload();
-          }, 700); // чуть задержим чтобы пользователь увидел сообщение
-        } else {
-          status.innerText = "Ошибка при обновлении.";
-          btn.disabled = false;
-          btn.innerText = oldText;
+        if (!response.ok) throw new Error("status " + response.status);
+        return response.json();
+      }).then(function(data) {
+        if (!data.job_id) {
+          // проверять нечего (например, у продукта нет ссылок)
+          status.innerText = data.message || "Нечего обновлять.";
+          setBusy(false);
+          return;
         }
+        status.innerText = "Поставлено в очередь…";
+        poll(data.job_id);
       }).catch(function(err) {
-        status.innerText = "Сетевая ошибка.";
+        status.innerText = "Ошибка при обновлении.";
         console.error(err);
-        btn.disabled = false;
-        btn.innerText = oldText;
+        setBusy(false);
       });
     });
+
+    // После добавления продукта сервер перенаправляет сюда с ?job=<id> — сразу показываем прогресс
+    if (form.dataset.jobId) {
+      poll(form.dataset.jobId);
+    }
   })();
 
 }); // DOMContentLoaded end
@@ -0,0 +1,98 @@
+# tasks.py
+# Проверка ссылок «по требованию» (кнопка «Обновить сейчас», добавление продукта)
+# без блокировки веб-запроса: ссылки ставятся в очередь заданий одной пачкой
+# с batch_id, а страница опрашивает статус пачки по /jobs/<batch_id>.
+# - SCHEDULER_MODE=embedded — пачку тут же забирает фоновый поток этого процесса;
+# - SCHEDULER_MODE=queue/off — пачку забирают воркеры (worker.py), ручные пачки идут первыми.
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models import db, ProductLink
+from jobqueue import get_queue
+from persistence import invalidate_pages
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(config):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.get("ONDEMAND_WORKERS", 4),
+                                           thread_name_prefix="ondemand")
+        return _executor
+
+
+def run_batch(app, batch_id):
+    """Забираем и проверяем все задания пачки (ссылки одной пачки качаются параллельно)"""
+    from scheduler import check_links
+
+    config = app.config
+    with app.app_context():
+        queue = get_queue(config)
+        jobs = queue.claim(f"web-{batch_id[:8]}", limit=1000,
+                           lease_seconds=config.get("JOB_LEASE_SECONDS", 300), batch_id=batch_id)
+        if not jobs:
+            return
+        job_ids = [job_id for job_id, _ in jobs]
+        try:
+            links = ProductLink.query.filter(ProductLink.id.in_([link_id for _, link_id in jobs])).all()
+            _, scheduled, _ = check_links(config, links, config.get("PRICE_UPDATE_INTERVAL", 600))
+            queue.complete(job_ids)
+            # пользователь ждёт свежие «Проверено»/историю, даже если цена не изменилась
+            # (в том числе у чужих ссылок на те же страницы — они проверены вместе с пачкой)
+            invalidate_pages(set(scheduled) | {ln.id for ln in links})
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("ошибка пачки %s: %s", batch_id, e)
+            queue.release(job_ids, error=str(e))
+        finally:
+            queue.cleanup(keep_seconds=config.get("JOB_RETENTION", 3600))
+
+
+def submit_links(app, link_ids):
+    """
+    Ставим ссылки на проверку и сразу возвращаем batch_id для опроса статуса.
+    Ссылки, которые уже в очереди или проверяются, входят в пачку своими заданиями (см. enqueue).
+    """
+    batch_id = uuid.uuid4().hex
+    get_queue(app.config).enqueue(link_ids, batch_id=batch_id)
+    if app.config.get("SCHEDULER_MODE", "embedded") == "embedded":
+        _get_executor(app.config).submit(run_batch, app, batch_id)
+    return batch_id
+
+
+def batch_status(config, batch_id):
+    """
+    Состояние пачки для страницы: общий прогресс и по каждой ссылке
+    (статус задания, текущая цена, время проверки). None — пачка не найдена.
+    """
+    jobs = get_queue(config).batch_status(batch_id)
+    if not jobs:
+        return None
+    links = {ln.id: ln for ln in ProductLink.query.filter(ProductLink.id.in_([j["link_id"] for j in jobs]))}
+    finished = sum(1 for j in jobs if j["status"] in ("done", "failed"))
+    items = []
+    for j in jobs:
+        ln = links.get(j["link_id"])
+        items.append({
+            "link_id": j["link_id"],
+            "product_id": ln.product_id if ln else None,
+            "url": ln.url if ln else None,
+            "status": j["status"],
+            "error": j["error"],
+            "last_price": ln.last_price if ln else None,
+            "last_checked": ln.last_checked.isoformat() if ln and ln.last_checked else None,
+        })
+    return {
+        "job_id": batch_id,
+        "state": "done" if finished == len(jobs) else "running",
+        "total": len(jobs),
+        "finished": finished,
+        "links": items,
+    }
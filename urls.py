@@ -0,0 +1,60 @@
+# urls.py
+# Канонический адрес страницы товара: одна и та же карточка, добавленная разными
+# пользователями с разными метками трекинга, должна скачиваться за проход один раз.
+# canonical_url:
+# - схема и хост в нижнем регистре, порт по умолчанию и фрагмент (#...) убираются;
+# - параметры трекинга (utm_*, gclid, fbclid, yclid, ...) и URL_STRIP_PARAMS вырезаются;
+# - оставшиеся параметры сортируются — порядок в адресе на страницу не влияет.
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config import Config
+
+# параметры рекламных и аналитических систем — на содержимое страницы не влияют
+TRACKING_PARAMS = frozenset((
+    "gclid", "gclsrc", "dclid", "gbraid", "wbraid", "fbclid", "yclid", "ysclid", "msclkid", "ttclid",
+    "twclid", "igshid", "mc_cid", "mc_eid", "_openstat", "openstat", "_ga", "_gl", "srsltid",
+    "from_block", "utm",
+))
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _strip_rules(extra):
+    names, prefixes = set(TRACKING_PARAMS), list(TRACKING_PREFIXES)
+    for item in extra:
+        item = item.strip().lower()
+        if item.endswith("*"):
+            prefixes.append(item[:-1])
+        elif item:
+            names.add(item)
+    return frozenset(names), tuple(p for p in prefixes if p)
+
+
+_STRIP = _strip_rules(Config.URL_STRIP_PARAMS.split(","))
+
+
+def canonical_url(url):
+    """Канонический адрес для сравнения и загрузки; нераспознанный адрес возвращаем как есть"""
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.hostname:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname.lower().rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    if parts.username or parts.password:
+        host = parts.netloc.rsplit("@", 1)[0] + "@" + host
+
+    names, prefixes = _STRIP
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in names and not k.lower().startswith(prefixes)]
+    query.sort()
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query, doseq=True), ""))
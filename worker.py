@@ -0,0 +1,158 @@
+# worker.py
+# Отдельный процесс-скрейпер для распределённого режима (SCHEDULER_MODE=queue или off).
+# Забирает задания из очереди (jobqueue.py) с арендой, проверяет ссылки и отмечает задания.
+# Воркеров может быть сколько угодно и на разных машинах — лишь бы база была общей.
+#
+#   python worker.py                   # только проверяет задания
+#   python worker.py --enqueue         # и сам ставит в очередь ссылки с наступившим сроком
+#                                      # (и уплотняет историю цен, как планировщик веб-процесса)
+#   python worker.py --once            # один проход и выход (для cron/отладки)
+#   python worker.py --init-db         # подготовить базу (как flask --app app init-db) и выйти
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flask import Flask
+
+from config import Config
+from logs import setup_logging
+from models import db, ProductLink, init_db
+
+logger = logging.getLogger("worker")
+
+
+def create_worker_app():
+    """Минимальное приложение для воркера: только конфиг и база, без веба и планировщика"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    return app
+
+
+_last_compaction = None
+
+
+def _maybe_compact(config, worker_id):
+    """Уплотнение истории не чаще раза в HISTORY_COMPACT_INTERVAL секунд"""
+    global _last_compaction
+    from history import compact_history
+
+    now = time.monotonic()
+    if _last_compaction is not None and now - _last_compaction < config.get("HISTORY_COMPACT_INTERVAL", 3600):
+        return
+    _last_compaction = now
+    try:
+        stats = compact_history(config)
+        if any(stats.values()):
+            logger.info("[%s] уплотнение истории: %s", worker_id, stats)
+    except Exception as e:
+        db.session.rollback()
+        logger.error("[%s] ошибка уплотнения истории: %s", worker_id, e)
+
+
+def run_once(app, worker_id, batch, lease_seconds, enqueue=False):
+    """Один цикл воркера. Возвращаем число обработанных заданий"""
+    from jobqueue import get_queue, enqueue_due_links
+    from scheduler import check_links
+    from metrics import observe_sweep
+    from persistence import invalidate_pages
+
+    config = app.config
+    with app.app_context():
+        queue = get_queue(config)
+        if enqueue:
+            enqueue_due_links(queue, limit=config.get("DISPATCH_BATCH", 200))
+            queue.cleanup(keep_seconds=config.get("JOB_RETENTION", 3600))
+            _maybe_compact(config, worker_id)
+
+        jobs = queue.claim(worker_id, limit=batch, lease_seconds=lease_seconds)
+        if not jobs:
+            return 0
+
+        job_ids = [job_id for job_id, _ in jobs]
+        started = time.monotonic()
+        try:
+            links = ProductLink.query.filter(ProductLink.id.in_([link_id for _, link_id in jobs])).all()
+            unchanged, scheduled, pages = check_links(config, links, config.get("PRICE_UPDATE_INTERVAL", 600),
+                                                      track_lag=True)
+            queue.complete(job_ids)
+            # как в tasks.run_batch: после «done» страница перезагружается и должна показать
+            # свежие «Проверено»/цены, даже если цена не изменилась (кэш страниц общий, PAGE_CACHE_URL)
+            invalidate_pages(set(scheduled) | {ln.id for ln in links})
+            checked = len(scheduled) or len(links)
+            observe_sweep("worker", time.monotonic() - started, checked, pages=pages)
+            logger.info("[%s] проверено %d ссылок на %d страницах (без изменений: %d)",
+                        worker_id, checked, pages, unchanged)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("[%s] ошибка пачки: %s", worker_id, e)
+            queue.release(job_ids, error=str(e))
+        return len(jobs)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics — метрики этого воркера в формате Prometheus"""
+
+    def do_GET(self):
+        from metrics import render
+
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port):
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="PriceWatcher scraping worker")
+    ap.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}", help="имя воркера (для аренды)")
+    ap.add_argument("--batch", type=int, default=Config.WORKER_BATCH, help="заданий за один захват")
+    ap.add_argument("--lease", type=int, default=Config.JOB_LEASE_SECONDS, help="аренда задания, сек")
+    ap.add_argument("--poll", type=float, default=Config.DISPATCH_TICK, help="пауза при пустой очереди, сек")
+    ap.add_argument("--enqueue", action="store_true", help="также ставить в очередь ссылки с наступившим сроком")
+    ap.add_argument("--once", action="store_true", help="один проход и выход")
+    ap.add_argument("--metrics-port", type=int, default=0, help="отдавать /metrics на этом порту (0 — нет)")
+    ap.add_argument("--init-db", action="store_true", help="создать таблицы, колонки, индексы и выйти")
+    args = ap.parse_args()
+
+    setup_logging(Config.LOG_LEVEL, Config.LOG_RATE_BURST, Config.LOG_RATE_WINDOW)
+    app = create_worker_app()
+    if args.init_db:
+        with app.app_context():
+            init_db()
+        logger.info("база готова")
+        return
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    logger.info("[%s] запущен: пачка %d, аренда %d с", args.id, args.batch, args.lease)
+    while True:
+        try:
+            done = run_once(app, args.id, args.batch, args.lease, enqueue=args.enqueue)
+        except Exception as e:
+            logger.exception("[%s] %s", args.id, e)
+            done = 0
+        if args.once:
+            break
+        if not done:
+            time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()